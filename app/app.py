@@ -30,6 +30,15 @@ def create_app():
     from . import routes
     app.register_blueprint(routes.bp) # Assuming routes are in a Blueprint named 'bp'
 
+    # Build the LLM client, graph, schema index and DB pool in the background instead of on the first request
+    if os.environ.get('ASSISTANT_WARMUP', 'true').lower() == 'true':
+        from .assistant_engine import warm_up
+        warm_up(background=True)
+
+    # Re-runs the stored SQL of saved insights on their schedule (INSIGHT_REFRESH_ENABLED)
+    from .insight_refresh import start_insight_refresher
+    start_insight_refresher()
+
     # A simple test route
     @app.route('/hello')
     def hello():
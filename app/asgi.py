@@ -0,0 +1,76 @@
+# app/asgi.py
+"""
+ASGI entry point. POST /chat is served natively on the event loop through async_engine;
+every other route (pages, /chat/stream, /api/*) is delegated to the Flask app from create_app().
+
+Run with, for example:
+    uvicorn app.asgi:application --host 0.0.0.0 --port 5000
+"""
+import json
+import asyncio
+
+from asgiref.wsgi import WsgiToAsgi
+
+from .app import create_app
+from .async_engine import aget_assistant_response
+from .wire_format import wants_columnar, encode_response
+
+flask_app = create_app()
+_flask_asgi = WsgiToAsgi(flask_app)
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect": return None
+        body += message.get("body", b"")
+        if not message.get("more_body"): return body
+
+async def _wait_for_disconnect(receive):
+    while True:
+        if (await receive())["type"] == "http.disconnect": return
+
+async def _send_json(send, status, payload):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def _send_columnar(send, payload, accept_encoding):
+    body, headers = encode_response(payload, accept_encoding)
+    raw_headers = [(k.lower().encode(), v.encode()) for k, v in headers.items()] + [(b"content-length", str(len(body)).encode())]
+    await send({"type": "http.response.start", "status": 200, "headers": raw_headers})
+    await send({"type": "http.response.body", "body": body})
+
+async def _chat(scope, receive, send):
+    body = await _read_body(receive)
+    if body is None: return # Client went away before sending the request
+    try: payload = json.loads(body or b"{}")
+    except ValueError: return await _send_json(send, 400, {"error": "Invalid JSON body"})
+    user_query = payload.get('query')
+    if not user_query: return await _send_json(send, 400, {"error": "No query provided"})
+    work = asyncio.ensure_future(aget_assistant_response(user_query, conversation_history_raw=payload.get('conversation_history', []), conversation_id=payload.get('conversation_id')))
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    await asyncio.wait({work, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+    if not work.done(): # Client went away while the answer was being computed: stop its SQL statement
+        print("Client disconnected; cancelling the /chat request.")
+        work.cancel(); return
+    disconnected.cancel()
+    response_data = work.result()
+    headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    if wants_columnar(headers.get("accept")): return await _send_columnar(send, response_data, headers.get("accept-encoding"))
+    await _send_json(send, 200, response_data)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup": await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"}); return
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan": return await _lifespan(receive, send)
+    if scope["type"] == "http" and scope["path"] == "/chat" and scope["method"] == "POST":
+        return await _chat(scope, receive, send)
+    await _flask_asgi(scope, receive, send)
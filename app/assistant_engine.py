@@ -4,10 +4,13 @@ import json
 import sys
 from typing import TypedDict, List, Optional, Dict, Any
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage 
-from langchain_openai import ChatOpenAI
-from langgraph.graph import StateGraph, END
-import pyodbc 
+from langchain_core.runnables import RunnableConfig
+# langchain_openai, langgraph and pyodbc are imported on first use (see the accessors below) to keep worker import time low
 import re
+import queue
+import threading
+import time
+from contextlib import nullcontext
 from datetime import datetime, date # Ensure date is imported
 
 # --- Conditional Import for schema_index ---
@@ -15,10 +18,10 @@ if __name__ == "__main__" and __package__ is None:
     current_script_path = os.path.abspath(__file__)
     project_root = os.path.dirname(os.path.dirname(current_script_path))
     if project_root not in sys.path: sys.path.insert(0, project_root)
-    from app.schema_index import query_schema, SCHEMA_COLLECTION_NAME
+    from app.schema_index import query_schema, retrieve_schema_parts, describe_joins, get_retrieval_stats, get_schema_fingerprint, warm_up_schema_index, load_compiled_schema_or_none, SCHEMA_COLLECTION_NAME
     import chromadb 
 else:
-    from .schema_index import query_schema, SCHEMA_COLLECTION_NAME
+    from .schema_index import query_schema, retrieve_schema_parts, describe_joins, get_retrieval_stats, get_schema_fingerprint, warm_up_schema_index, load_compiled_schema_or_none, SCHEMA_COLLECTION_NAME
 
 # --- Environment Setup ---
 from dotenv import load_dotenv
@@ -34,8 +37,88 @@ if all([DB_DRIVER, DB_SERVER, DB_NAME]):
     else: conn_str_parts.append("Trusted_Connection=yes")
     db_connection_string = ";".join(conn_str_parts)
 else: print("Warning: DB connection details not fully configured.")
-llm = ChatOpenAI(model="gpt-4", temperature=0, openai_api_key=OPENAI_API_KEY) if OPENAI_API_KEY else None
-if not llm: print("Warning: LLM not initialized.")
+# Imported after load_dotenv so the DB_POOL_* / DB_QUERY_TIMEOUT settings from .env are visible
+if __name__ == "__main__" and __package__ is None:
+    from app.db_pool import ConnectionPool
+    from app.sql_cache import SQLCache, make_sql_cache_key, normalize_question, hash_history, SQL_CACHE_ENABLED
+    from app.prompt_builder import fit_schema_parts, build_history_context, count_tokens, record_prompt, get_prompt_stats
+    from app.columnar import ResultColumns, ResultSet, TableData, estimate_row_bytes, is_date_like
+    from app.chart_downsample import downsample_series, top_n_categories, sample_points, describe_reduction, get_downsample_stats, CHART_MAX_CATEGORIES, CHART_MAX_PIE_SLICES
+    from app.sql_preflight import preflight_sql, record_retry, get_preflight_stats, warm_up_preflight, SQL_PREFLIGHT_MAX_RETRIES
+    from app.query_guard import QueryCancellation, QueryCancelled, guarded_statement, check_query_cost, get_query_guard_stats
+    from app.db_pool import DB_QUERY_TIMEOUT
+    from app.response_cache import ResponseCache, RESPONSE_CACHE_ENABLED
+    from app.result_cache import ResultCache, result_cache_key, RESULT_CACHE_ENABLED
+    from app.sql_examples import match_question, format_few_shot, remember_example, record_llm_latency, get_example_stats, get_examples_collection, SQL_EXAMPLES_ENABLED
+    from app.result_buffer import ResultBuffer, is_presentation_only, RESULT_BUFFER_ENABLED
+    from app.session_store import get_session_store
+    from app.insights_store import get_insights_store
+else:
+    from .db_pool import ConnectionPool
+    from .sql_cache import SQLCache, make_sql_cache_key, normalize_question, hash_history, SQL_CACHE_ENABLED
+    from .prompt_builder import fit_schema_parts, build_history_context, count_tokens, record_prompt, get_prompt_stats
+    from .columnar import ResultColumns, ResultSet, TableData, estimate_row_bytes, is_date_like
+    from .chart_downsample import downsample_series, top_n_categories, sample_points, describe_reduction, get_downsample_stats, CHART_MAX_CATEGORIES, CHART_MAX_PIE_SLICES
+    from .sql_preflight import preflight_sql, record_retry, get_preflight_stats, warm_up_preflight, SQL_PREFLIGHT_MAX_RETRIES
+    from .query_guard import QueryCancellation, QueryCancelled, guarded_statement, check_query_cost, get_query_guard_stats
+    from .db_pool import DB_QUERY_TIMEOUT
+    from .response_cache import ResponseCache, RESPONSE_CACHE_ENABLED
+    from .result_cache import ResultCache, result_cache_key, RESULT_CACHE_ENABLED
+    from .sql_examples import match_question, format_few_shot, remember_example, record_llm_latency, get_example_stats, get_examples_collection, SQL_EXAMPLES_ENABLED
+    from .result_buffer import ResultBuffer, is_presentation_only, RESULT_BUFFER_ENABLED
+    from .session_store import get_session_store
+    from .insights_store import get_insights_store
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
+result_cache = ResultCache() if RESULT_CACHE_ENABLED else None # SQL results by canonical SQL, see result_cache.py
+result_buffer = ResultBuffer() if RESULT_BUFFER_ENABLED else None # Last result per conversation, for presentation-only follow-ups
+STREAM_ROW_CHUNK_SIZE = int(os.environ.get("STREAM_ROW_CHUNK_SIZE", 500)) # Rows per fetchmany() / SSE 'rows' event
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get("STREAM_HEARTBEAT_SECONDS", 10)) # SSE keep-alive while a node is running
+SQL_MAX_ROWS = int(os.environ.get("SQL_MAX_ROWS", 200000)) # Hard cap on rows fetched per query
+SQL_MAX_RESULT_BYTES = int(float(os.environ.get("SQL_MAX_RESULT_MB", 256)) * 1024 * 1024) # Hard cap on the (estimated) in-memory size of a result
+if not OPENAI_API_KEY: print("Warning: LLM not initialized.")
+
+# --- Lazily initialized resources ---
+# Created on first use instead of at import, so importing app.routes in a gunicorn worker stays cheap.
+# warm_up() can build them ahead of the first request on a background thread.
+_lazy_init_lock = threading.RLock()
+_llm = None
+_db_pool = None
+_sql_cache = None
+_app_graph = None
+
+def get_llm():
+    global _llm
+    if _llm is None and OPENAI_API_KEY:
+        with _lazy_init_lock:
+            if _llm is None:
+                from langchain_openai import ChatOpenAI
+                _llm = ChatOpenAI(model="gpt-4", temperature=0, openai_api_key=OPENAI_API_KEY)
+    return _llm
+
+def _connect_to_database():
+    import pyodbc
+    return pyodbc.connect(db_connection_string)
+
+def get_db_pool():
+    global _db_pool
+    if _db_pool is None and db_connection_string:
+        with _lazy_init_lock:
+            if _db_pool is None: _db_pool = ConnectionPool(_connect_to_database)
+    return _db_pool
+
+def get_sql_cache():
+    global _sql_cache
+    if _sql_cache is None and SQL_CACHE_ENABLED:
+        with _lazy_init_lock:
+            if _sql_cache is None: _sql_cache = SQLCache(fingerprint_fn=get_schema_fingerprint)
+    return _sql_cache
+
+def get_app_graph():
+    global _app_graph
+    if _app_graph is None:
+        with _lazy_init_lock:
+            if _app_graph is None: _app_graph = build_assistant_graph()
+    return _app_graph
 
 # --- GraphState definition ---
 class GraphState(TypedDict):
@@ -44,59 +127,32 @@ class GraphState(TypedDict):
     requested_chart_type: Optional[str] 
     retrieved_schema_parts: Optional[List[str]]
     generated_sql: Optional[str]
-    sql_query_result: Optional[List[Dict[str, Any]]]
+    sql_query_result: Optional[ResultSet] # Shared header + row tuples; .truncated when a fetch cap was hit
     analysis_summary: Optional[str] 
     chart_json: Optional[Dict[str, Any]] 
     table_data: Optional[Dict[str, Any]] 
     error_message: Optional[str] 
     follow_up_context: Optional[List[BaseMessage]]
+    history_summary: Optional[str] # Summary of the turns before follow_up_context (server-side sessions, see session_store.py)
+    prompt_tokens: Optional[Dict[str, int]] # Token counts of the SQL generation prompt (see prompt_builder.py)
+    sql_cache_key: Optional[str] # Set when generated_sql came from the LLM; sql_preflight caches it once it passes
+    preflight_error: Optional[str] # Why sql_preflight rejected generated_sql; fed back to sql_generator on a retry
+    preflight_attempts: int
+    sql_source: Optional[str] # Where generated_sql came from: "sql_cache", "example" (reused, see sql_examples.py) or "llm"
+    example_sql: Optional[str] # Passing SQL of a standalone question, recorded as an example once it returns rows
+    conversation_id: Optional[str] # Client-chosen id of the conversation, keys the result buffer
+    presentation_only: bool # Set by intent_detection when the follow-up is re-drawn from the buffered result
+    result_columns: Optional[ResultColumns] # Buffered columns of sql_query_result (types and conversions already computed)
 
 # --- Helper Functions for Analyzer ---
 def is_numeric(value):
     if value is None: return False
     return isinstance(value, (int, float))
 
-def is_date_like(column_name_or_value):
-    if isinstance(column_name_or_value, str):
-        name = column_name_or_value.lower()
-        if any(term in name for term in ["date", "year", "month", "time", "dt", "period"]): return True
-        if re.match(r"^\d{4}(-\d{2}(-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?Z?)?)?)?)?$", column_name_or_value): return True
-    elif isinstance(column_name_or_value, (datetime, date)):
-        return True
-    return False
-
-def get_column_types(query_result: List[Dict[str, Any]], headers: List[str]):
-    col_types = {}
-    if not query_result: return col_types
-    sample_row = query_result[0] 
-    for header in headers:
-        value = sample_row.get(header)
-        is_strictly_numeric_col = True
-        for row in query_result:
-            val_in_col = row.get(header)
-            if val_in_col is not None and not is_numeric(val_in_col):
-                is_strictly_numeric_col = False; break
-        is_date_col_by_name = is_date_like(header)
-        # Check if first value looks like a date, and if so, check a few more for consistency
-        is_date_col_by_value = False
-        if not is_date_col_by_name and isinstance(value, str) and is_date_like(value):
-            # Check a sample of rows to confirm date-like nature if name doesn't indicate it
-            date_like_count = 0
-            for i, row_check in enumerate(query_result):
-                if i >= 5: break # Check up to 5 rows
-                if is_date_like(str(row_check.get(header,""))): date_like_count +=1
-            if date_like_count >= min(3, len(query_result)): # If at least 3 or all (if less than 3) are date-like
-                 is_date_col_by_value = True
-        
-        is_year_col_by_name = "year" in header.lower() and is_strictly_numeric_col and \
-                              all(1900 < int(row.get(header) or 0) < 2100 for row in query_result if row.get(header) is not None and isinstance(row.get(header), (int, float)))
-
-
-        if is_year_col_by_name: col_types[header] = "categorical_year" # Treat year as categorical for grouping
-        elif is_strictly_numeric_col: col_types[header] = "numeric"
-        elif is_date_col_by_name or is_date_col_by_value : col_types[header] = "date_like"
-        else: col_types[header] = "categorical"
-    return col_types
+def get_column_types(query_result, headers: List[str]):
+    """Column types of a ResultSet or a list of row dicts (see ResultColumns.column_types in columnar.py)."""
+    col_types = ResultColumns.from_result(query_result).column_types() if query_result else {}
+    return {h: col_types[h] for h in headers if h in col_types}
 
 # --- Node Implementations ---
 def intent_detection_node(state: GraphState) -> GraphState:
@@ -114,25 +170,37 @@ def intent_detection_node(state: GraphState) -> GraphState:
     # ... (other chart types)
     state["requested_chart_type"] = requested_type
     print(f"Cleaned Query: {state['cleaned_query']}, Requested Chart Type: {requested_type}")
+    buffered = result_buffer.get(state["conversation_id"]) if result_buffer and state.get("conversation_id") and requested_type and is_presentation_only(query_lower) else None
+    state["presentation_only"] = buffered is not None
+    if buffered is not None: # "show that as a pie chart": redraw the last result, no retrieval / LLM / database
+        print(f"Presentation-only follow-up; re-using the last result of the conversation ({len(buffered.result)} rows).")
+        state["sql_query_result"] = buffered.result; state["result_columns"] = buffered.columns; state["generated_sql"] = buffered.sql
+        state["error_message"] = None
     return state
 
-def schema_retriever_node(state: GraphState) -> GraphState:
-    # (No changes from previous version: assistant_engine_py_v12_final_refinements)
+def _route_after_intent(state: GraphState) -> str:
+    return "analyzer_visualizer" if state.get("presentation_only") else "schema_retriever"
+
+def schema_retriever_node(state: GraphState, config: RunnableConfig = None) -> GraphState:
+    # config["configurable"]["schema_parts"], if set, maps questions to parts already retrieved in one batch (see batch_jobs.py)
     print("--- Running Schema Retriever Node ---")
     query = state.get("cleaned_query")
     if not query: state["error_message"] = "No query to schema retriever."; state["retrieved_schema_parts"] = []; return state
     retrieved_parts = []
     try:
-        print(f"Querying ChromaDB for: '{query}'")
-        schema_results = query_schema(query_texts=[query], n_results=12, collection_name=SCHEMA_COLLECTION_NAME) 
-        if schema_results and schema_results.get("documents"):
-            for doc_list in schema_results["documents"]: retrieved_parts.extend(doc_list) 
+        prefetched = (((config or {}).get("configurable") or {}).get("schema_parts") or {}).get(query)
+        if prefetched is not None: print(f"Using batch-retrieved schema for: '{query}'"); retrieved_parts.extend(prefetched)
+        else:
+            print(f"Retrieving schema (lexical + vector) for: '{query}'")
+            retrieved_parts.extend(retrieve_schema_parts(query, n_results=12, collection_name=SCHEMA_COLLECTION_NAME))
         if not retrieved_parts:
             print(f"No specific schema parts found. Trying generic query.")
             generic_schema_info = query_schema(query_texts=["overview of all tables and their primary purpose"], n_results=7, collection_name=SCHEMA_COLLECTION_NAME)
             if generic_schema_info and generic_schema_info.get("documents"):
                  for doc_list in generic_schema_info["documents"]: retrieved_parts.extend(doc_list)
-        state["retrieved_schema_parts"] = list(set(retrieved_parts))
+        state["retrieved_schema_parts"] = list(dict.fromkeys(retrieved_parts)) # Unique, best match first (prompt_builder trims from the end)
+        join_context = describe_joins(state["retrieved_schema_parts"])
+        if join_context: state["retrieved_schema_parts"].append(join_context)
         print(f"Retrieved {len(state['retrieved_schema_parts'])} unique schema parts:")
         if state["retrieved_schema_parts"]:
             for i, part in enumerate(state["retrieved_schema_parts"]): print(f"  Part {i+1}: {part[:150]}...")
@@ -141,18 +209,45 @@ def schema_retriever_node(state: GraphState) -> GraphState:
         state["error_message"] = f"Error in schema_retriever_node: {str(e)}"; state["retrieved_schema_parts"] = []
     return state
 
-def sql_generator_node(state: GraphState) -> GraphState:
-    # (No changes from previous version: assistant_engine_py_v12_final_refinements)
+def _preflight_feedback(rejected_sql: Optional[str], preflight_error: str) -> str:
+    return f"""Your previous query for this question was rejected before execution:
+{rejected_sql}
+Problem: {preflight_error}
+Fix this problem (use only tables and columns from the schema context) and output the corrected query.
+------------------------
+"""
+
+def _prepare_sql_generation(state: GraphState):
+    """
+    Builds the SQL generation prompt. Returns (langchain_messages, cache_key) when an LLM call is needed,
+    or None when the state is already final (missing input, no LLM, or SQL cache hit).
+    Shared by the sync node below and the asyncio path in async_engine.py.
+    """
     print("--- Running SQL Generator Node ---")
     user_query = state.get("cleaned_query"); schema_parts = state.get("retrieved_schema_parts"); conversation_history = state.get("follow_up_context", []) 
-    if not user_query: state["error_message"] = "User query missing."; state["generated_sql"] = None; return state
-    if not llm: state["error_message"] = "LLM not available."; state["generated_sql"] = None; return state
-    schema_context_for_prompt = "\n".join(schema_parts) if schema_parts else "No specific schema context. Infer table/column names (e.g., OTM.SHIPMENT). If unsure, output 'NO_QUERY'."
-    history_for_prompt = ""
-    if conversation_history:
-        history_for_prompt = "Previous Conversation Turn(s):\n"; 
-        for msg in conversation_history: history_for_prompt += f"{'User' if isinstance(msg, HumanMessage) else 'Assistant'}: {msg.content}\n"
-        history_for_prompt += "------------------------\n"
+    history_summary = state.get("history_summary")
+    if not user_query: state["error_message"] = "User query missing."; state["generated_sql"] = None; return None
+    sql_cache = get_sql_cache()
+    cache_key = make_sql_cache_key(user_query, schema_parts, conversation_history + ([{"role": "summary", "content": history_summary}] if history_summary else [])) if sql_cache else None
+    preflight_error = state.get("preflight_error")
+    if cache_key and not preflight_error: # A retry after a pre-flight rejection always goes to the LLM
+        cached_sql = sql_cache.get(cache_key)
+        if cached_sql:
+            print(f"SQL cache hit. Skipping LLM call. Generated SQL: {cached_sql}")
+            state["generated_sql"] = cached_sql; state["error_message"] = None; state["sql_source"] = "sql_cache"
+            return None
+    few_shot = []
+    if not conversation_history and not history_summary and not preflight_error: # Follow-ups depend on the history, which stored pairs don't capture
+        reused_sql, few_shot = match_question(user_query)
+        if reused_sql:
+            print(f"Reusing stored SQL. Skipping LLM call. Generated SQL: {reused_sql}")
+            state["generated_sql"] = reused_sql; state["error_message"] = None; state["sql_source"] = "example"
+            state["sql_cache_key"] = cache_key # Cached by sql_preflight_node once the query passes
+            return None
+    if not get_llm(): state["error_message"] = "LLM not available."; state["generated_sql"] = None; return None
+    fitted_schema_parts, schema_tokens, schema_parts_trimmed = fit_schema_parts(schema_parts)
+    schema_context_for_prompt = "\n".join(fitted_schema_parts) if fitted_schema_parts else "No specific schema context. Infer table/column names (e.g., OTM.SHIPMENT). If unsure, output 'NO_QUERY'."
+    history_for_prompt, history_tokens, history_summarized = build_history_context(conversation_history, summary=history_summary)
     system_prompt_template = """
 You are an expert SQL generator specializing in SQL Server syntax for an Oracle Transportation Management (OTM) database.
 Your task is to generate a single, valid SQL Server query based on the user's current question, the provided database schema context, AND THE PREVIOUS CONVERSATION TURN(S) if available.
@@ -172,9 +267,10 @@ Guidelines:
 12. Never respond with any key like 'GID', 'XID' etc. instead join with respected table and provide the name, hide our database structure from the end user, maintain proper abstraction.
 13. Hide sensitive information like 'GID', 'XID', etc. from the end user. Instead, join with the respective table and provide the name, maintaining proper abstraction.
 15. If you need to join the same table multiple times for different roles (e.g., joining OTM.LOCATION for both an origin and a destination), YOU MUST use different table aliases for each instance of the table in the JOIN (e.g., `... JOIN OTM.LOCATION OriginLoc ON S.SOURCE_LOCATION_GID = OriginLoc.LOCATION_GID JOIN OTM.LOCATION DestLoc ON S.DEST_LOCATION_GID = DestLoc.LOCATION_GID ...`). Refer to columns using these aliases (e.g., `OriginLoc.LOCATION_NAME`, `DestLoc.LOCATION_NAME`).
+16. If the schema context includes a "Join path between the retrieved tables" section, join those tables using exactly the conditions listed there.
 """
     human_prompt_template = f"""{history_for_prompt}
-Database Schema Context:
+{format_few_shot(few_shot)}Database Schema Context:
 ------------------------
 {schema_context_for_prompt}
 ------------------------
@@ -182,56 +278,163 @@ User's Current Question:
 ----------------
 {user_query}
 ------------------------
-Based on the schema, conversation history, and the user's current question, generate the SQL Server query:
+{_preflight_feedback(state.get("generated_sql"), preflight_error) if preflight_error else ""}Based on the schema, conversation history, and the user's current question, generate the SQL Server query:
 """
     langchain_messages = [ SystemMessage(content=system_prompt_template.strip()), HumanMessage(content=human_prompt_template.strip()) ]
+    state["prompt_tokens"] = {"prompt_tokens": sum(count_tokens(m.content) for m in langchain_messages), "schema_tokens": schema_tokens, "history_tokens": history_tokens,
+                              "schema_parts_trimmed": schema_parts_trimmed, "history_messages_summarized": history_summarized, "few_shot_examples": len(few_shot)}
+    record_prompt(state["prompt_tokens"]); print(f"SQL prompt tokens: {state['prompt_tokens']}")
+    return langchain_messages, cache_key
+
+def _apply_sql_generation(state: GraphState, generated_sql_raw: str, cache_key: Optional[str]) -> None:
+    """Validates the raw LLM output and stores it in state for sql_preflight_node."""
+    user_query = state.get("cleaned_query")
+    print(f"LLM Raw Response: '{generated_sql_raw}'")
+    if not generated_sql_raw or "NO_QUERY" in generated_sql_raw.upper():
+        error_msg = f"I couldn't construct a specific SQL query for: '{user_query}'. The schema or context might be insufficient." if "NO_QUERY" in generated_sql_raw.upper() else "Could not generate SQL."
+        print("LLM indicated no query or invalid response."); state["error_message"] = error_msg; state["generated_sql"] = None
+    else:
+        cleaned_sql = generated_sql_raw.replace("```sql", "").replace("```", "").strip()
+        sql_upper_stripped = cleaned_sql.upper().strip()
+        if not (sql_upper_stripped.startswith("SELECT") or sql_upper_stripped.startswith("WITH")):
+            print(f"Warning: Generated query not SELECT/WITH: {cleaned_sql}"); state["error_message"] = "Generated query isn't SELECT or WITH."; state["generated_sql"] = None
+        else:
+            state["generated_sql"] = cleaned_sql; state["error_message"] = None; state["sql_source"] = "llm"
+            state["sql_cache_key"] = cache_key # Cached by sql_preflight_node once the query passes
+
+def sql_generator_node(state: GraphState, config: RunnableConfig = None) -> GraphState:
+    # config["configurable"]["llm_slot"], if set, is held around the LLM call (a semaphore bounding concurrent calls, see batch_jobs.py)
+    prepared = _prepare_sql_generation(state)
+    if prepared is None: return state
+    langchain_messages, cache_key = prepared
     try:
         print("Invoking LLM for SQL generation (with history)...")
-        response = llm.invoke(langchain_messages)
-        generated_sql_raw = response.content.strip()
-        print(f"LLM Raw Response: '{generated_sql_raw}'")
-        if not generated_sql_raw or "NO_QUERY" in generated_sql_raw.upper():
-            error_msg = f"I couldn't construct a specific SQL query for: '{user_query}'. The schema or context might be insufficient." if "NO_QUERY" in generated_sql_raw.upper() else "Could not generate SQL."
-            print("LLM indicated no query or invalid response."); state["error_message"] = error_msg; state["generated_sql"] = None
-        else:
-            cleaned_sql = generated_sql_raw.replace("```sql", "").replace("```", "").strip()
-            sql_upper_stripped = cleaned_sql.upper().strip()
-            if not (sql_upper_stripped.startswith("SELECT") or sql_upper_stripped.startswith("WITH")):
-                print(f"Warning: Generated query not SELECT/WITH: {cleaned_sql}"); state["error_message"] = "Generated query isn't SELECT or WITH."; state["generated_sql"] = None
-            else: state["generated_sql"] = cleaned_sql; state["error_message"] = None 
+        with (((config or {}).get("configurable") or {}).get("llm_slot") or nullcontext()):
+            started = time.perf_counter(); response = get_llm().invoke(langchain_messages); record_llm_latency(time.perf_counter() - started)
+        _apply_sql_generation(state, response.content.strip(), cache_key)
     except Exception as e:
         print(f"Error during LLM call for SQL generation: {e}"); state["error_message"] = f"Error generating SQL: {str(e)}"; state["generated_sql"] = None
     print(f"Generated SQL: {state['generated_sql']}")
     return state
 
-def sql_executor_node(state: GraphState) -> GraphState:
-    # (No changes from previous version: assistant_engine_py_v12_final_refinements)
+def sql_preflight_node(state: GraphState) -> GraphState:
+    """
+    Checks generated_sql locally (see sql_preflight.py). A passing query may get a TOP limit and is written to the SQL cache;
+    a rejected one goes back to sql_generator with the reason, up to SQL_PREFLIGHT_MAX_RETRIES times, then fails the request.
+    """
+    print("--- Running SQL Preflight Node ---")
+    sql_query = state.get("generated_sql")
+    cache_key = state.get("sql_cache_key"); state["sql_cache_key"] = None
+    if not sql_query: state["preflight_error"] = None; return state
+    checked_sql, error = preflight_sql(sql_query, load_compiled_schema_or_none(), top_limit=SQL_MAX_ROWS + 1) # One past the cap, so truncation is still detected
+    if error is None:
+        state["generated_sql"] = checked_sql; state["preflight_error"] = None
+        if cache_key: get_sql_cache().put(cache_key, sql_query)
+        state["example_sql"] = sql_query if state.get("sql_source") in ("llm", "example") and not state.get("follow_up_context") and not state.get("history_summary") else None
+        return state
+    attempts = state.get("preflight_attempts") or 0
+    print(f"Pre-flight rejected the query (attempt {attempts + 1}): {error}")
+    state["preflight_error"] = error
+    if attempts < SQL_PREFLIGHT_MAX_RETRIES:
+        state["preflight_attempts"] = attempts + 1; record_retry()
+    else:
+        state["generated_sql"] = None; state["preflight_error"] = None
+        state["error_message"] = f"I couldn't produce a valid query for this question. The last attempt was rejected: {error}"
+    return state
+
+def _route_after_preflight(state: GraphState) -> str:
+    return "sql_generator" if state.get("preflight_error") else "sql_executor" # preflight_error is only left set when a retry is due
+
+def _fetch_bounded(cursor, row_sink=None, cancellation=None) -> ResultSet:
+    """
+    Fetches an executed cursor in fetchmany() batches until the result ends or SQL_MAX_ROWS / SQL_MAX_RESULT_BYTES
+    is reached. Past a cap the rest of the result is cancelled on the server and the ResultSet is marked truncated.
+    """
+    columns = [column[0] for column in cursor.description]
+    rows = []; fetched_bytes = 0; truncated_reason = None
+    while True:
+        remaining = SQL_MAX_ROWS - len(rows)
+        if remaining <= 0 or fetched_bytes >= SQL_MAX_RESULT_BYTES:
+            if cursor.fetchone() is not None: truncated_reason = "row_cap" if remaining <= 0 else "byte_cap" # More rows were waiting
+            break
+        batch = cursor.fetchmany(min(STREAM_ROW_CHUNK_SIZE, remaining))
+        if cancellation is not None: cancellation.check()
+        if not batch: break
+        batch = list(map(tuple, batch)) # pyodbc Rows -> plain tuples
+        fetched_bytes += estimate_row_bytes(batch); rows.extend(batch)
+        if row_sink: row_sink(columns, batch)
+    if truncated_reason:
+        print(f"Result truncated at {len(rows)} rows (~{fetched_bytes // 1024} KiB) by {truncated_reason}.")
+        try: cursor.cancel() # Stop the server from producing the rest of the result
+        except Exception as e: print(f"Warning: Could not cancel the remaining result: {e}")
+    return ResultSet(columns, rows, truncated=truncated_reason is not None, truncated_reason=truncated_reason)
+
+_CANCELLED_MESSAGES = {
+    "timeout": "The query took longer than {timeout:g}s and was stopped. Try a narrower question (e.g. a shorter date range).",
+    "client_disconnected": "The request was cancelled because the client disconnected.",
+}
+
+def sql_executor_node(state: GraphState, config: RunnableConfig = None) -> GraphState:
+    # config["configurable"]["row_sink"], if set, is called as row_sink(columns, rows) for each fetched batch (see /chat/stream)
+    # config["configurable"]["cancellation"], if set, is a QueryCancellation that can stop the statement (see query_guard.py)
+    # config["configurable"]["db_slot"], if set, is held while a pooled connection is in use (see batch_jobs.py)
+    # config["configurable"]["fresh_result"], if true, skips the result cache lookup and stores the new result (see insight_refresh.py)
     print("--- Running SQL Executor Node ---")
+    configurable = (config or {}).get("configurable") or {}
+    row_sink = configurable.get("row_sink"); cancellation = configurable.get("cancellation") or QueryCancellation()
+    db_slot = configurable.get("db_slot") or nullcontext()
+    query_timeout = configurable.get("query_timeout", DB_QUERY_TIMEOUT)
     sql_query = state.get("generated_sql")
     if not sql_query or "NO_QUERY" in sql_query.upper() or sql_query.startswith("-- Mock SQL for query:"):
         if not state.get("error_message"): state["error_message"] = "No valid SQL query to execute."
         print(f"SQL Execution Skipped. Reason: {state.get('error_message', 'No valid SQL.')}"); state["sql_query_result"] = None; return state
-    if not db_connection_string:
+    db_pool = get_db_pool()
+    if not db_pool:
         state["error_message"] = "DB connection string not configured."; print(f"Error: {state['error_message']}"); state["sql_query_result"] = None; return state
+    result_key, result_tables = result_cache_key(sql_query) if result_cache else (None, ())
+    cached = result_cache.get(result_key) if result_cache and not configurable.get("fresh_result") else None
+    if cached is not None:
+        print(f"Result cache hit ({len(cached)} rows, tables: {', '.join(result_tables) or '-'}); skipping execution.")
+        if row_sink:
+            for start in range(0, len(cached.rows), STREAM_ROW_CHUNK_SIZE): row_sink(cached.headers, cached.rows[start:start + STREAM_ROW_CHUNK_SIZE])
+        state["sql_query_result"] = cached; state["error_message"] = None
+        if len(cached) == 0: state["analysis_summary"] = "The query was successful, but no matching records were found."
+        elif state.get("example_sql"): remember_example(state.get("cleaned_query"), state["example_sql"])
+        return state
+    import pyodbc # Already loaded by the pool's connection factory
     print(f"Executing SQL: {sql_query}")
-    results = []
-    conn = None
+    results = ResultSet([], [])
     try:
-        conn = pyodbc.connect(db_connection_string)
-        cursor = conn.cursor()
-        cursor.execute(sql_query)
-        if cursor.description:
-            columns = [column[0] for column in cursor.description]
-            for row in cursor.fetchall(): results.append(dict(zip(columns, row)))
-        else: 
-            raw_rows = cursor.fetchall()
-            if raw_rows:
-                if len(raw_rows) == 1 and len(raw_rows[0]) == 1: results = [{"AGGREGATE_RESULT": raw_rows[0][0]}]; print("Query returned single aggregate value.")
-                else: print("Query returned no column descriptions, unexpected format."); results = [{"raw_data": r} for r in raw_rows]
+        cancellation.check() # Nobody is waiting for this answer any more
+        with db_slot, db_pool.connection() as conn:
+            refusal = check_query_cost(conn, sql_query)
+            if refusal:
+                print(f"Query refused by the cost guard: {refusal}")
+                state["error_message"] = refusal; state["sql_query_result"] = None; return state
+            cursor = conn.cursor()
+            try:
+                with guarded_statement(cursor, cancellation, timeout=query_timeout):
+                    cursor.execute(sql_query)
+                    if cursor.description:
+                        results = _fetch_bounded(cursor, row_sink, cancellation)
+                    else: 
+                        raw_rows = cursor.fetchall()
+                        if raw_rows:
+                            if len(raw_rows) == 1 and len(raw_rows[0]) == 1: results = ResultSet(["AGGREGATE_RESULT"], [(raw_rows[0][0],)]); print("Query returned single aggregate value.")
+                            else: print("Query returned no column descriptions, unexpected format."); results = ResultSet(["raw_data"], [(r,) for r in raw_rows])
+            except pyodbc.Error:
+                if cancellation.cancelled: raise QueryCancelled(cancellation.reason) # The driver reports the cancel as an error (HY008)
+                raise
+            cursor.close()
         state["sql_query_result"] = results; state["error_message"] = None 
-        print(f"SQL executed. Rows: {len(results)}")
-        if 0 < len(results) < 5: print(f"Sample: {results[:5]}")
+        if result_cache: result_cache.put(result_key, results, result_tables)
+        if len(results) > 0 and state.get("example_sql"): remember_example(state.get("cleaned_query"), state["example_sql"])
+        print(f"SQL executed. Rows: {len(results)}{f' (truncated: {results.truncated_reason})' if results.truncated else ''}")
+        if 0 < len(results) < 5: print(f"Sample: {results.records()}")
         elif len(results) == 0: print("Query returned no results."); state["analysis_summary"] = "The query was successful, but no matching records were found."
+    except QueryCancelled as ex:
+        print(f"SQL execution cancelled: {ex.reason}")
+        state["error_message"] = _CANCELLED_MESSAGES.get(ex.reason, str(ex)).format(timeout=query_timeout); state["sql_query_result"] = None
     except pyodbc.Error as ex:
         sqlstate = ex.args[0]; db_err_msg = str(ex)
         print(f"SQL Error. SQLSTATE: {sqlstate}. Msg: {db_err_msg}")
@@ -239,12 +442,11 @@ def sql_executor_node(state: GraphState) -> GraphState:
     except Exception as e:
         print(f"Unexpected SQL execution error: {e}")
         state["error_message"] = f"An unexpected error occurred during data retrieval: {str(e)}"; state["sql_query_result"] = None
-    finally:
-        if conn: conn.close(); print("DB connection closed.")
     return state
 
 
 def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
+    import numpy as np
     print("--- Running Analyzer/Visualizer Node ---")
     query_result = state.get("sql_query_result")
     original_query = state.get("original_query","").lower()
@@ -255,20 +457,24 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
     table_config = None
     
     default_chart_title = f"Data for: '{state.get('original_query')}'" 
+    if result_buffer and state.get("conversation_id") and not state.get("presentation_only") and not query_result:
+        result_buffer.drop(state["conversation_id"]) # Nothing to redraw: a later "show that as a pie chart" must not pick up an older result
 
     if state.get("error_message") and not query_result:
         analysis_summary = None 
     elif not query_result: 
         if not analysis_summary: analysis_summary = "No data found for your query."
     else: 
-        if isinstance(query_result, list) and len(query_result) > 0:
-            headers = list(query_result[0].keys())
-            num_rows = len(query_result)
+        if len(query_result) > 0:
+            cols = state.get("result_columns") or ResultColumns.from_result(query_result) # Transposed once; every branch below reads these columns
+            if result_buffer and state.get("conversation_id") and not state.get("presentation_only"):
+                result_buffer.put(state["conversation_id"], query_result, cols, state.get("generated_sql"), state.get("original_query"))
+            headers = cols.headers
+            num_rows = cols.num_rows
             
-            rows_for_table = [[str(row.get(h, '')) for h in headers] for row in query_result]
-            table_config = {"headers": headers, "rows": rows_for_table}
+            table_config = TableData(headers, cols.table_rows(), columns=cols)
 
-            col_types_map = get_column_types(query_result, headers)
+            col_types_map = cols.column_types()
             numeric_cols = [h for h, t in col_types_map.items() if t == "numeric"]
             categorical_cols = [h for h, t in col_types_map.items() if t == "categorical" or t == "categorical_year"] # Treat year as cat
             date_like_cols = [h for h, t in col_types_map.items() if t == "date_like"] # True date/datetime
@@ -285,7 +491,7 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
             
             # 1. Single Value / KPI Display
             if num_rows == 1 and len(headers) == 1 and numeric_cols:
-                kpi_value = query_result[0][numeric_cols[0]]
+                kpi_value = cols.values(numeric_cols[0])[0]
                 kpi_title_header = headers[0].replace("_", " ").title()
                 analysis_summary = f"The {kpi_title_header} is: {kpi_value if kpi_value is not None else 'N/A'}."
                 final_chart_type_to_render = None 
@@ -298,36 +504,36 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
                 
                 labels = []
                 date_col_display_name = "Time"
-                sorted_query_result = query_result # Default
+                row_order = np.arange(num_rows) # Default: query order
 
                 if 'Year' in headers and 'Month' in headers:
-                    temp_data_for_sort = [{'year': int(row.get('Year',0)), 'month': int(row.get('Month',0)), 'data': row} for row in query_result]
-                    sorted_query_result_by_time = sorted(temp_data_for_sort, key=lambda x: (x['year'], x['month']))
-                    sorted_query_result = [item['data'] for item in sorted_query_result_by_time]
-                    labels = [f"{row.get('Year', '')}-{str(row.get('Month', '')).zfill(2)}" for row in sorted_query_result]
+                    years = np.array(cols.values('Year'), dtype=float).astype(np.int64); months = np.array(cols.values('Month'), dtype=float).astype(np.int64)
+                    row_order = np.lexsort((months, years)) # Stable, by (year, month)
+                    year_values = cols.values('Year'); month_strings = cols.strings('Month')
+                    labels = [f"{year_values[i]}-{month_strings[i].zfill(2)}" for i in row_order.tolist()]
                     date_col_display_name = "Year-Month"
-                elif date_like_cols: # Single actual date column
-                    date_col_for_labels = date_like_cols[0]
-                    try: sorted_query_result = sorted(query_result, key=lambda x: str(x.get(date_col_for_labels, "")))
-                    except TypeError: pass # Already sorted or unsorTable
-                    labels = [str(row.get(date_col_for_labels)) for row in sorted_query_result]
-                    date_col_display_name = date_col_for_labels.replace('_',' ').title()
-                elif categorical_cols and "year" in categorical_cols[0].lower(): # Year as category
-                    date_col_for_labels = categorical_cols[0]
-                    try: sorted_query_result = sorted(query_result, key=lambda x: str(x.get(date_col_for_labels, "")))
-                    except TypeError: pass
-                    labels = [str(row.get(date_col_for_labels)) for row in sorted_query_result]
+                elif date_like_cols or (categorical_cols and "year" in categorical_cols[0].lower()): # Single date column, or year as category
+                    date_col_for_labels = date_like_cols[0] if date_like_cols else categorical_cols[0]
+                    row_order = cols.argsort_by_string(date_col_for_labels)
+                    label_strings = cols.strings(date_col_for_labels)
+                    labels = [label_strings[i] for i in row_order.tolist()]
                     date_col_display_name = date_col_for_labels.replace('_',' ').title()
 
 
                 datasets = []
                 line_chart_colors = ['rgb(75, 192, 192)', 'rgb(255, 99, 132)', 'rgb(54, 162, 235)', 'rgb(255, 206, 86)']
                 
-                for i, num_col in enumerate(numeric_cols[:len(line_chart_colors)]): # Consider all numeric cols found
-                    try:
-                        data_values = [float(row.get(num_col) or 0) for row in sorted_query_result]
-                        datasets.append({ "label": num_col.replace("_", " ").title(), "data": data_values, "fill": False, "borderColor": line_chart_colors[i % len(line_chart_colors)], "tension": 0.1 })
+                series = []
+                for num_col in numeric_cols[:len(line_chart_colors)]: # Consider all numeric cols found
+                    try: series.append((num_col, cols.floats(num_col)[row_order]))
                     except (ValueError, TypeError) as e: print(f"Warning: Skipping numeric column {num_col} for line chart: {e}"); continue
+                keep = downsample_series([values for _, values in series]) if series and len(labels) == num_rows else None
+                if keep is not None: # Chart only; the table keeps every row
+                    keep_list = keep.tolist()
+                    labels = [labels[j] for j in keep_list]; series = [(num_col, values[keep]) for num_col, values in series]
+                    chart_options["plugins"]["subtitle"] = {"display": True, "text": describe_reduction(len(keep_list), num_rows)}
+                for i, (num_col, values) in enumerate(series):
+                    datasets.append({ "label": num_col.replace("_", " ").title(), "data": values.tolist(), "fill": False, "borderColor": line_chart_colors[i % len(line_chart_colors)], "tension": 0.1 })
                 
                 if datasets:
                     if not final_chart_type_to_render or final_chart_type_to_render not in ["line", "area"]:
@@ -346,19 +552,23 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
             # 3. Categorical vs Numerical (Pie/Doughnut/Bar)
             elif len(categorical_cols) == 1 and len(numeric_cols) == 1 and not chart_config:
                 cat_col = categorical_cols[0]; num_col = numeric_cols[0]
-                labels = [str(row.get(cat_col)) for row in query_result]
+                labels = cols.strings(cat_col)
                 try:
-                    data_values = [float(row.get(num_col) or 0) for row in query_result]
+                    data_values = cols.floats(num_col).tolist()
                     chart_options["plugins"]["title"]["text"] = f"{num_col.replace('_',' ').title()} by {cat_col.replace('_',' ').title()}"
                     
                     if final_chart_type_to_render in ["pie", "doughnut"] or \
                        (not final_chart_type_to_render and num_rows <= 7 and num_rows > 1): # Heuristic for pie
                         final_chart_type_to_render = final_chart_type_to_render if final_chart_type_to_render in ["pie", "doughnut"] else "pie"
+                        labels, data_values, folded = top_n_categories(labels, data_values, CHART_MAX_PIE_SLICES)
+                        if folded: chart_options["plugins"]["subtitle"] = {"display": True, "text": describe_reduction(len(labels) - 1, num_rows, "categories")}
                         chart_config = {"type": final_chart_type_to_render, "data": {"labels": labels, "datasets": [{"label": num_col.replace("_", " ").title(), "data": data_values, "backgroundColor": ['rgba(255,99,132,0.7)','rgba(54,162,235,0.7)','rgba(255,206,86,0.7)','rgba(75,192,192,0.7)','rgba(153,102,255,0.7)','rgba(255,159,64,0.7)']}]}, "options": chart_options}
                     elif num_rows > 0: 
                         final_chart_type_to_render = "bar" 
                         chart_options["plugins"]["legend"]["display"] = False
                         if "horizontal bar" in original_query and requested_chart_type == "bar" : chart_options["indexAxis"] = 'y'
+                        labels, data_values, folded = top_n_categories(labels, data_values, CHART_MAX_CATEGORIES)
+                        if folded: chart_options["plugins"]["subtitle"] = {"display": True, "text": describe_reduction(len(labels) - 1, num_rows, "categories")}
                         chart_config = {"type": "bar", "data": {"labels": labels, "datasets": [{"label": num_col.replace("_", " ").title(), "data": data_values, "backgroundColor": 'rgba(75, 192, 192, 0.7)' if chart_options.get("indexAxis") != 'y' else 'rgba(54, 162, 235, 0.7)'}]}, "options": chart_options}
                     
                     if chart_config: analysis_summary = chart_options["plugins"]["title"]["text"] 
@@ -373,9 +583,9 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
 
                 if requested_chart_type == "pie" and num_rows <= 10 and num_rows > 1:
                     combined_labels_map = {}
-                    for row in query_result:
-                        label = f"{str(row.get(cat_col1, 'N/A'))[:15]} - {str(row.get(cat_col2, 'N/A'))[:15]}"
-                        combined_labels_map[label] = combined_labels_map.get(label, 0) + float(row.get(num_col) or 0)
+                    for label1, label2, value in zip(cols.strings(cat_col1), cols.strings(cat_col2), cols.floats(num_col).tolist()):
+                        label = f"{label1[:15]} - {label2[:15]}"
+                        combined_labels_map[label] = combined_labels_map.get(label, 0) + value
                     labels = list(combined_labels_map.keys()); data_values = list(combined_labels_map.values())
                     if len(labels) <=10 : 
                         chart_config = {"type": "pie", "data": {"labels": labels, "datasets": [{"data": data_values, "backgroundColor": ['rgba(255,99,132,0.7)','rgba(54,162,235,0.7)','rgba(255,206,86,0.7)','rgba(75,192,192,0.7)','rgba(153,102,255,0.7)']}]}, "options": chart_options}
@@ -384,9 +594,9 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
                         analysis_summary = f"Data for '{chart_options['plugins']['title']['text']}' retrieved. A pie chart is not suitable for {len(labels)} categories. Showing table."
                         chart_config = None
                 elif (requested_chart_type == "bar" or not requested_chart_type) and num_rows > 0 and num_rows <= 20 :
-                    labels = [f"{str(row.get(cat_col1, 'N/A'))[:15]} - {str(row.get(cat_col2, 'N/A'))[:15]}" for row in query_result]
+                    labels = [f"{label1[:15]} - {label2[:15]}" for label1, label2 in zip(cols.strings(cat_col1), cols.strings(cat_col2))]
                     try:
-                        data_values = [float(row.get(num_col) or 0) for row in query_result]
+                        data_values = cols.floats(num_col).tolist()
                         chart_options["plugins"]["legend"]["display"] = False
                         chart_config = {"type":"bar", "data":{"labels":labels, "datasets":[{"label":num_col.replace('_',' ').title(), "data":data_values, "backgroundColor": 'rgba(54, 162, 235, 0.7)'}]}, "options":chart_options}
                         analysis_summary = f"Bar chart: {chart_options['plugins']['title']['text']}"
@@ -400,7 +610,12 @@ def analyzer_visualizer_node(state: GraphState) -> GraphState: # UPDATED
             elif len(numeric_cols) >= 2 and not chart_config:
                 num_col_x = numeric_cols[0]; num_col_y = numeric_cols[1]
                 try:
-                    scatter_data = [{"x": float(row.get(num_col_x) or 0), "y": float(row.get(num_col_y) or 0)} for row in query_result]
+                    x_values = cols.floats(num_col_x); y_values = cols.floats(num_col_y)
+                    keep = sample_points(num_rows)
+                    if keep is not None:
+                        x_values = x_values[keep]; y_values = y_values[keep]
+                        chart_options["plugins"]["subtitle"] = {"display": True, "text": describe_reduction(len(keep), num_rows)}
+                    scatter_data = [{"x": x, "y": y} for x, y in zip(x_values.tolist(), y_values.tolist())]
                     if scatter_data:
                         final_chart_type_to_render = requested_chart_type if requested_chart_type == "scatter" else "scatter"
                         chart_options["plugins"]["title"]["text"] = f"Relationship: {num_col_x.replace('_',' ').title()} vs {num_col_y.replace('_',' ').title()}"
@@ -434,16 +649,40 @@ def response_formatter_node(state: GraphState) -> GraphState:
     if not state.get("analysis_summary"): state["analysis_summary"] = "Request processed."
     return state
 
-def get_assistant_response(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None) -> Dict:
-    if not OPENAI_API_KEY or not llm: return { "answer": "Error: LLM not configured.", "chart": None, "raw_table": None, "id": f"error_no_llm_{os.urandom(4).hex()}" }
-    langchain_history: List[BaseMessage] = []
+# Insight id -> the SQL behind that answer, so a saved insight can be refreshed from it (see insight_refresh.py).
+# Recorded server-side in the insights DB (every worker, and a restart, sees it): the refresher only ever runs SQL
+# this app generated and pre-flighted.
+ANSWER_SQL_TTL_SECONDS = float(os.environ.get("ANSWER_SQL_TTL_SECONDS", 7 * 24 * 3600))
+
+def _make_insight_id(user_query: str, sql: Optional[str] = None) -> str:
+    slug = user_query[:20].replace(' ', '_').replace('?', '').replace("'", "")
+    insight_id = f"insight_{slug}_{os.urandom(4).hex()}"
+    if sql:
+        try: get_insights_store().remember_answer_sql(insight_id, sql)
+        except Exception as e: print(f"Warning: could not record the SQL of answer {insight_id}: {e}")
+    return insight_id
+
+def purge_answer_sql() -> int:
+    """Drops recorded answer SQL older than ANSWER_SQL_TTL_SECONDS; run now and then by the insight refresher, not per answer."""
+    return get_insights_store().purge_answer_sql(ANSWER_SQL_TTL_SECONDS)
+
+def get_answer_sql(insight_id: str) -> Optional[str]:
+    """The SQL of an answer by its insight id, or None (no data query, or answered more than ANSWER_SQL_TTL_SECONDS ago)."""
+    try: return get_insights_store().get_answer_sql(insight_id, ANSWER_SQL_TTL_SECONDS)
+    except Exception as e:
+        print(f"Warning: could not look up the SQL of answer {insight_id}: {e}"); return None
+
+def _build_initial_state(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, conversation_id: Optional[str] = None) -> GraphState:
+    langchain_history: List[BaseMessage] = []; history_summary = None
     if conversation_history_raw:
         for item in conversation_history_raw:
             if item.get("role") == "user": langchain_history.append(HumanMessage(content=item.get("content","")))
             elif item.get("role") == "assistant": langchain_history.append(AIMessage(content=item.get("content","")))
-    initial_state = GraphState( original_query=user_query, cleaned_query=None, requested_chart_type=None, retrieved_schema_parts=None, generated_sql=None, sql_query_result=None, analysis_summary=None, chart_json=None, table_data=None, error_message=None, follow_up_context=langchain_history )
-    print(f"\nInvoking graph for query: '{user_query}' with {len(langchain_history)} history messages.")
-    final_state = app_graph.invoke(initial_state)
+            elif item.get("role") == "summary": history_summary = item.get("content") or None # Leading item of a server-side session's history
+    return GraphState( original_query=user_query, cleaned_query=None, requested_chart_type=None, retrieved_schema_parts=None, generated_sql=None, sql_query_result=None, analysis_summary=None, chart_json=None, table_data=None, error_message=None, follow_up_context=langchain_history, history_summary=history_summary, prompt_tokens=None, sql_cache_key=None, preflight_error=None, preflight_attempts=0, sql_source=None, example_sql=None,
+                       conversation_id=str(conversation_id)[:128] if conversation_id else None, presentation_only=False, result_columns=None )
+
+def _build_response(final_state: GraphState, user_query: str) -> Dict:
     print(f"Graph complete. Summary: '{final_state.get('analysis_summary')}', SQL: {final_state.get('generated_sql')}, Chart: {'Yes' if final_state.get('chart_json') else 'No'}")
     
     response_answer = final_state.get("analysis_summary") 
@@ -460,20 +699,229 @@ def get_assistant_response(user_query: str, conversation_history_raw: Optional[L
             response_answer = f"I understood your query: '{final_state.get('original_query')}', but I couldn't form a specific data query."
         else: response_answer = "I've processed your request. No specific data to display."
 
+    query_result = final_state.get("sql_query_result")
+    truncated = bool(getattr(query_result, "truncated", False))
+    if truncated:
+        limit = f"{SQL_MAX_ROWS:,}-row limit" if query_result.truncated_reason == "row_cap" else f"{SQL_MAX_RESULT_BYTES / (1024 * 1024):g} MB result size limit"
+        response_answer = f"{response_answer} (Showing the first {len(query_result):,} rows; the full result exceeds the {limit}.)"
+
+    has_data = bool(final_state.get("chart_json") or final_state.get("table_data"))
+    sql = final_state.get("generated_sql") if has_data else None
     response = {
         "answer": response_answer, 
         "chart": final_state.get("chart_json"), 
         "raw_table": final_state.get("table_data"),
-        "id": f"insight_{user_query[:20].replace(' ', '_').replace('?', '').replace("'", "")}_{os.urandom(4).hex()}" 
+        "sql": sql,
+        "truncated": truncated
     }
     return response
 
+def _run_assistant_pipeline(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, conversation_id: Optional[str] = None, graph_config: Optional[Dict[str, Any]] = None) -> Dict:
+    initial_state = _build_initial_state(user_query, conversation_history_raw, conversation_id)
+    print(f"\nInvoking graph for query: '{user_query}' with {len(initial_state['follow_up_context'])} history messages.")
+    final_state = get_app_graph().invoke(initial_state, config=graph_config)
+    return _build_response(final_state, user_query)
+
+def _resolve_history(conversation_history_raw: Optional[List[Dict[str,str]]], conversation_id: Optional[str]) -> Optional[List[Dict[str,str]]]:
+    """The client's conversation_history when it sent one (older clients), else the server-side session's history for conversation_id."""
+    if conversation_history_raw or not conversation_id: return conversation_history_raw
+    session_store = get_session_store()
+    return session_store.get_history(str(conversation_id)[:128]) if session_store else conversation_history_raw
+
+def _record_turn(conversation_id: Optional[str], user_query: str, response: Dict) -> None:
+    session_store = get_session_store() if conversation_id else None
+    if session_store: session_store.append_turn(str(conversation_id)[:128], user_query, response.get("answer"))
+
+def _response_cache_key(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]], conversation_id: Optional[str] = None) -> str:
+    key = f"{normalize_question(user_query)}|{hash_history(conversation_history_raw)}"
+    # A presentation-only follow-up redraws its own conversation's buffered result
+    return f"{key}|{conversation_id}" if conversation_id and is_presentation_only(user_query) else key
+
+def _rebuffer_shared_response(conversation_id: Optional[str], user_query: str, response: Dict) -> None:
+    """
+    A response-cache hit (or a run coalesced onto another conversation's) skipped analyzer_visualizer for this
+    conversation, so its result buffer still holds the previous answer. Buffer this answer's result from the result
+    cache, or drop the stale one, so a following "show that as a pie chart" redraws the right data.
+    """
+    if not result_buffer or not conversation_id or is_presentation_only(user_query): return # Presentation-only keys are per conversation
+    sql = response.get("sql")
+    result = result_cache.get(result_cache_key(sql)[0]) if result_cache and sql else None
+    if result is not None and len(result) > 0: result_buffer.put(str(conversation_id)[:128], result, ResultColumns.from_result(result), sql, user_query)
+    else: result_buffer.drop(str(conversation_id)[:128])
+
+def _is_cacheable_response(response: Dict) -> bool:
+    # Only answers that carry data are cached, so errors are retried on the next request
+    return bool(response.get("chart") or response.get("raw_table"))
+
+def get_assistant_response(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, conversation_id: Optional[str] = None, graph_config: Optional[Dict[str, Any]] = None) -> Dict:
+    # graph_config["configurable"] carries per-request node options (row_sink, cancellation, llm_slot, db_slot, schema_parts)
+    if not OPENAI_API_KEY or not get_llm(): return { "answer": "Error: LLM not configured.", "chart": None, "raw_table": None, "id": f"error_no_llm_{os.urandom(4).hex()}" }
+    conversation_history_raw = _resolve_history(conversation_history_raw, conversation_id)
+    if not response_cache: response = _run_assistant_pipeline(user_query, conversation_history_raw, conversation_id, graph_config)
+    else:
+        # Identical questions with identical history share one cached / in-flight pipeline run.
+        computed = []
+        def compute():
+            computed.append(True); return _run_assistant_pipeline(user_query, conversation_history_raw, conversation_id, graph_config)
+        response = response_cache.get_or_compute(_response_cache_key(user_query, conversation_history_raw, conversation_id), compute, should_cache=_is_cacheable_response)
+        if not computed: _rebuffer_shared_response(conversation_id, user_query, response)
+    response = dict(response, id=_make_insight_id(user_query, response.get("sql"))) # Each caller gets its own insight id (cached responses have none)
+    _record_turn(conversation_id, user_query, response)
+    return response
+
+# Response-cache key -> QueryCancellation of the in-flight streamed run that identical /chat/stream requests share
+_stream_cancellations: Dict[str, QueryCancellation] = {}
+_stream_cancellations_lock = threading.Lock()
+
+def _replay_response(response: Dict, put) -> None:
+    """Emits a finished response (a response-cache hit or another caller's run) as the events a streamed run would."""
+    if response.get("sql"): put("sql", {"sql": response["sql"]})
+    table = response.get("raw_table")
+    if table and table.get("rows"):
+        put("table_header", {"headers": table["headers"]})
+        for start in range(0, len(table["rows"]), STREAM_ROW_CHUNK_SIZE): put("rows", {"rows": table["rows"][start:start + STREAM_ROW_CHUNK_SIZE]})
+    if response.get("chart"): put("chart", {"chart": response["chart"]})
+
+def stream_assistant_response(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, conversation_id: Optional[str] = None):
+    """
+    Runs the graph and yields (event_name, payload) tuples as it progresses:
+      node         -> {"node": name} after each graph node completes
+      sql          -> {"sql": ...} as soon as sql_preflight has accepted the generated query
+      table_header -> {"headers": [...]} before the first row chunk
+      rows         -> {"rows": [[...], ...]} for each fetched batch (cells stringified like raw_table)
+      chart        -> {"chart": chart_json} once analyzer_visualizer has built it
+      done         -> the /chat response; raw_table is omitted when it was already streamed as rows
+      heartbeat    -> None after STREAM_HEARTBEAT_SECONDS without another event (lets the server notice a closed connection)
+    The graph runs on a worker thread so row batches can be forwarded while the executor is still fetching.
+    Like get_assistant_response, it goes through response_cache: a cached or in-flight identical request is
+    replayed as sql / rows / chart / done events (no node events) instead of running the graph again.
+    Closing the generator early (the client disconnected) cancels the in-flight SQL statement once no other
+    stream waits for the same run.
+    """
+    if not OPENAI_API_KEY or not get_llm():
+        yield "done", { "answer": "Error: LLM not configured.", "chart": None, "raw_table": None, "id": f"error_no_llm_{os.urandom(4).hex()}" }
+        return
+    events: "queue.Queue" = queue.Queue()
+    finished = object()
+    rows_streamed = {"value": False}
+    conversation_history_raw = _resolve_history(conversation_history_raw, conversation_id)
+    key = _response_cache_key(user_query, conversation_history_raw, conversation_id) if response_cache else None
+    with _stream_cancellations_lock:
+        cancellation = _stream_cancellations.get(key) if key else None
+        if cancellation is None or cancellation.cancelled:
+            cancellation = QueryCancellation()
+            if key: _stream_cancellations[key] = cancellation
+        cancellation.join()
+
+    def put(event_name, payload):
+        if event_name in ("table_header", "rows"): rows_streamed["value"] = True
+        events.put((event_name, payload))
+
+    def row_sink(columns, rows):
+        if not rows_streamed["value"]: put("table_header", {"headers": columns})
+        put("rows", {"rows": [[str(value) for value in row] for row in rows]})
+
+    def run_pipeline():
+        state = _build_initial_state(user_query, conversation_history_raw, conversation_id)
+        print(f"\nStreaming graph for query: '{user_query}' with {len(state['follow_up_context'])} history messages.")
+        for update in get_app_graph().stream(state, config={"configurable": {"row_sink": row_sink, "cancellation": cancellation}}, stream_mode="updates"):
+            for node_name, node_state in update.items():
+                if node_state: state.update(node_state)
+                put("node", {"node": node_name})
+                if node_name == "sql_preflight" and state.get("generated_sql") and not state.get("preflight_error"): put("sql", {"sql": state["generated_sql"]})
+                if node_name == "analyzer_visualizer" and state.get("chart_json"): put("chart", {"chart": state["chart_json"]})
+        return _build_response(state, user_query)
+
+    def run_graph():
+        try:
+            if not response_cache: response = run_pipeline()
+            else:
+                computed = []
+                def compute():
+                    computed.append(True); return run_pipeline()
+                response = response_cache.get_or_compute(key, compute, should_cache=_is_cacheable_response)
+                if not computed:
+                    _rebuffer_shared_response(conversation_id, user_query, response); _replay_response(response, put)
+            response = dict(response, id=_make_insight_id(user_query, response.get("sql")))
+            if rows_streamed["value"]: response["raw_table"] = None; response["table_streamed"] = True
+            _record_turn(conversation_id, user_query, response)
+            events.put(("done", response))
+        except Exception as e:
+            print(f"Error while streaming assistant response: {e}")
+            events.put(("error", {"error": f"An unexpected error occurred: {str(e)}"}))
+        finally:
+            events.put((finished, None))
+
+    threading.Thread(target=run_graph, name="assistant-stream", daemon=True).start()
+    completed = False
+    try:
+        while True:
+            try: event_name, payload = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty: yield "heartbeat", None; continue
+            if event_name is finished: completed = True; return
+            yield event_name, payload
+    finally:
+        with _stream_cancellations_lock:
+            cancellation.leave(gave_up=not completed) # GeneratorExit: the response stream was closed before the answer
+            if key and cancellation.waiters <= 0 and _stream_cancellations.get(key) is cancellation: del _stream_cancellations[key]
+
+def invalidate_cached_results(tables=None) -> Dict[str, Any]:
+    """
+    Drops cached SQL results that read any of `tables` (all of them when None), e.g. after a load into OTM.
+    Cached full responses aren't tagged with tables, so they are all dropped too.
+    """
+    results = (result_cache.clear() if tables is None else result_cache.invalidate_tables(tables)) if result_cache else 0
+    if response_cache: response_cache.clear()
+    return {"invalidated_results": results, "tables": sorted({t.upper() for t in tables}) if tables is not None else "all"}
+
+def get_engine_stats() -> Dict[str, Any]:
+    """Counters of the caches, the DB pool, schema retrieval, SQL prompts, chart downsampling, SQL pre-flight, query guards, SQL example reuse, the result buffer and conversation sessions, for /api/stats."""
+    return {
+        "response_cache": response_cache.get_stats() if response_cache else None,
+        "result_cache": result_cache.get_stats() if result_cache else None,
+        "sql_cache": _sql_cache.get_stats() if _sql_cache else None, # Not created yet -> None
+        "db_pool": _db_pool.get_stats() if _db_pool else None,
+        "schema_retrieval": get_retrieval_stats(),
+        "sql_prompt": get_prompt_stats(),
+        "chart_downsampling": get_downsample_stats(),
+        "sql_preflight": get_preflight_stats(),
+        "query_guard": get_query_guard_stats(),
+        "sql_examples": get_example_stats(),
+        "result_buffer": result_buffer.get_stats() if result_buffer else None,
+        "sessions": get_session_store().get_stats() if get_session_store() else None,
+    }
+
 # --- Build the Graph & Main test block (remains the same) ---
-workflow = StateGraph(GraphState)
-workflow.add_node("intent_detection", intent_detection_node); workflow.add_node("schema_retriever", schema_retriever_node); workflow.add_node("sql_generator", sql_generator_node); workflow.add_node("sql_executor", sql_executor_node); workflow.add_node("analyzer_visualizer", analyzer_visualizer_node); workflow.add_node("response_formatter", response_formatter_node)
-workflow.add_edge("intent_detection", "schema_retriever"); workflow.add_edge("schema_retriever", "sql_generator"); workflow.add_edge("sql_generator", "sql_executor"); workflow.add_edge("sql_executor", "analyzer_visualizer"); workflow.add_edge("analyzer_visualizer", "response_formatter"); workflow.add_edge("response_formatter", END)
-workflow.set_entry_point("intent_detection")
-app_graph = workflow.compile()
+def build_assistant_graph(node_overrides: Optional[Dict[str, Any]] = None):
+    """Compiles the assistant StateGraph. node_overrides swaps node implementations (e.g. async versions) by node name."""
+    from langgraph.graph import StateGraph, END
+    nodes = {"intent_detection": intent_detection_node, "schema_retriever": schema_retriever_node, "sql_generator": sql_generator_node, "sql_preflight": sql_preflight_node, "sql_executor": sql_executor_node, "analyzer_visualizer": analyzer_visualizer_node, "response_formatter": response_formatter_node}
+    nodes.update(node_overrides or {})
+    workflow = StateGraph(GraphState)
+    for node_name, node_fn in nodes.items(): workflow.add_node(node_name, node_fn)
+    workflow.add_conditional_edges("intent_detection", _route_after_intent, {"schema_retriever": "schema_retriever", "analyzer_visualizer": "analyzer_visualizer"})
+    workflow.add_edge("schema_retriever", "sql_generator"); workflow.add_edge("sql_generator", "sql_preflight")
+    workflow.add_conditional_edges("sql_preflight", _route_after_preflight, {"sql_generator": "sql_generator", "sql_executor": "sql_executor"})
+    workflow.add_edge("sql_executor", "analyzer_visualizer"); workflow.add_edge("analyzer_visualizer", "response_formatter"); workflow.add_edge("response_formatter", END)
+    workflow.set_entry_point("intent_detection")
+    return workflow.compile()
+
+def warm_up(background: bool = True):
+    """
+    Builds the lazily initialized resources (LLM client, compiled graph, Chroma client and collection,
+    compiled schema, SQL cache, DB pool) ahead of the first request. Returns the thread when background=True.
+    """
+    def _warm():
+        started = datetime.now()
+        for name, init_fn in [("llm", get_llm), ("graph", get_app_graph), ("schema", warm_up_schema_index), ("sql_preflight", lambda: warm_up_preflight(load_compiled_schema_or_none())), ("sql_cache", get_sql_cache), ("sql_examples", get_examples_collection if SQL_EXAMPLES_ENABLED else lambda: None), ("db_pool", get_db_pool)]:
+            try: init_fn()
+            except Exception as e: print(f"Warning: warm-up of {name} failed: {e}")
+        print(f"Assistant warm-up finished in {(datetime.now() - started).total_seconds():.2f}s.")
+    if not background:
+        _warm(); return None
+    thread = threading.Thread(target=_warm, name="assistant-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 if __name__ == '__main__':
     print("Testing Assistant Engine...")
@@ -488,6 +936,7 @@ if __name__ == '__main__':
         else: print(f"\nChromaDB collection '{schema_collection_name_for_test}' found with {test_collection.count()} documents.\n")
     except Exception as e: print(f"\nCould not verify ChromaDB collection '{schema_collection_name_for_test}': {e}. Run schema_index.py.\n")
     print(f"Test DB Connection String: {db_connection_string if db_connection_string else 'NOT CONFIGURED'}")
+    warm_up(background=False)
     history_example = [{"role": "user", "content": "What was the total shipment cost last year using START_TIME?"},{"role": "assistant", "content": "The total shipment cost last year was $125,000."}]
     test_queries_with_history = [ 
         ({"query": "What is the total shipment count?", "history": []}),
@@ -0,0 +1,103 @@
+# app/async_engine.py
+"""
+asyncio execution path for the assistant graph (served by app/asgi.py).
+
+The graph is the same as assistant_engine.get_app_graph(), but:
+- sql_generator awaits llm.ainvoke instead of blocking on llm.invoke;
+- the blocking Chroma query (schema_retriever) and pyodbc execute (sql_executor) run on a bounded
+  thread pool (ASYNC_IO_WORKERS), so many in-flight questions share a small number of threads.
+"""
+import os
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Dict
+
+from langchain_core.runnables import RunnableConfig
+
+from . import assistant_engine as engine
+from .assistant_engine import GraphState
+from .query_guard import QueryCancellation
+
+ASYNC_IO_WORKERS = int(os.environ.get("ASYNC_IO_WORKERS", 8))
+io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix="assistant-io")
+
+
+async def _run_blocking(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(fn, *args, **kwargs))
+
+# --- Async node implementations ---
+async def schema_retriever_node_async(state: GraphState) -> GraphState:
+    return await _run_blocking(engine.schema_retriever_node, state)
+
+async def sql_generator_node_async(state: GraphState) -> GraphState:
+    prepared = await _run_blocking(engine._prepare_sql_generation, state) # Example matching queries Chroma
+    if prepared is None: return state
+    langchain_messages, cache_key = prepared
+    try:
+        print("Invoking LLM asynchronously for SQL generation (with history)...")
+        started = time.perf_counter(); response = await engine.get_llm().ainvoke(langchain_messages); engine.record_llm_latency(time.perf_counter() - started)
+        engine._apply_sql_generation(state, response.content.strip(), cache_key)
+    except Exception as e:
+        print(f"Error during async LLM call for SQL generation: {e}"); state["error_message"] = f"Error generating SQL: {str(e)}"; state["generated_sql"] = None
+    print(f"Generated SQL: {state['generated_sql']}")
+    return state
+
+async def sql_executor_node_async(state: GraphState, config: RunnableConfig = None) -> GraphState:
+    return await _run_blocking(engine.sql_executor_node, state, config)
+
+_async_app_graph = None
+
+def get_async_app_graph():
+    global _async_app_graph
+    if _async_app_graph is None:
+        with engine._lazy_init_lock:
+            if _async_app_graph is None:
+                _async_app_graph = engine.build_assistant_graph({
+                    "schema_retriever": schema_retriever_node_async,
+                    "sql_generator": sql_generator_node_async,
+                    "sql_executor": sql_executor_node_async,
+                })
+    return _async_app_graph
+
+
+async def _arun_assistant_pipeline(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, cancellation: Optional[QueryCancellation] = None, conversation_id: Optional[str] = None) -> Dict:
+    initial_state = engine._build_initial_state(user_query, conversation_history_raw, conversation_id)
+    print(f"\nInvoking async graph for query: '{user_query}' with {len(initial_state['follow_up_context'])} history messages.")
+    final_state = await get_async_app_graph().ainvoke(initial_state, config={"configurable": {"cancellation": cancellation}})
+    return engine._build_response(final_state, user_query)
+
+# Response-cache key -> QueryCancellation of the in-flight run that identical requests share (touched on the event loop only)
+_shared_cancellations: Dict[str, QueryCancellation] = {}
+
+async def aget_assistant_response(user_query: str, conversation_history_raw: Optional[List[Dict[str,str]]] = None, conversation_id: Optional[str] = None) -> Dict:
+    """
+    Async counterpart of assistant_engine.get_assistant_response; shares its response cache. If the awaiting task is
+    cancelled (the ASGI client disconnected) and no other request is waiting for the same run, its SQL statement is cancelled.
+    """
+    if not engine.OPENAI_API_KEY or not engine.get_llm(): return { "answer": "Error: LLM not configured.", "chart": None, "raw_table": None, "id": f"error_no_llm_{os.urandom(4).hex()}" }
+    conversation_history_raw = await _run_blocking(engine._resolve_history, conversation_history_raw, conversation_id) # May read the SQLite session spill
+    key = engine._response_cache_key(user_query, conversation_history_raw, conversation_id) if engine.response_cache else None
+    cancellation = _shared_cancellations.get(key) if key else None
+    if cancellation is None:
+        cancellation = QueryCancellation()
+        if key: _shared_cancellations[key] = cancellation
+    cancellation.join(); gave_up = False
+    try:
+        if not engine.response_cache: response = await _arun_assistant_pipeline(user_query, conversation_history_raw, cancellation, conversation_id)
+        else:
+            computed = []
+            def compute():
+                computed.append(True); return _arun_assistant_pipeline(user_query, conversation_history_raw, cancellation, conversation_id)
+            response = await engine.response_cache.aget_or_compute(key, compute, should_cache=engine._is_cacheable_response)
+            if not computed: await _run_blocking(engine._rebuffer_shared_response, conversation_id, user_query, response)
+        response = dict(response, id=await _run_blocking(engine._make_insight_id, user_query, response.get("sql")))
+        await _run_blocking(engine._record_turn, conversation_id, user_query, response)
+        return response
+    except asyncio.CancelledError:
+        gave_up = True; raise
+    finally:
+        cancellation.leave(gave_up=gave_up)
+        if key and cancellation.waiters <= 0 and _shared_cancellations.get(key) is cancellation: del _shared_cancellations[key]
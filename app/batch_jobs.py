@@ -0,0 +1,121 @@
+# project_root/app/batch_jobs.py
+"""
+Batch question jobs behind POST /chat/batch, for report jobs that ask dozens of questions at once.
+
+A job's questions run through assistant_engine.get_assistant_response on one process-wide pool of BATCH_WORKERS
+threads. The LLM calls and the database work of all batch jobs are bounded separately (BATCH_LLM_CONCURRENCY and
+BATCH_DB_CONCURRENCY semaphores, passed to the graph nodes as llm_slot / db_slot), so a batch cannot take every
+pooled DB connection from interactive /chat users. The schema retrieval of the whole batch is done up front with
+one multi-text query_schema call (schema_index.retrieve_schema_parts_batch).
+Results are kept in completion order; GET /chat/batch/<job_id> polls them and /chat/batch/<job_id>/stream
+streams them as Server-Sent Events. Finished jobs are dropped after BATCH_JOB_TTL_SECONDS.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == "__main__" and __package__ is None:
+    from assistant_engine import get_assistant_response
+    from schema_index import retrieve_schema_parts_batch, SCHEMA_COLLECTION_NAME
+else:
+    from .assistant_engine import get_assistant_response
+    from .schema_index import retrieve_schema_parts_batch, SCHEMA_COLLECTION_NAME
+
+# --- Configuration ---
+BATCH_MAX_QUERIES = int(os.environ.get("BATCH_MAX_QUERIES", 100))
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", 8))
+BATCH_LLM_CONCURRENCY = int(os.environ.get("BATCH_LLM_CONCURRENCY", 4))
+BATCH_DB_CONCURRENCY = int(os.environ.get("BATCH_DB_CONCURRENCY", 3))
+BATCH_JOB_TTL_SECONDS = float(os.environ.get("BATCH_JOB_TTL_SECONDS", 3600))
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", 50)) # Queued + running + finished jobs kept
+
+_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="batch-worker")
+_llm_slots = threading.BoundedSemaphore(BATCH_LLM_CONCURRENCY)
+_db_slots = threading.BoundedSemaphore(BATCH_DB_CONCURRENCY)
+
+
+class BatchJob:
+    def __init__(self, queries):
+        self.id = f"batch_{os.urandom(8).hex()}"
+        self.queries = queries
+        self.results = [] # {"index", "query", "response"} in completion order
+        self.created_at = time.time(); self.finished_at = None
+        self._cond = threading.Condition()
+
+    @property
+    def done(self): return self.finished_at is not None
+
+    def _complete(self, index, response):
+        with self._cond:
+            self.results.append({"index": index, "query": self.queries[index], "response": response})
+            if len(self.results) == len(self.queries): self.finished_at = time.time()
+            self._cond.notify_all()
+
+    def results_since(self, since=0, timeout=None):
+        """Results completed after the first `since`, waiting up to `timeout` seconds for one when there are none yet."""
+        with self._cond:
+            if timeout and len(self.results) <= since and not self.done: self._cond.wait(timeout)
+            return self.results[since:]
+
+    def status(self, since=0):
+        with self._cond:
+            return {"job_id": self.id, "status": "done" if self.done else "running", "total": len(self.queries),
+                    "completed": len(self.results), "results": self.results[since:]}
+
+
+class BatchJobs:
+    """Submitted jobs by id; finished ones expire after BATCH_JOB_TTL_SECONDS, at most BATCH_MAX_JOBS are kept."""
+
+    def __init__(self, max_jobs=BATCH_MAX_JOBS, ttl_seconds=BATCH_JOB_TTL_SECONDS):
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self._jobs = OrderedDict() # Oldest first
+        self._lock = threading.Lock()
+        self._stats = {"jobs": 0, "queries": 0, "rejected": 0, "errors": 0}
+
+    def _prune(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job.done and (job.finished_at + self.ttl_seconds <= now or len(self._jobs) >= self.max_jobs): del self._jobs[job_id]
+
+    def submit(self, queries):
+        """Starts a job for `queries` (a list of strings) and returns it, or None when max_jobs are still running."""
+        with self._lock:
+            self._prune(time.time())
+            if len(self._jobs) >= self.max_jobs:
+                self._stats["rejected"] += 1; return None
+            job = BatchJob(list(queries)); self._jobs[job.id] = job
+            self._stats["jobs"] += 1; self._stats["queries"] += len(job.queries)
+        _executor.submit(self._start, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            self._prune(time.time())
+            return self._jobs.get(job_id)
+
+    def _start(self, job):
+        try: schema_parts = retrieve_schema_parts_batch(job.queries, n_results=12, collection_name=SCHEMA_COLLECTION_NAME)
+        except Exception as e:
+            print(f"Batch schema retrieval failed, questions retrieve their own: {e}"); schema_parts = {}
+        config = {"configurable": {"llm_slot": _llm_slots, "db_slot": _db_slots, "schema_parts": schema_parts}}
+        print(f"Batch {job.id}: {len(job.queries)} questions, {len(schema_parts)} schema retrievals in one call.")
+        for index in range(len(job.queries)): _executor.submit(self._run_one, job, index, config)
+
+    def _run_one(self, job, index, config):
+        try: response = get_assistant_response(job.queries[index], graph_config=config)
+        except Exception as e:
+            print(f"Batch {job.id}: question {index} failed: {e}")
+            with self._lock: self._stats["errors"] += 1
+            response = {"answer": None, "error": f"An unexpected error occurred: {str(e)}", "chart": None, "raw_table": None}
+        job._complete(index, response)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(kept=len(self._jobs), running=sum(1 for job in self._jobs.values() if not job.done))
+        return stats
+
+
+batch_jobs = BatchJobs()
@@ -0,0 +1,135 @@
+# project_root/app/chart_downsample.py
+"""
+Chart-side reduction of large results for analyzer_visualizer_node. The table keeps every row; only
+the Chart.js series are reduced, so the browser never has to draw 200k points or bars.
+
+- Line charts: LTTB (Largest-Triangle-Three-Buckets) or min/max-per-bucket down to CHART_MAX_POINTS.
+  With several datasets sharing one label axis, each dataset picks its share of the points and the
+  union of the picked rows is kept, so every series keeps its own peaks.
+- Categorical charts: the top CHART_MAX_CATEGORIES (bar) / CHART_MAX_PIE_SLICES (pie) categories by
+  value are kept in query order and the rest are summed into one "Other" category.
+- Scatter charts: an evenly spaced sample of CHART_MAX_POINTS points.
+"""
+import os
+import threading
+
+# --- Configuration ---
+CHART_DOWNSAMPLE_ENABLED = os.environ.get("CHART_DOWNSAMPLE_ENABLED", "true").lower() == "true"
+CHART_DOWNSAMPLE_METHOD = os.environ.get("CHART_DOWNSAMPLE_METHOD", "lttb").lower() # "lttb" or "minmax"
+CHART_MAX_POINTS = int(os.environ.get("CHART_MAX_POINTS", 1000)) # Per line / scatter chart
+CHART_MAX_CATEGORIES = int(os.environ.get("CHART_MAX_CATEGORIES", 30)) # Bars, including "Other"
+CHART_MAX_PIE_SLICES = int(os.environ.get("CHART_MAX_PIE_SLICES", 8)) # Slices, including "Other"
+
+_stats = {"line_charts": 0, "categorical_charts": 0, "scatter_charts": 0, "points_in": 0, "points_out": 0}
+_stats_lock = threading.Lock()
+
+
+def _record(kind, points_in, points_out):
+    with _stats_lock:
+        _stats[kind] += 1; _stats["points_in"] += points_in; _stats["points_out"] += points_out
+
+def get_downsample_stats():
+    with _stats_lock: return dict(_stats)
+
+def describe_reduction(kept, total, unit="points"):
+    """Chart subtitle text for a reduced chart."""
+    return f"Showing {kept:,} of {total:,} {unit}; the table has every row."
+
+
+# --- Line charts ---
+def lttb_indices(y, target):
+    """Row indices picked by LTTB from series `y` (x = row position); always keeps the first and last row."""
+    import numpy as np
+    n = len(y)
+    if target >= n or target < 3: return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, n - 1, target - 1).astype(np.int64) # target - 2 buckets between the fixed end points
+    picked = np.empty(target, dtype=np.int64)
+    picked[0] = 0; picked[-1] = n - 1
+    a = 0
+    for b in range(target - 2):
+        start, stop = edges[b], edges[b + 1]
+        next_start, next_stop = edges[b + 1], (edges[b + 2] if b + 2 < len(edges) else n)
+        avg_x = (next_start + next_stop - 1) / 2.0; avg_y = y[next_start:next_stop].mean()
+        xs = np.arange(start, stop)
+        # Twice the area of the triangle (a, candidate, next bucket average); the constant 1/2 doesn't change the argmax
+        areas = np.abs((a - avg_x) * (y[start:stop] - y[a]) - (a - xs) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        picked[b + 1] = a
+    return picked
+
+def minmax_indices(y, target):
+    """Row indices of the minimum and maximum of each of target // 2 buckets, in row order, plus the first and last row."""
+    import numpy as np
+    n = len(y)
+    if target >= n or target < 4: return np.arange(n)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(0, n, target // 2 + 1).astype(np.int64)
+    picked = [0, n - 1]
+    for start, stop in zip(edges[:-1], edges[1:]):
+        if stop > start: picked.extend((start + int(np.argmin(y[start:stop])), start + int(np.argmax(y[start:stop]))))
+    return np.unique(picked)
+
+def downsample_series(series, target=None, method=None):
+    """
+    Sorted row indices to keep for line-chart `series` (a list of equal-length float arrays sharing one label axis),
+    or None when no reduction is needed.
+    """
+    import numpy as np
+    target = CHART_MAX_POINTS if target is None else target
+    method = method or CHART_DOWNSAMPLE_METHOD
+    n = len(series[0]) if series else 0
+    if not CHART_DOWNSAMPLE_ENABLED or n <= target: return None
+    pick = minmax_indices if method == "minmax" else lttb_indices
+    share = max(target // len(series), 4)
+    keep = np.unique(np.concatenate([pick(s, share) for s in series]))
+    _record("line_charts", n, len(keep))
+    return keep
+
+
+# --- Categorical charts ---
+def top_n_categories(labels, values, max_categories, other_label="Other"):
+    """
+    (labels, values, number of categories folded) keeping the max_categories - 1 largest values in their
+    original order and summing the rest into `other_label`. Unchanged when there are at most max_categories.
+    """
+    import numpy as np
+    n = len(labels)
+    if not CHART_DOWNSAMPLE_ENABLED or n <= max_categories or max_categories < 2: return labels, values, 0
+    values = np.asarray(values, dtype=float)
+    keep = np.sort(np.argsort(-values, kind="stable")[:max_categories - 1])
+    mask = np.ones(n, dtype=bool); mask[keep] = False
+    folded = int(mask.sum())
+    new_labels = [labels[i] for i in keep.tolist()] + [f"{other_label} ({folded:,} more)"]
+    new_values = values[keep].tolist() + [float(values[mask].sum())]
+    _record("categorical_charts", n, len(new_labels))
+    return new_labels, new_values, folded
+
+
+# --- Scatter charts ---
+def sample_points(n, target=None):
+    """Evenly spaced row indices for a scatter chart of n points, or None when no reduction is needed."""
+    import numpy as np
+    target = CHART_MAX_POINTS if target is None else target
+    if not CHART_DOWNSAMPLE_ENABLED or n <= target: return None
+    keep = np.linspace(0, n - 1, target).astype(np.int64)
+    _record("scatter_charts", n, len(keep))
+    return keep
+
+
+if __name__ == "__main__":
+    import numpy as np
+    x = np.linspace(0, 40 * np.pi, 200_000)
+    y = np.sin(x) * 100 + np.linspace(0, 50, x.size); y[123_456] = 1_000 # One spike
+    for method in ("lttb", "minmax"):
+        keep = downsample_series([y], target=1000, method=method)
+        assert keep[0] == 0 and keep[-1] == y.size - 1 and len(keep) <= 1000 and np.all(np.diff(keep) > 0)
+        assert 123_456 in keep, f"{method} must keep the spike"
+    two = downsample_series([y, -y], target=1000)
+    assert len(two) <= 1000
+    labels, values, folded = top_n_categories([f"c{i}" for i in range(100)], list(range(100)), 10)
+    assert labels[:9] == [f"c{i}" for i in range(91, 100)] and labels[-1] == "Other (91 more)" and values[-1] == sum(range(91)) and folded == 91
+    assert top_n_categories(["a", "b"], [1, 2], 10) == (["a", "b"], [1, 2], 0)
+    assert len(sample_points(50_000, 1000)) == 1000 and sample_points(10, 1000) is None
+    print(get_downsample_stats())
+    print("Chart downsampling self-check passed.")
@@ -0,0 +1,188 @@
+# project_root/app/columnar.py
+"""
+Columnar view of a SQL result for analyzer_visualizer_node.
+
+sql_executor_node returns a ResultSet (one shared header plus row tuples), which is transposed once into per-column arrays. Column types
+are inferred from a sample (with a full scan only to confirm a numeric column), and the string
+and float forms of a column are computed once and cached, then reused for the table, the labels
+and the datasets. Type rules are unchanged from the original row-by-row get_column_types.
+numpy is imported by the methods that use it, so importing this module (and assistant_engine) doesn't load it.
+"""
+import os
+import re
+import sys
+from datetime import datetime, date
+from operator import itemgetter
+
+COLUMN_TYPE_SAMPLE_SIZE = int(os.environ.get("COLUMN_TYPE_SAMPLE_SIZE", 256))
+
+_NUMERIC_TYPES = (int, float)
+_DATE_NAME_TERMS = ["date", "year", "month", "time", "dt", "period"]
+_DATE_VALUE_RE = re.compile(r"^\d{4}(-\d{2}(-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?Z?)?)?)?)?$")
+
+
+def is_date_like(column_name_or_value):
+    if isinstance(column_name_or_value, str):
+        name = column_name_or_value.lower()
+        if any(term in name for term in _DATE_NAME_TERMS): return True
+        if _DATE_VALUE_RE.match(column_name_or_value): return True
+    elif isinstance(column_name_or_value, (datetime, date)):
+        return True
+    return False
+
+def _all_numeric(types):
+    return all(t is type(None) or issubclass(t, _NUMERIC_TYPES) for t in types)
+
+
+def estimate_row_bytes(rows, sample_size=32):
+    """Approximate in-memory size of `rows` (tuples), from the average of an evenly spaced sample."""
+    if not rows: return 0
+    step = max(1, len(rows) // sample_size)
+    sample = rows[::step][:sample_size]
+    sample_bytes = sum(sys.getsizeof(row) + sum(map(sys.getsizeof, row)) for row in sample)
+    return sample_bytes * len(rows) // len(sample)
+
+
+class ResultSet:
+    """
+    A fetched SQL result: the column names once and one tuple per row (instead of a dict per row).
+    `truncated` is set when the fetch stopped at a row or byte cap; `truncated_reason` is "row_cap" or "byte_cap".
+    """
+    __slots__ = ("headers", "rows", "truncated", "truncated_reason")
+
+    def __init__(self, headers, rows, truncated=False, truncated_reason=None):
+        self.headers = list(headers)
+        self.rows = rows
+        self.truncated = truncated
+        self.truncated_reason = truncated_reason
+
+    def __len__(self): return len(self.rows)
+
+    def records(self):
+        """The rows as dicts, for callers that still want the old shape (small results only)."""
+        return [dict(zip(self.headers, row)) for row in self.rows]
+
+    def __repr__(self): return f"ResultSet({self.headers!r}, {len(self.rows)} rows{', truncated' if self.truncated else ''})"
+
+
+class TableData(dict):
+    """
+    The raw_table payload ({"headers": [...], "rows": [[str, ...], ...]}). It serializes like a plain dict, and
+    it also carries the typed ResultColumns it was built from, for the columnar wire format (wire_format.py).
+    """
+
+    def __init__(self, headers, rows, columns=None):
+        super().__init__(headers=headers, rows=rows)
+        self.columns = columns
+
+
+class ResultColumns:
+    """Per-column arrays of a SQL result, with cached str / float conversions."""
+
+    def __init__(self, headers, columns):
+        self.headers = list(headers)
+        self.num_rows = len(columns[0]) if columns else 0
+        self._values = dict(zip(self.headers, columns)) # header -> tuple of the original Python values
+        self._strings = {}
+        self._floats = {}
+        self._types = None
+
+    @classmethod
+    def from_records(cls, records):
+        """From sql_executor_node's list of row dicts (all rows have the first row's keys)."""
+        if not records: return cls([], [])
+        headers = list(records[0].keys())
+        try:
+            getter = itemgetter(*headers)
+            rows = list(map(getter, records)) if len(headers) > 1 else [(v,) for v in map(getter, records)]
+        except KeyError: # Ragged rows: missing keys read as None, like row.get(h)
+            rows = [tuple(r.get(h) for h in headers) for r in records]
+        return cls(headers, list(zip(*rows)))
+
+    @classmethod
+    def from_result(cls, result):
+        """From a ResultSet, or from a list of row dicts."""
+        if isinstance(result, ResultSet): return cls.from_rows(result.headers, result.rows)
+        return cls.from_records(result)
+
+    @classmethod
+    def from_rows(cls, headers, rows):
+        """From a header list and row tuples (e.g. straight from cursor.fetchmany)."""
+        return cls(headers, list(zip(*rows)) if rows else [() for _ in headers])
+
+    def values(self, header): return self._values[header]
+
+    def strings(self, header):
+        """str() of every value (None -> 'None'), computed once per column."""
+        if header not in self._strings: self._strings[header] = list(map(str, self._values[header]))
+        return self._strings[header]
+
+    def _float_array(self, header):
+        """float64 array of a numeric column with None as nan, converted once."""
+        import numpy as np
+        key = (header, "raw")
+        if key not in self._floats: self._floats[key] = np.array(self._values[header], dtype=float)
+        return self._floats[key]
+
+    def floats(self, header):
+        """float64 array of a numeric column with None as 0.0 (the old `float(v or 0)`)."""
+        import numpy as np
+        if header not in self._floats:
+            arr = self._float_array(header)
+            self._floats[header] = np.where(np.isnan(arr), 0.0, arr)
+        return self._floats[header]
+
+    def table_rows(self):
+        """Table rows as lists of strings, in header order."""
+        return list(map(list, zip(*(self.strings(h) for h in self.headers)))) if self.headers else []
+
+    def argsort_by_string(self, header):
+        """Stable order of the rows by the column's str() value (the old sorted(..., key=str(row.get(col))))."""
+        import numpy as np
+        return np.argsort(np.array(self.strings(header), dtype=str), kind="stable")
+
+    def _is_numeric_column(self, values):
+        sample_types = set(map(type, values[:COLUMN_TYPE_SAMPLE_SIZE]))
+        if not _all_numeric(sample_types): return False # Decided by the sample
+        return len(values) <= COLUMN_TYPE_SAMPLE_SIZE or _all_numeric(set(map(type, values))) # Confirm with a full scan
+
+    def column_types(self):
+        """{header: "numeric" | "categorical_year" | "date_like" | "categorical"}, same rules as the old get_column_types."""
+        import numpy as np
+        if self._types is not None: return self._types
+        types = {}
+        for header in self.headers:
+            values = self._values[header]
+            if not values: continue
+            is_numeric_col = self._is_numeric_column(values)
+            is_date_by_name = is_date_like(header)
+            is_date_by_value = False
+            first = values[0]
+            if not is_date_by_name and isinstance(first, str) and is_date_like(first):
+                date_like_count = sum(1 for v in values[:5] if is_date_like(str(v)))
+                is_date_by_value = date_like_count >= min(3, len(values))
+            is_year = False
+            if "year" in header.lower() and is_numeric_col:
+                arr = self._float_array(header) # None -> nan, ignored below
+                years = np.trunc(arr[~np.isnan(arr)])
+                is_year = bool(np.all((years > 1900) & (years < 2100)))
+            if is_year: types[header] = "categorical_year"
+            elif is_numeric_col: types[header] = "numeric"
+            elif is_date_by_name or is_date_by_value: types[header] = "date_like"
+            else: types[header] = "categorical"
+        self._types = types
+        return types
+
+
+if __name__ == "__main__":
+    records = [{"ShipmentYear": 2021 + i % 3, "Cost": (i * 1.5 if i % 7 else None), "Region": f"R{i % 4}", "Day": f"2024-01-{i % 28 + 1:02d}"} for i in range(1000)]
+    cols = ResultColumns.from_records(records)
+    assert cols.column_types() == {"ShipmentYear": "categorical_year", "Cost": "numeric", "Region": "categorical", "Day": "date_like"}, cols.column_types()
+    assert cols.table_rows()[0] == [str(v) for v in records[0].values()]
+    assert cols.floats("Cost").tolist() == [float(r["Cost"] or 0) for r in records]
+    mixed = [{"v": 1}] * 300 + [{"v": "x"}]
+    assert ResultColumns.from_records(mixed).column_types()["v"] == "categorical", "full scan must catch a late non-numeric value"
+    result = ResultSet(["ShipmentYear", "Cost"], [(r["ShipmentYear"], r["Cost"]) for r in records])
+    assert ResultColumns.from_result(result).floats("Cost").tolist() == cols.floats("Cost").tolist() and result.records()[1] == {"ShipmentYear": 2022, "Cost": 1.5}
+    assert 0 < estimate_row_bytes(result.rows) < 10 * 1024 * 1024
+    print("ResultColumns self-check passed.")
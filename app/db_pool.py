@@ -0,0 +1,238 @@
+# project_root/app/db_pool.py
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# --- Configuration (read from .env like the DB_* connection settings) ---
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 5))
+DB_POOL_MAX_IDLE_SECONDS = float(os.environ.get("DB_POOL_MAX_IDLE_SECONDS", 300))
+DB_POOL_CHECKOUT_TIMEOUT = float(os.environ.get("DB_POOL_CHECKOUT_TIMEOUT", 30))
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.environ.get("DB_POOL_HEALTH_CHECK_INTERVAL", 30))
+DB_QUERY_TIMEOUT = int(os.environ.get("DB_QUERY_TIMEOUT", 60))
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection could be checked out within the checkout timeout."""
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of DB-API connections (pyodbc in production).
+
+    - At most `max_size` connections are open at once; callers beyond that wait.
+    - Connections idle for longer than `max_idle_seconds` are closed instead of reused.
+    - Connections idle for longer than `health_check_interval` are pinged on checkout
+      and replaced if the ping fails.
+    - `query_timeout` is applied to every new connection (pyodbc `Connection.timeout`).
+    """
+
+    def __init__(self, factory, max_size=DB_POOL_SIZE, max_idle_seconds=DB_POOL_MAX_IDLE_SECONDS,
+                 checkout_timeout=DB_POOL_CHECKOUT_TIMEOUT, health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+                 query_timeout=DB_QUERY_TIMEOUT, health_check_query="SELECT 1"):
+        if max_size < 1: raise ValueError("max_size must be at least 1")
+        self._factory = factory
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.checkout_timeout = checkout_timeout
+        self.health_check_interval = health_check_interval
+        self.query_timeout = query_timeout
+        self.health_check_query = health_check_query
+        self._idle = deque() # (conn, last_returned_at); most recently returned on the right
+        self._open_count = 0
+        self._cond = threading.Condition(threading.Lock())
+        self._stats = {
+            "checkouts": 0, "waits": 0, "timeouts": 0,
+            "total_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+            "created": 0, "reused": 0, "closed_idle": 0,
+            "failed_health_checks": 0, "discarded": 0,
+        }
+
+    # --- Internal helpers ---
+    def _create(self):
+        conn = self._factory()
+        if self.query_timeout:
+            try: conn.timeout = self.query_timeout
+            except Exception as e: print(f"Warning: could not set query timeout on connection: {e}")
+        return conn
+
+    def _close_quietly(self, conn):
+        try: conn.close()
+        except Exception: pass
+
+    def _is_healthy(self, conn):
+        cursor = None
+        try:
+            cursor = conn.cursor()
+            cursor.execute(self.health_check_query)
+            cursor.fetchone()
+            return True
+        except Exception as e:
+            print(f"DB pool health check failed: {e}")
+            return False
+        finally:
+            if cursor is not None:
+                try: cursor.close()
+                except Exception: pass
+
+    def _evict_idle_locked(self, now):
+        """Closes connections that sat idle past max_idle_seconds. Caller holds the lock."""
+        evicted = []
+        while self._idle and now - self._idle[0][1] > self.max_idle_seconds:
+            evicted.append(self._idle.popleft()[0])
+        self._open_count -= len(evicted)
+        self._stats["closed_idle"] += len(evicted)
+        return evicted
+
+    # --- Public API ---
+    def acquire(self):
+        """Checks out a connection, waiting up to checkout_timeout if the pool is exhausted."""
+        started = time.monotonic()
+        deadline = started + self.checkout_timeout
+        waited = False
+        while True:
+            conn = None; idle_for = 0.0; create_new = False
+            with self._cond:
+                now = time.monotonic()
+                to_close = self._evict_idle_locked(now)
+                while True:
+                    if self._idle:
+                        conn, returned_at = self._idle.pop()
+                        idle_for = now - returned_at
+                        break
+                    if self._open_count < self.max_size:
+                        self._open_count += 1; create_new = True
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"Timed out after {self.checkout_timeout}s waiting for a DB connection (pool size {self.max_size}).")
+                    waited = True
+                    self._cond.wait(remaining)
+                    now = time.monotonic()
+            for stale in to_close: self._close_quietly(stale)
+
+            if create_new:
+                try: conn = self._create()
+                except Exception:
+                    with self._cond:
+                        self._open_count -= 1; self._cond.notify()
+                    raise
+                self._record_checkout(started, waited, created=True)
+                return conn
+
+            if idle_for > self.health_check_interval and not self._is_healthy(conn):
+                self._close_quietly(conn)
+                with self._cond:
+                    self._open_count -= 1
+                    self._stats["failed_health_checks"] += 1
+                    self._cond.notify()
+                continue # Retry: reuse another idle connection or open a fresh one
+            self._record_checkout(started, waited, created=False)
+            return conn
+
+    def _record_checkout(self, started, waited, created):
+        wait_seconds = time.monotonic() - started
+        with self._cond:
+            self._stats["checkouts"] += 1
+            self._stats["created" if created else "reused"] += 1
+            if waited: self._stats["waits"] += 1
+            self._stats["total_wait_seconds"] += wait_seconds
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], wait_seconds)
+
+    def release(self, conn, discard=False):
+        """Returns a connection to the pool. Broken connections should be released with discard=True."""
+        if not discard:
+            try: conn.rollback() # End any implicit transaction left open by the caller
+            except Exception: discard = True
+        if discard:
+            self._close_quietly(conn)
+            with self._cond:
+                self._open_count -= 1
+                self._stats["discarded"] += 1
+                self._cond.notify()
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager: `with pool.connection() as conn: ...`. Discards the connection if the caller raises."""
+        conn = self.acquire()
+        failed = False
+        try:
+            yield conn
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(conn, discard=failed and not self._is_healthy(conn))
+
+    def close_all(self):
+        """Closes every idle connection. Checked-out connections are closed when released with discard=True."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._open_count -= len(idle)
+        for conn in idle: self._close_quietly(conn)
+
+    def get_stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["open"] = self._open_count
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._open_count - len(self._idle)
+            stats["max_size"] = self.max_size
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+
+if __name__ == "__main__":
+    # Self-check with a fake connection factory (no database required)
+    class FakeCursor:
+        def __init__(self, conn): self.conn = conn
+        def execute(self, sql):
+            if self.conn.broken: raise RuntimeError("connection reset")
+            return self
+        def fetchone(self): return (1,)
+        def close(self): pass
+
+    class FakeConnection:
+        created = 0
+        def __init__(self):
+            FakeConnection.created += 1
+            self.broken = False; self.closed = False; self.timeout = 0
+        def cursor(self): return FakeCursor(self)
+        def rollback(self):
+            if self.broken: raise RuntimeError("connection reset")
+        def close(self): self.closed = True
+
+    print("--- Testing ConnectionPool with a fake factory ---")
+    pool = ConnectionPool(FakeConnection, max_size=2, max_idle_seconds=0.2, checkout_timeout=0.2, health_check_interval=0, query_timeout=15)
+    c1 = pool.acquire(); assert c1.timeout == 15, "query timeout not applied"
+    pool.release(c1)
+    c2 = pool.acquire(); assert c2 is c1, "idle connection should be reused"
+    c3 = pool.acquire()
+    try:
+        pool.acquire(); raise AssertionError("pool should be exhausted")
+    except PoolTimeoutError: print("Exhausted pool timed out as expected.")
+    pool.release(c2); pool.release(c3)
+
+    c3.broken = True # Fails the health check on next checkout
+    c4 = pool.acquire(); assert c4 is not c3 and c3.closed, "unhealthy connection should be replaced"
+    pool.release(c4)
+
+    time.sleep(0.3)
+    c5 = pool.acquire(); assert c5 is not c4 and c4.closed, "idle connection should be evicted"
+    pool.release(c5)
+
+    holder = pool.acquire(); other = pool.acquire()
+    threading.Timer(0.05, pool.release, args=(holder,)).start()
+    waited_conn = pool.acquire(); assert waited_conn is holder
+    pool.release(waited_conn); pool.release(other)
+    pool.close_all()
+    print(f"Pool stats: {pool.get_stats()}")
+    assert pool.get_stats()["open"] == 0 and pool.get_stats()["waits"] >= 1
+    print("ConnectionPool self-check passed.")
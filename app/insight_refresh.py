@@ -0,0 +1,122 @@
+# project_root/app/insight_refresh.py
+"""
+Background refresh of saved insights from their stored SQL.
+
+An insight saved from a chat answer keeps that answer's SQL (assistant_engine.get_answer_sql) and a refresh
+interval (insights_store.insight_refresh). A daemon thread wakes every INSIGHT_REFRESH_POLL_SECONDS, claims the
+insights that are due, and groups them by canonical SQL (sql_preflight.canonicalize_sql), so each distinct query
+runs once however many insights share it. The query goes through pre-flight and sql_executor_node (no schema
+retrieval, no LLM); only the analyzer is then re-run per insight, with the insight's own question so it gets the
+same chart type. The new chart / table is written back into the insight, so /insights serves it precomputed.
+"""
+import os
+import time
+import threading
+
+if __name__ == "__main__" and __package__ is None:
+    import assistant_engine as engine
+    from insights_store import get_insights_store
+    from sql_preflight import canonicalize_sql, preflight_sql
+    from schema_index import load_compiled_schema_or_none
+else:
+    from . import assistant_engine as engine
+    from .insights_store import get_insights_store
+    from .sql_preflight import canonicalize_sql, preflight_sql
+    from .schema_index import load_compiled_schema_or_none
+
+# --- Configuration ---
+INSIGHT_REFRESH_ENABLED = os.environ.get("INSIGHT_REFRESH_ENABLED", "true").lower() == "true"
+INSIGHT_REFRESH_DEFAULT_SECONDS = float(os.environ.get("INSIGHT_REFRESH_DEFAULT_SECONDS", 3600))
+INSIGHT_REFRESH_MIN_SECONDS = float(os.environ.get("INSIGHT_REFRESH_MIN_SECONDS", 300))
+INSIGHT_REFRESH_POLL_SECONDS = float(os.environ.get("INSIGHT_REFRESH_POLL_SECONDS", 30))
+INSIGHT_REFRESH_MAX_PER_CYCLE = int(os.environ.get("INSIGHT_REFRESH_MAX_PER_CYCLE", 50))
+INSIGHT_REFRESH_LEASE_SECONDS = 900 # A claimed insight is retried after this long if its refresh never finished
+ANSWER_SQL_PURGE_SECONDS = 3600 # How often the loop drops expired answer SQL (assistant_engine.purge_answer_sql)
+
+_stats = {"cycles": 0, "insights_refreshed": 0, "queries_executed": 0, "queries_shared": 0, "errors": 0}
+_stats_lock = threading.Lock()
+
+def _bump(name, amount=1):
+    with _stats_lock: _stats[name] += amount
+
+def get_refresh_stats():
+    with _stats_lock: return dict(_stats)
+
+def refresh_interval(requested=None):
+    """The refresh interval for a saved insight: `requested` seconds (at least INSIGHT_REFRESH_MIN_SECONDS) or the default."""
+    try: requested = float(requested) if requested is not None else None
+    except (TypeError, ValueError): requested = None
+    return max(requested, INSIGHT_REFRESH_MIN_SECONDS) if requested and requested > 0 else INSIGHT_REFRESH_DEFAULT_SECONDS
+
+
+def _execute(sql):
+    """(executor state, None) for one stored query, or (None, error message)."""
+    checked_sql, error = preflight_sql(sql, load_compiled_schema_or_none(), top_limit=engine.SQL_MAX_ROWS + 1)
+    if error: return None, f"Stored SQL no longer passes pre-flight: {error}"
+    state = engine._build_initial_state("")
+    state["generated_sql"] = checked_sql
+    state = engine.sql_executor_node(state, {"configurable": {"fresh_result": True}}) # A cached result isn't a refresh; the new one replaces it
+    if state.get("sql_query_result") is None: return None, state.get("error_message") or "The query returned no result."
+    return state, None
+
+def _materialize(insight, executed):
+    """The payload fields of `insight` re-computed from the executed query's result (analyzer only)."""
+    state = engine.intent_detection_node(engine._build_initial_state(insight.get("query") or ""))
+    state.update(generated_sql=executed["generated_sql"], sql_query_result=executed["sql_query_result"], analysis_summary=executed.get("analysis_summary"), error_message=None)
+    state = engine.analyzer_visualizer_node(state)
+    chart, table = state.get("chart_json"), state.get("table_data")
+    updates = {"refreshed_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+    if insight.get("type") != "table" and chart:
+        updates.update(type=chart.get("type"), data=chart.get("data"), options=chart.get("options"))
+    elif table:
+        updates.update(type="table", data={"headers": table["headers"], "rows": table["rows"]}, options=None)
+    return updates
+
+def refresh_due_insights(store=None, now=None):
+    """Runs one refresh cycle; returns the number of insights refreshed."""
+    store = store or get_insights_store(); now = time.time() if now is None else now
+    due = store.claim_due_refreshes(now, INSIGHT_REFRESH_MAX_PER_CYCLE, INSIGHT_REFRESH_LEASE_SECONDS)
+    _bump("cycles")
+    if not due: return 0
+    groups = {}
+    for item in due: groups.setdefault(canonicalize_sql(item["sql"])[0], []).append(item)
+    refreshed = 0
+    for items in groups.values():
+        executed, error = _execute(items[0]["sql"])
+        _bump("queries_executed"); _bump("queries_shared", len(items) - 1)
+        for item in items:
+            updates, item_error = None, error # The query error is shared by the group, an analyzer error is not
+            if item_error is None:
+                try: updates = _materialize(item["insight"], executed)
+                except Exception as e: item_error = f"Analyzer failed: {e}"
+            if item_error is not None:
+                print(f"Insight refresh failed for {item['insight_id']}: {item_error}"); _bump("errors")
+                store.apply_refresh(item["workplace_id"], item["insight_id"], None, error=item_error)
+            elif store.apply_refresh(item["workplace_id"], item["insight_id"], updates): refreshed += 1
+    _bump("insights_refreshed", refreshed)
+    print(f"Insight refresh: {refreshed}/{len(due)} insights from {len(groups)} queries.")
+    return refreshed
+
+
+_thread = None
+_thread_lock = threading.Lock()
+
+def start_insight_refresher():
+    """Starts the daemon refresh thread once per process (no-op when INSIGHT_REFRESH_ENABLED is false); it also purges expired answer SQL."""
+    global _thread
+    if not INSIGHT_REFRESH_ENABLED: return None
+    with _thread_lock:
+        if _thread is None:
+            def _loop():
+                next_purge = 0.0
+                while True:
+                    time.sleep(INSIGHT_REFRESH_POLL_SECONDS)
+                    try: refresh_due_insights()
+                    except Exception as e: print(f"Insight refresh cycle failed: {e}")
+                    if time.monotonic() >= next_purge:
+                        next_purge = time.monotonic() + ANSWER_SQL_PURGE_SECONDS
+                        try: engine.purge_answer_sql()
+                        except Exception as e: print(f"Answer SQL purge failed: {e}")
+            _thread = threading.Thread(target=_loop, name="insight-refresh", daemon=True)
+            _thread.start()
+    return _thread
@@ -0,0 +1,313 @@
+# project_root/app/insights_store.py
+import os
+import json
+import time
+import hashlib
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+INSIGHTS_DB_PATH = os.environ.get("INSIGHTS_DB_PATH", os.path.join(os.path.dirname(__file__), "..", "insights.db"))
+LEGACY_INSIGHTS_JSON_PATH = os.path.join(os.path.dirname(__file__), "..", "insights.json")
+
+DEFAULT_WORKPLACE_ID = "default_wp_001"
+DEFAULT_WORKPLACE_NAME = "My General Insights"
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS workplaces (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_workplaces_name ON workplaces(name);
+CREATE TABLE IF NOT EXISTS insights (
+    workplace_id TEXT NOT NULL REFERENCES workplaces(id) ON DELETE CASCADE,
+    id TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    blob_hash TEXT, -- blobs.hash of the chart / table body; payload then holds only the metadata
+    PRIMARY KEY (workplace_id, id)
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS insight_refresh (
+    workplace_id TEXT NOT NULL,
+    insight_id TEXT NOT NULL,
+    sql TEXT NOT NULL,
+    interval_seconds REAL NOT NULL,
+    next_refresh_at REAL NOT NULL,
+    refreshed_at REAL,
+    last_error TEXT,
+    PRIMARY KEY (workplace_id, insight_id),
+    FOREIGN KEY (workplace_id, insight_id) REFERENCES insights(workplace_id, id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_insight_refresh_due ON insight_refresh(next_refresh_at);
+CREATE TABLE IF NOT EXISTS answer_sql (
+    insight_id TEXT PRIMARY KEY,
+    sql TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_answer_sql_created_at ON answer_sql(created_at);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+BLOB_FIELDS = ("data", "options") # The heavy part of an insight (chart data / table rows), stored as a content-addressed blob
+
+
+def split_insight(insight):
+    """(metadata dict, blob body text or None, its sha256 or None) of an insight payload."""
+    meta = {k: v for k, v in insight.items() if k not in BLOB_FIELDS and k not in ("payload_hash", "payload_bytes")}
+    if not any(insight.get(k) is not None for k in BLOB_FIELDS): return meta, None, None
+    body = json.dumps({"type": insight.get("type"), **{k: insight.get(k) for k in BLOB_FIELDS}}, sort_keys=True, separators=(",", ":"))
+    blob_hash = hashlib.sha256(body.encode("utf-8")).hexdigest()
+    meta.update(payload_hash=blob_hash, payload_bytes=len(body))
+    return meta, body, blob_hash
+
+
+class InsightsStore:
+    """
+    SQLite (WAL mode) storage for workplaces and their saved insights.
+
+    Each insight is one row, so saving or deleting an insight touches only that row instead of
+    rewriting every stored insight. Workplaces and insights keep their insertion order (rowid).
+    On first use the legacy insights.json file is imported once; it is not written afterwards.
+    Insights saved with their SQL get an insight_refresh row: the schedule insight_refresh.py re-runs that SQL on.
+    That SQL comes from answer_sql, where every chat answer's SQL is recorded under its insight id (shared by all workers).
+    An insight's chart / table body lives in `blobs` under its sha256 (shared by identical insights, deleted with the
+    last insight using it); the insights row keeps the metadata, so listing a workplace doesn't read the bodies.
+    """
+
+    def __init__(self, db_path=INSIGHTS_DB_PATH, legacy_json_path=LEGACY_INSIGHTS_JSON_PATH):
+        self.db_path = db_path
+        self.legacy_json_path = legacy_json_path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA_SQL) # Outside _write(): executescript commits any open transaction
+        self._migrate_legacy_json()
+        self._migrate_blobs()
+        with self._write() as conn: self._ensure_default_workplace(conn)
+
+    # --- Connection handling ---
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None) # Autocommit; writes use explicit transactions
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """Serializes writers (across threads and processes) with BEGIN IMMEDIATE."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def _ensure_default_workplace(self, conn):
+        conn.execute("INSERT OR IGNORE INTO workplaces (id, name) VALUES (?, ?)", (DEFAULT_WORKPLACE_ID, DEFAULT_WORKPLACE_NAME))
+        active = conn.execute("SELECT value FROM meta WHERE name = 'activeWorkplaceId'").fetchone()
+        if not active or not conn.execute("SELECT 1 FROM workplaces WHERE id = ?", (active[0],)).fetchone():
+            first = conn.execute("SELECT id FROM workplaces ORDER BY rowid LIMIT 1").fetchone()
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('activeWorkplaceId', ?)", (first[0] if first else DEFAULT_WORKPLACE_ID,))
+
+    def _migrate_legacy_json(self):
+        """One-time import of insights.json ({"workplaces": {id: {"name", "insights": [...]}}, "activeWorkplaceId"})."""
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'legacy_json_migrated'").fetchone(): return
+            imported_workplaces = imported_insights = 0
+            if self.legacy_json_path and os.path.exists(self.legacy_json_path):
+                try:
+                    with open(self.legacy_json_path, 'r') as f:
+                        content = f.read()
+                    data = json.loads(content) if content.strip() else {}
+                    workplaces = data.get("workplaces", {}) if isinstance(data, dict) else {}
+                    if not isinstance(workplaces, dict): raise ValueError("'workplaces' is not a dictionary.")
+                    for workplace_id, workplace in workplaces.items():
+                        conn.execute("INSERT OR IGNORE INTO workplaces (id, name) VALUES (?, ?)", (workplace_id, workplace.get("name", workplace_id)))
+                        imported_workplaces += 1
+                        for insight in workplace.get("insights", []):
+                            if not isinstance(insight, dict) or not insight.get("id"): continue
+                            conn.execute("INSERT OR REPLACE INTO insights (workplace_id, id, payload) VALUES (?, ?, ?)", (workplace_id, insight["id"], json.dumps(insight)))
+                            imported_insights += 1
+                    if data.get("activeWorkplaceId") in workplaces:
+                        conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('activeWorkplaceId', ?)", (data["activeWorkplaceId"],))
+                    print(f"Migrated {imported_workplaces} workplaces and {imported_insights} insights from {self.legacy_json_path} into {self.db_path}.")
+                except (json.JSONDecodeError, ValueError, TypeError, AttributeError) as e:
+                    print(f"Warning: {self.legacy_json_path} is invalid or has wrong structure ({e}). Skipping migration.")
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('legacy_json_migrated', '1')")
+
+    def _migrate_blobs(self):
+        """One-time move of the chart / table bodies of existing insights (inline in payload) into blobs."""
+        conn = self._conn()
+        if "blob_hash" not in [row[1] for row in conn.execute("PRAGMA table_info(insights)")]:
+            try: conn.execute("ALTER TABLE insights ADD COLUMN blob_hash TEXT")
+            except sqlite3.OperationalError: pass # Added by another process in the meantime
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_insights_blob_hash ON insights(blob_hash)")
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'blobs_migrated'").fetchone(): return
+            rows = conn.execute("SELECT workplace_id, id, payload FROM insights WHERE blob_hash IS NULL").fetchall()
+            for workplace_id, insight_id, payload in rows: self._put_insight(conn, workplace_id, json.loads(payload), insight_id)
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('blobs_migrated', '1')")
+        if rows: print(f"Moved the chart / table bodies of {len(rows)} insights into content-addressed blobs.")
+
+    def _put_insight(self, conn, workplace_id, insight, insight_id=None):
+        """Writes one insight (metadata row + blob) and drops the blob it used before if nothing else uses it."""
+        meta, body, blob_hash = split_insight(insight)
+        if body is not None: conn.execute("INSERT OR IGNORE INTO blobs (hash, body, size) VALUES (?, ?, ?)", (blob_hash, body, len(body)))
+        old = conn.execute("SELECT blob_hash FROM insights WHERE workplace_id = ? AND id = ?", (workplace_id, insight_id or insight["id"])).fetchone()
+        conn.execute("INSERT INTO insights (workplace_id, id, payload, blob_hash) VALUES (?, ?, ?, ?) "
+                     "ON CONFLICT(workplace_id, id) DO UPDATE SET payload = excluded.payload, blob_hash = excluded.blob_hash",
+                     (workplace_id, insight_id or insight["id"], json.dumps(meta), blob_hash))
+        if old and old[0] and old[0] != blob_hash: self._drop_unused_blobs(conn, old[0])
+        return old is not None
+
+    def _drop_unused_blobs(self, conn, blob_hash=None):
+        if blob_hash: conn.execute("DELETE FROM blobs WHERE hash = ? AND NOT EXISTS (SELECT 1 FROM insights WHERE blob_hash = ?)", (blob_hash, blob_hash))
+        else: conn.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT blob_hash FROM insights WHERE blob_hash IS NOT NULL)")
+
+    def _load_insight(self, payload, body):
+        """The full insight (metadata + body fields) from a row's payload and its blob body."""
+        insight = json.loads(payload)
+        if body: insight.update({k: v for k, v in json.loads(body).items() if k in BLOB_FIELDS})
+        return insight
+
+    # --- Workplaces ---
+    def list_workplaces(self):
+        rows = self._conn().execute("SELECT id, name FROM workplaces ORDER BY rowid").fetchall()
+        return [{"id": workplace_id, "name": name} for workplace_id, name in rows]
+
+    def get_workplace(self, workplace_id):
+        row = self._conn().execute("SELECT id, name FROM workplaces WHERE id = ?", (workplace_id,)).fetchone()
+        return {"id": row[0], "name": row[1]} if row else None
+
+    def create_workplace(self, name):
+        """Returns the new workplace id, or None if a workplace with that name already exists."""
+        with self._write() as conn:
+            if conn.execute("SELECT 1 FROM workplaces WHERE name = ?", (name,)).fetchone(): return None
+            workplace_id = "wp_" + str(uuid.uuid4().hex[:8])
+            conn.execute("INSERT INTO workplaces (id, name) VALUES (?, ?)", (workplace_id, name))
+        return workplace_id
+
+    def count_workplaces(self):
+        return self._conn().execute("SELECT COUNT(*) FROM workplaces").fetchone()[0]
+
+    def delete_workplace(self, workplace_id):
+        """Deletes a workplace and its insights. Returns the deleted workplace's name, or None if it didn't exist."""
+        with self._write() as conn:
+            row = conn.execute("SELECT name FROM workplaces WHERE id = ?", (workplace_id,)).fetchone()
+            if not row: return None
+            conn.execute("DELETE FROM workplaces WHERE id = ?", (workplace_id,)) # Insights go with it (ON DELETE CASCADE)
+            self._drop_unused_blobs(conn)
+            self._ensure_default_workplace(conn)
+        return row[0]
+
+    # --- Insights ---
+    def list_insights(self, workplace_id, offset=0, limit=None):
+        """
+        Returns (metadata of the workplace's insights in save order, total count), or None if the workplace doesn't exist.
+        The metadata has payload_hash / payload_bytes instead of the chart / table body (see get_insight_payload).
+        """
+        conn = self._conn()
+        if not conn.execute("SELECT 1 FROM workplaces WHERE id = ?", (workplace_id,)).fetchone(): return None
+        total = conn.execute("SELECT COUNT(*) FROM insights WHERE workplace_id = ?", (workplace_id,)).fetchone()[0]
+        rows = conn.execute("SELECT payload FROM insights WHERE workplace_id = ? ORDER BY rowid LIMIT ? OFFSET ?",
+                            (workplace_id, -1 if limit is None else limit, offset)).fetchall()
+        return [json.loads(payload) for (payload,) in rows], total
+
+    def get_insight(self, workplace_id, insight_id):
+        """The full insight (metadata and body), or None."""
+        row = self._conn().execute("SELECT i.payload, b.body FROM insights i LEFT JOIN blobs b ON b.hash = i.blob_hash "
+                                   "WHERE i.workplace_id = ? AND i.id = ?", (workplace_id, insight_id)).fetchone()
+        return self._load_insight(*row) if row else None
+
+    def get_insight_payload(self, workplace_id, insight_id):
+        """(blob hash, body JSON text) of an insight's chart / table, (None, None) when it has none, or None if it doesn't exist."""
+        row = self._conn().execute("SELECT i.blob_hash, b.body FROM insights i LEFT JOIN blobs b ON b.hash = i.blob_hash "
+                                   "WHERE i.workplace_id = ? AND i.id = ?", (workplace_id, insight_id)).fetchone()
+        return (row[0], row[1]) if row else None
+
+    def save_insight(self, workplace_id, insight, sql=None, refresh_seconds=None):
+        """
+        Inserts or updates (in place) one insight. Returns "created", "updated", or None if the workplace doesn't exist.
+        With `sql`, the insight is (re)scheduled to be refreshed from it every `refresh_seconds`.
+        """
+        with self._write() as conn:
+            if not conn.execute("SELECT 1 FROM workplaces WHERE id = ?", (workplace_id,)).fetchone(): return None
+            existed = self._put_insight(conn, workplace_id, insight)
+            if sql and refresh_seconds:
+                conn.execute("INSERT OR REPLACE INTO insight_refresh (workplace_id, insight_id, sql, interval_seconds, next_refresh_at) VALUES (?, ?, ?, ?, ?)",
+                             (workplace_id, insight["id"], sql, refresh_seconds, time.time() + refresh_seconds)) # Saved data is fresh now
+        return "updated" if existed else "created"
+
+    # --- SQL behind recent chat answers (assistant_engine._make_insight_id) ---
+    def remember_answer_sql(self, insight_id, sql, now=None):
+        """Records the SQL of a chat answer under its insight id (one autocommit insert; expired records go in purge_answer_sql)."""
+        self._conn().execute("INSERT OR REPLACE INTO answer_sql (insight_id, sql, created_at) VALUES (?, ?, ?)", (insight_id, sql, time.time() if now is None else now))
+
+    def purge_answer_sql(self, ttl_seconds, now=None):
+        """Deletes answer SQL records older than `ttl_seconds`; returns how many."""
+        now = time.time() if now is None else now
+        with self._write() as conn: return conn.execute("DELETE FROM answer_sql WHERE created_at < ?", (now - ttl_seconds,)).rowcount
+
+    def get_answer_sql(self, insight_id, ttl_seconds, now=None):
+        now = time.time() if now is None else now
+        row = self._conn().execute("SELECT sql FROM answer_sql WHERE insight_id = ? AND created_at >= ?", (insight_id, now - ttl_seconds)).fetchone()
+        return row[0] if row else None
+
+    # --- Scheduled refreshes (insight_refresh.py) ---
+    def claim_due_refreshes(self, now, limit, lease_seconds):
+        """
+        Insights whose refresh is due, as [{"workplace_id", "insight_id", "sql", "interval_seconds", "insight"}].
+        Their next_refresh_at is pushed `lease_seconds` ahead, so another process's refresher doesn't take them too.
+        """
+        with self._write() as conn:
+            rows = conn.execute("SELECT r.workplace_id, r.insight_id, r.sql, r.interval_seconds, i.payload FROM insight_refresh r "
+                                "JOIN insights i ON i.workplace_id = r.workplace_id AND i.id = r.insight_id "
+                                "WHERE r.next_refresh_at <= ? ORDER BY r.next_refresh_at LIMIT ?", (now, limit)).fetchall()
+            conn.executemany("UPDATE insight_refresh SET next_refresh_at = ? WHERE workplace_id = ? AND insight_id = ?",
+                             [(now + lease_seconds, workplace_id, insight_id) for workplace_id, insight_id, *_ in rows])
+        return [{"workplace_id": workplace_id, "insight_id": insight_id, "sql": sql, "interval_seconds": interval, "insight": json.loads(payload)}
+                for workplace_id, insight_id, sql, interval, payload in rows]
+
+    def apply_refresh(self, workplace_id, insight_id, updates, error=None, now=None):
+        """Merges `updates` into the insight's payload (unless there was an `error`) and schedules its next refresh."""
+        now = time.time() if now is None else now
+        with self._write() as conn:
+            row = conn.execute("SELECT i.payload, b.body, r.interval_seconds FROM insights i JOIN insight_refresh r ON r.workplace_id = i.workplace_id AND r.insight_id = i.id "
+                               "LEFT JOIN blobs b ON b.hash = i.blob_hash WHERE i.workplace_id = ? AND i.id = ?", (workplace_id, insight_id)).fetchone()
+            if not row: return False # Deleted while it was being refreshed
+            if error is None: self._put_insight(conn, workplace_id, dict(self._load_insight(row[0], row[1]), **updates), insight_id)
+            conn.execute("UPDATE insight_refresh SET next_refresh_at = ?, refreshed_at = COALESCE(?, refreshed_at), last_error = ? WHERE workplace_id = ? AND insight_id = ?",
+                         (now + row[2], None if error else now, error, workplace_id, insight_id))
+        return True
+
+    def delete_insight(self, workplace_id, insight_id):
+        with self._write() as conn:
+            row = conn.execute("SELECT blob_hash FROM insights WHERE workplace_id = ? AND id = ?", (workplace_id, insight_id)).fetchone()
+            if not row: return False
+            conn.execute("DELETE FROM insights WHERE workplace_id = ? AND id = ?", (workplace_id, insight_id))
+            if row[0]: self._drop_unused_blobs(conn, row[0])
+            return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_insights_store():
+    """The shared InsightsStore, opened (and the legacy JSON migrated) on first use rather than at import."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None: _store = InsightsStore()
+    return _store
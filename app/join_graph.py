@@ -0,0 +1,145 @@
+# project_root/app/join_graph.py
+"""
+Join graph over the schema's foreign keys (referenceTableName / refColumnName in the schema CSV).
+
+Tables are nodes and FK links are edges. Shortest join paths between every pair of tables are
+precomputed once per compiled schema, so schema_retriever_node can hand the SQL generator the
+minimal set of joins connecting the tables it retrieved (plus their key columns) as one compact
+schema part, instead of leaving the LLM to piece joins together from loose column descriptions.
+"""
+import os
+import re
+import threading
+from collections import defaultdict, deque
+
+# --- Configuration ---
+JOIN_GRAPH_ENABLED = os.environ.get("JOIN_GRAPH_ENABLED", "true").lower() == "true"
+JOIN_GRAPH_MAX_KEY_COLUMNS = int(os.environ.get("JOIN_GRAPH_MAX_KEY_COLUMNS", 12)) # Key columns listed per table
+
+_TABLE_IN_DOCUMENT_RE = re.compile(r"^Table: (.+?)(?:, Column: |\. Description: )")
+
+
+def tables_in_documents(documents):
+    """Table names of schema documents ("Table: X. Description: ..." / "Table: X, Column: ..."), in first-seen order."""
+    tables = []
+    for doc in documents or []:
+        match = _TABLE_IN_DOCUMENT_RE.match(doc or "")
+        if match and match.group(1) not in tables: tables.append(match.group(1))
+    return tables
+
+
+class JoinGraph:
+    """FK graph of a CompiledSchema with all-pairs shortest join paths (BFS from every table)."""
+
+    def __init__(self, compiled_schema):
+        self.tables = list(compiled_schema.table_names)
+        by_short_name = {name.rsplit(".", 1)[-1].upper(): name for name in self.tables}
+        # Some CSVs reference tables without their schema prefix (SHIPMENT_STOP vs OTM.SHIPMENT_STOP)
+        resolve = lambda name: name if name in self.tables else by_short_name.get(name.rsplit(".", 1)[-1].upper(), name)
+
+        self._links = defaultdict(list) # frozenset({a, b}) -> ["a.col = b.col", ...]
+        self._adjacency = defaultdict(set)
+        self.key_columns = {} # table -> PK/FK column names, the table's own ID column(s) first, then FKs
+        for t_idx, (start, stop) in enumerate(compiled_schema.table_column_ranges()):
+            table = self.tables[t_idx]
+            short_name = table.rsplit(".", 1)[-1].upper()
+            ranked_keys = {}
+            for c in range(start, stop):
+                column = compiled_schema.col_names[c]
+                is_fk = compiled_schema.col_fk_tables[c] is not None
+                if compiled_schema.col_is_pk[c] or is_fk:
+                    ranked_keys.setdefault(column, 0 if column.upper().startswith(short_name + "_") else 1 if is_fk else 2)
+                if not is_fk: continue
+                ref_table = resolve(compiled_schema.col_fk_tables[c])
+                if ref_table == table: continue
+                condition = f"{table}.{column} = {ref_table}.{compiled_schema.col_fk_columns[c]}"
+                reverse = f"{ref_table}.{compiled_schema.col_fk_columns[c]} = {table}.{column}" # Both tables may declare the same link
+                pair = frozenset((table, ref_table))
+                if condition not in self._links[pair] and reverse not in self._links[pair]: self._links[pair].append(condition)
+                self._adjacency[table].add(ref_table); self._adjacency[ref_table].add(table)
+            if ranked_keys: self.key_columns[table] = sorted(ranked_keys, key=lambda column: ranked_keys[column]) # Stable: CSV order within a rank
+
+        self._parents = {} # source -> {table: previous table on the shortest path from source}
+        for source in sorted(self._adjacency):
+            parents = {source: None}
+            queue = deque([source])
+            while queue:
+                node = queue.popleft()
+                for neighbour in sorted(self._adjacency[node]):
+                    if neighbour not in parents:
+                        parents[neighbour] = node; queue.append(neighbour)
+            self._parents[source] = parents
+
+    @property
+    def num_links(self): return len(self._links)
+
+    def shortest_path(self, source, target):
+        """Tables on the shortest join path from source to target (inclusive), or None if they aren't connected."""
+        if source == target: return [source]
+        parents = self._parents.get(source)
+        if not parents or target not in parents: return None
+        path = [target]
+        while path[-1] != source: path.append(parents[path[-1]])
+        return path[::-1]
+
+    def join_path(self, tables):
+        """
+        Join conditions connecting `tables`: grows a tree from the first table, each time attaching the
+        closest remaining table by its shortest path (a greedy Steiner tree). Tables not connected to the
+        tree start a tree of their own. Returns a list of (table_a, table_b, [conditions]) links.
+        """
+        tables = [t for t in dict.fromkeys(tables) if t in self._adjacency]
+        if len(tables) < 2: return []
+        tree = {tables[0]}
+        remaining = set(tables[1:])
+        links = []
+        while remaining:
+            best = None
+            for target in sorted(remaining):
+                for node in sorted(tree):
+                    path = self.shortest_path(node, target)
+                    if path and (best is None or len(path) < len(best)): best = path
+            if best is None: # Nothing left is connected to this tree: start another one
+                seed = sorted(remaining)[0]; tree.add(seed); remaining.discard(seed); continue
+            for a, b in zip(best, best[1:]):
+                if b not in tree: links.append((a, b, self._links[frozenset((a, b))]))
+                tree.add(b)
+            remaining -= tree
+        return links
+
+    def describe(self, tables):
+        """Schema part text with the join path and key columns for `tables`, or None if there's nothing to add."""
+        tables = list(dict.fromkeys(tables))
+        lines = []
+        links = self.join_path(tables)
+        if links:
+            lines.append("Join path between the retrieved tables (use these conditions when joining):")
+            for a, b, conditions in links: lines.append(f"  {a} <-> {b}: " + " OR ".join(conditions))
+        key_lines = [f"  {t}: " + ", ".join(self.key_columns[t][:JOIN_GRAPH_MAX_KEY_COLUMNS]) for t in tables if self.key_columns.get(t)]
+        if key_lines: lines.append("Key columns:"); lines.extend(key_lines)
+        return "\n".join(lines) if lines else None
+
+
+_graph_cache = {} # id(compiled schema) -> (compiled schema, graph)
+_graph_lock = threading.Lock()
+
+def get_join_graph(compiled_schema):
+    """The JoinGraph for a CompiledSchema, built once per compiled schema (i.e. per CSV version)."""
+    with _graph_lock:
+        cached = _graph_cache.get(id(compiled_schema))
+        if cached is not None and cached[0] is compiled_schema: return cached[1]
+        graph = JoinGraph(compiled_schema)
+        _graph_cache.clear() # Only the current schema version is kept
+        _graph_cache[id(compiled_schema)] = (compiled_schema, graph)
+        return graph
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.insert(0, os.path.dirname(__file__))
+    from schema_compiler import compile_schema_csv
+    csv_path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "schema2.csv")
+    graph = JoinGraph(compile_schema_csv(csv_path))
+    print(f"{len(graph.tables)} tables, {graph.num_links} linked table pairs")
+    print(graph.describe(graph.tables) or "No FK links found.")
+    assert tables_in_documents(["Table: OTM.SHIPMENT, Column: START_TIME. Type: datetime.", "Table: OTM.LOCATION. Description: x"]) == ["OTM.SHIPMENT", "OTM.LOCATION"]
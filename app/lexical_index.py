@@ -0,0 +1,142 @@
+# project_root/app/lexical_index.py
+"""
+In-memory lexical index over the schema documents (the same table/column documents that are embedded
+into Chroma by schema_index.py).
+
+Two lookups:
+- exact identifier matches: OTM-style names written in the question (START_TIME, OTM.SHIPMENT, ...)
+  map straight to their column/table documents;
+- BM25 over the document text, with identifiers also split on "_" and ".".
+
+schema_index.retrieve_schema_parts merges these with the vector search results, and skips the
+embedding call entirely when every identifier in the question matched exactly.
+"""
+import os
+import re
+import math
+import threading
+from collections import defaultdict, Counter
+
+# --- Configuration ---
+LEXICAL_INDEX_ENABLED = os.environ.get("LEXICAL_INDEX_ENABLED", "true").lower() == "true"
+LEXICAL_MIN_EXACT_MATCHES = int(os.environ.get("LEXICAL_MIN_EXACT_MATCHES", 1)) # Exact identifier hits needed to skip the vector search
+BM25_K1 = 1.2
+BM25_B = 0.75
+EXACT_MATCH_BOOST = 10.0 # Added to the BM25 score per exact identifier a document matches
+
+STOPWORDS = frozenset("""a an and are as at be by can do does each for from give how i in is it list me my of on or over per
+please show tell than that the their there these this to using via was we what when where which who with within
+chart graph plot display""".split())
+
+_IDENTIFIER_RE = re.compile(r"\b[A-Za-z][A-Za-z0-9]*(?:[_.][A-Za-z0-9]+)+\b") # START_TIME, OTM.SHIPMENT, SOURCE_LOCATION_GID
+_WORD_RE = re.compile(r"[A-Za-z0-9_.]+")
+
+
+def _stem(token):
+    if len(token) > 4 and token.endswith("ies"): return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"): return token[:-1]
+    return token
+
+def tokenize(text):
+    """Lowercased terms; identifiers are kept whole and also split into their parts."""
+    terms = []
+    for word in _WORD_RE.findall(text or ""):
+        word = word.strip("._").lower()
+        if not word: continue
+        parts = [p for p in re.split(r"[_.]", word) if p]
+        if len(parts) > 1: terms.append(word)
+        terms.extend(_stem(p) for p in parts if p not in STOPWORDS)
+    return terms
+
+def extract_identifiers(text):
+    """Identifier-looking tokens (contain "_" or "."), lowercased, e.g. 'start_time', 'otm.shipment'."""
+    return [m.group(0).lower() for m in _IDENTIFIER_RE.finditer(text or "")]
+
+
+class LexicalSchemaIndex:
+    """Exact-name lookup plus BM25 over a fixed list of schema documents."""
+
+    def __init__(self, documents, metadatas):
+        self.documents = list(documents)
+        self.metadatas = list(metadatas)
+        self._exact = defaultdict(list) # identifier -> doc indices
+        self._postings = defaultdict(dict) # term -> {doc index: term frequency}
+        self._doc_lengths = []
+        for i, (doc, meta) in enumerate(zip(self.documents, self.metadatas)):
+            table_name = (meta.get("table_name") or "").lower()
+            if meta.get("type") == "column" and meta.get("column_name"):
+                column_name = meta["column_name"].lower()
+                self._exact[column_name].append(i)
+                self._exact[f"{table_name}.{column_name}"].append(i)
+            elif meta.get("type") == "table" and table_name:
+                self._exact[table_name].append(i)
+                short_name = table_name.rsplit(".", 1)[-1]
+                if "_" in short_name: self._exact[short_name].append(i) # Bare multi-word table names (SHIPMENT_STOP) are identifiers too
+            terms = tokenize(doc)
+            self._doc_lengths.append(len(terms))
+            for term, tf in Counter(terms).items(): self._postings[term][i] = tf
+        self._avg_length = (sum(self._doc_lengths) / len(self._doc_lengths)) if self._doc_lengths else 0.0
+        n = len(self.documents)
+        self._idf = {term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for term, p in self._postings.items()}
+
+    def __len__(self): return len(self.documents)
+
+    def exact_matches(self, query):
+        """{identifier: [doc indices]} for the identifiers in the query that name a table or column."""
+        return {ident: self._exact[ident] for ident in dict.fromkeys(extract_identifiers(query)) if ident in self._exact}
+
+    def bm25_scores(self, query):
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings: continue
+            idf = self._idf[term]
+            for i, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[i] / self._avg_length)
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, n_results=12):
+        """
+        Returns (ranked_documents, confident). `confident` is True when the query names at least
+        LEXICAL_MIN_EXACT_MATCHES identifiers and every identifier in it matched a table or column.
+        """
+        exact = self.exact_matches(query)
+        scores = self.bm25_scores(query)
+        for doc_indices in exact.values():
+            for i in doc_indices: scores[i] += EXACT_MATCH_BOOST
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))[:n_results]
+        identifiers = set(extract_identifiers(query))
+        confident = len(exact) >= max(LEXICAL_MIN_EXACT_MATCHES, 1) and len(exact) == len(identifiers)
+        return [self.documents[i] for i in ranked], confident
+
+
+_index_cache = {} # id(compiled schema) -> (compiled schema, index)
+_index_lock = threading.Lock()
+
+def get_lexical_index(compiled_schema):
+    """The LexicalSchemaIndex for a CompiledSchema, built once per compiled schema (i.e. per CSV version)."""
+    with _index_lock:
+        cached = _index_cache.get(id(compiled_schema))
+        if cached is not None and cached[0] is compiled_schema: return cached[1]
+        documents, metadatas, _ = compiled_schema.documents()
+        index = LexicalSchemaIndex(documents, metadatas)
+        _index_cache.clear() # Only the current schema version is kept
+        _index_cache[id(compiled_schema)] = (compiled_schema, index)
+        return index
+
+
+if __name__ == "__main__":
+    docs = ["Table: OTM.SHIPMENT. Description: Shipments. Columns include: Column: START_TIME (Type: datetime). Description: Start time of the shipment",
+            "Table: OTM.SHIPMENT, Column: START_TIME. Type: datetime. Description: Start time of the shipment.",
+            "Table: OTM.SHIPMENT, Column: TOTAL_ACTUAL_COST. Type: float. Description: Total actual cost.",
+            "Table: OTM.LOCATION, Column: LOCATION_NAME. Type: nvarchar. Description: Name of the location."]
+    metas = [{"type": "table", "table_name": "OTM.SHIPMENT"}, {"type": "column", "table_name": "OTM.SHIPMENT", "column_name": "START_TIME"},
+             {"type": "column", "table_name": "OTM.SHIPMENT", "column_name": "TOTAL_ACTUAL_COST"}, {"type": "column", "table_name": "OTM.LOCATION", "column_name": "LOCATION_NAME"}]
+    test_index = LexicalSchemaIndex(docs, metas)
+    ranked, confident = test_index.search("Total actual cost by month using START_TIME", n_results=2)
+    assert confident and ranked[0] == docs[1], ranked
+    ranked, confident = test_index.search("Which locations have the most shipments?", n_results=2)
+    assert not confident and docs[3] in ranked, ranked
+    assert not test_index.search("Show UNKNOWN_COLUMN by START_TIME")[1], "an unmatched identifier must fall back to the vector search"
+    print("LexicalSchemaIndex self-check passed.")
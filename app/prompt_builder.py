@@ -0,0 +1,151 @@
+# project_root/app/prompt_builder.py
+"""
+Token-budgeted assembly of the SQL generation prompt.
+
+- Schema parts: column documents already covered by their table's document are dropped, the rest are
+  kept in retrieval order until PROMPT_SCHEMA_TOKEN_BUDGET is reached (the part that overflows is cut
+  at a column boundary instead of being dropped whole). Join-path parts are always kept first.
+- History: the newest PROMPT_HISTORY_KEEP_MESSAGES messages are kept verbatim (within
+  PROMPT_HISTORY_TOKEN_BUDGET); older turns are folded into a short extractive summary.
+Tokens are counted locally with tiktoken when its encoding is available, else estimated.
+"""
+import os
+import re
+import threading
+
+# --- Configuration ---
+PROMPT_SCHEMA_TOKEN_BUDGET = int(os.environ.get("PROMPT_SCHEMA_TOKEN_BUDGET", 2500))
+PROMPT_HISTORY_TOKEN_BUDGET = int(os.environ.get("PROMPT_HISTORY_TOKEN_BUDGET", 800))
+PROMPT_HISTORY_KEEP_MESSAGES = int(os.environ.get("PROMPT_HISTORY_KEEP_MESSAGES", 4)) # Newest messages kept verbatim
+PROMPT_HISTORY_SUMMARY_TOKENS = int(os.environ.get("PROMPT_HISTORY_SUMMARY_TOKENS", 200))
+TOKENIZER_MODEL = os.environ.get("PROMPT_TOKENIZER_MODEL", "gpt-4")
+
+_encoding = None
+_encoding_resolved = False
+_encoding_lock = threading.Lock()
+_TOKEN_PIECE_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+def _get_encoding():
+    global _encoding, _encoding_resolved
+    if not _encoding_resolved:
+        with _encoding_lock:
+            if not _encoding_resolved:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.encoding_for_model(TOKENIZER_MODEL)
+                except Exception as e: # Not installed, or the BPE file can't be downloaded (offline)
+                    print(f"Warning: tiktoken encoding unavailable ({type(e).__name__}); estimating prompt tokens.")
+                _encoding_resolved = True
+    return _encoding
+
+def count_tokens(text):
+    if not text: return 0
+    encoding = _get_encoding()
+    if encoding is not None: return len(encoding.encode(text))
+    # Estimate: letters split into ~4-character pieces, digit runs into ~3-digit pieces, 1 per symbol
+    return sum((len(p) + 3) // 4 if p[0].isalpha() else (len(p) + 2) // 3 if p[0].isdigit() else 1 for p in _TOKEN_PIECE_RE.findall(text))
+
+
+# --- Schema context ---
+_TABLE_DOC_RE = re.compile(r"^Table: (.+?)\. Description: ")
+_COLUMN_DOC_RE = re.compile(r"^Table: (.+?), Column: (.+?)\. Type: ")
+COLUMN_SEPARATOR = " | "
+
+def dedupe_schema_parts(schema_parts):
+    """Drops exact duplicates and column documents whose table document (which lists every column) is also present."""
+    parts = list(dict.fromkeys(p for p in (schema_parts or []) if p))
+    tables_with_doc = {m.group(1) for m in map(_TABLE_DOC_RE.match, parts) if m}
+    return [p for p in parts if not ((m := _COLUMN_DOC_RE.match(p)) and m.group(1) in tables_with_doc)]
+
+def _truncate_table_document(document, budget):
+    """Keeps the table header and as many whole column entries as fit in `budget` tokens, or None if even the header doesn't."""
+    header, sep, columns = document.partition(" Columns include: ")
+    if count_tokens(header) > budget: return None
+    if not sep: return header
+    kept = []
+    used = count_tokens(header + sep)
+    for entry in columns.split(COLUMN_SEPARATOR):
+        cost = count_tokens(entry) + (1 if kept else 0)
+        if used + cost > budget: break
+        kept.append(entry); used += cost
+    return header + (sep + COLUMN_SEPARATOR.join(kept) if kept else "")
+
+def fit_schema_parts(schema_parts, budget=PROMPT_SCHEMA_TOKEN_BUDGET):
+    """Returns (parts that fit the budget, their token count, number of parts dropped or truncated)."""
+    parts = dedupe_schema_parts(schema_parts)
+    parts.sort(key=lambda p: 0 if p.startswith("Join path") or p.startswith("Key columns") else 1) # Stable: retrieval order otherwise
+    kept, used, trimmed = [], 0, 0
+    for part in parts:
+        cost = count_tokens(part)
+        if used + cost <= budget:
+            kept.append(part); used += cost; continue
+        truncated = _truncate_table_document(part, budget - used) if _TABLE_DOC_RE.match(part) else None
+        if truncated:
+            kept.append(truncated); used += count_tokens(truncated)
+        trimmed += 1
+    return kept, used, trimmed
+
+
+# --- Conversation history ---
+def _speaker(message): return "User" if getattr(message, "type", None) == "human" else "Assistant"
+
+def summarize_messages(messages, budget=PROMPT_HISTORY_SUMMARY_TOKENS):
+    """Extractive summary of older turns: one shortened line per message, newest kept when over budget."""
+    lines = []
+    for message in messages:
+        text = " ".join(str(message.content).split())
+        first_sentence = re.split(r"(?<=[.?!])\s", text, maxsplit=1)[0]
+        lines.append(f"- {_speaker(message)}: {first_sentence[:160]}")
+    while lines and count_tokens("\n".join(lines)) > budget: lines.pop(0)
+    return "\n".join(lines)
+
+def build_history_context(messages, keep=PROMPT_HISTORY_KEEP_MESSAGES, budget=PROMPT_HISTORY_TOKEN_BUDGET, summary=None):
+    """
+    Returns (history text for the prompt, its token count, number of messages folded into the summary).
+    `summary` is an already summarized start of the conversation (a server-side session's, see session_store.py).
+    """
+    messages = list(messages or [])
+    if not messages and not summary: return "", 0, 0
+    recent, used = [], 0
+    for message in reversed(messages[-keep:] if keep > 0 else []):
+        line = f"{_speaker(message)}: {message.content}\n"
+        cost = count_tokens(line)
+        if used + cost > budget and recent: break
+        recent.insert(0, line); used += cost
+    older = messages[:len(messages) - len(recent)]
+    text = "Previous Conversation Turn(s):\n"
+    summary = "\n".join(filter(None, [summary, summarize_messages(older) if older else None])) # The latter has its own budget (PROMPT_HISTORY_SUMMARY_TOKENS)
+    if summary: text += f"Summary of earlier turns:\n{summary}\n"
+    text += "".join(recent) + "------------------------\n"
+    return text, count_tokens(text), len(older)
+
+
+# --- Per-request reporting ---
+_stats = {"requests": 0, "prompt_tokens": 0, "schema_tokens": 0, "history_tokens": 0, "schema_parts_trimmed": 0, "history_messages_summarized": 0}
+_stats_lock = threading.Lock()
+
+def record_prompt(report):
+    """Adds one request's token report (see assistant_engine._prepare_sql_generation) to the running totals."""
+    with _stats_lock:
+        _stats["requests"] += 1
+        for key in ("prompt_tokens", "schema_tokens", "history_tokens", "schema_parts_trimmed", "history_messages_summarized"): _stats[key] += report.get(key, 0)
+
+def get_prompt_stats():
+    with _stats_lock: stats = dict(_stats)
+    stats["avg_prompt_tokens"] = stats["prompt_tokens"] / stats["requests"] if stats["requests"] else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    from langchain_core.messages import HumanMessage, AIMessage
+    table_doc = "Table: OTM.SHIPMENT. Description: Shipments. Columns include: " + COLUMN_SEPARATOR.join(f"Column: COL_{i} (Type: int). Description: Column {i}" for i in range(200))
+    column_doc = "Table: OTM.SHIPMENT, Column: COL_1. Type: int. Description: Column 1."
+    other_doc = "Table: OTM.LOCATION, Column: LOCATION_NAME. Type: nvarchar. Description: Name."
+    assert dedupe_schema_parts([column_doc, table_doc, other_doc, other_doc]) == [table_doc, other_doc]
+    kept, used, trimmed = fit_schema_parts([table_doc, other_doc, "Join path between the retrieved tables: ..."], budget=300)
+    assert kept[0].startswith("Join path") and used <= 300 and trimmed >= 1 and kept[1].startswith("Table: OTM.SHIPMENT. Description:")
+    history = [HumanMessage(content=f"Question {i}? Please answer.") if i % 2 == 0 else AIMessage(content=f"Answer {i}. More detail.") for i in range(20)]
+    text, tokens, summarized = build_history_context(history, keep=4)
+    assert summarized == 16 and "Summary of earlier turns" in text and "Question 18?" in text, text
+    print(f"Schema: {used} tokens kept, {trimmed} parts trimmed. History: {tokens} tokens, {summarized} messages summarized.")
+    print("Prompt builder self-check passed.")
@@ -0,0 +1,178 @@
+# project_root/app/query_guard.py
+"""
+Guards around the statements sql_executor_node runs on SQL Server.
+
+- Timeout: a watchdog cancels the statement (execute and fetch) after DB_QUERY_TIMEOUT seconds of wall-clock time.
+  The pyodbc Connection.timeout set by db_pool only covers the execute call.
+- Client disconnect: a QueryCancellation is shared by everyone waiting for one pipeline run. When the last of them
+  goes away (SSE stream closed, ASGI http.disconnect), the in-flight statement is cancelled with cursor.cancel().
+- Cost guard (optional): the estimated plan (SET SHOWPLAN_XML ON) is read before execution, and queries whose
+  estimated subtree cost is over SQL_MAX_ESTIMATED_COST are refused without running them.
+"""
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+if __name__ == "__main__" and __package__ is None:
+    from db_pool import DB_QUERY_TIMEOUT
+else:
+    from .db_pool import DB_QUERY_TIMEOUT
+
+# --- Configuration ---
+SQL_COST_GUARD_ENABLED = os.environ.get("SQL_COST_GUARD_ENABLED", "false").lower() == "true"
+SQL_MAX_ESTIMATED_COST = float(os.environ.get("SQL_MAX_ESTIMATED_COST", 500)) # SQL Server optimizer cost units
+
+_stats = {"statements": 0, "timeouts": 0, "cancelled_on_disconnect": 0, "cost_checks": 0, "refused_cost": 0, "cost_check_errors": 0}
+_stats_lock = threading.Lock()
+
+def _bump(name, amount=1):
+    with _stats_lock: _stats[name] += amount
+
+def get_query_guard_stats():
+    with _stats_lock: return dict(_stats)
+
+
+class QueryCancelled(Exception):
+    """Raised by the executor when its statement was cancelled; `reason` is "timeout" or "client_disconnected"."""
+
+    def __init__(self, reason):
+        super().__init__(f"Query cancelled ({reason})")
+        self.reason = reason
+
+
+class QueryCancellation:
+    """
+    Cancellation handle for one pipeline run. The executor attaches its cursor while a statement is in flight;
+    cancel() (from any thread) marks the run cancelled and cancels that statement. Waiters join() before
+    waiting and leave() when they stop; the run is cancelled when the last waiter leaves early.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cursor = None
+        self._waiters = 0
+        self.reason = None
+
+    @property
+    def cancelled(self): return self.reason is not None
+
+    @property
+    def waiters(self): return self._waiters
+
+    def join(self):
+        with self._lock: self._waiters += 1
+
+    def leave(self, gave_up=False):
+        """A waiter is done; gave_up=True when it left before the result (client disconnected)."""
+        with self._lock:
+            self._waiters -= 1
+            last = self._waiters <= 0
+        if gave_up and last: self.cancel("client_disconnected")
+
+    def attach(self, cursor):
+        with self._lock: self._cursor = cursor
+        if self.cancelled: raise QueryCancelled(self.reason) # Cancelled before the statement started
+
+    def detach(self):
+        with self._lock: self._cursor = None
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.reason is not None: return
+            self.reason = reason
+            cursor = self._cursor
+        _bump("timeouts" if reason == "timeout" else "cancelled_on_disconnect")
+        print(f"Cancelling in-flight query ({reason}).")
+        if cursor is not None:
+            try: cursor.cancel() # ODBC SQLCancel; safe to call from another thread
+            except Exception as e: print(f"Warning: cursor.cancel() failed: {e}")
+
+    def check(self):
+        """Raises QueryCancelled if the run was cancelled (called between fetch batches)."""
+        if self.reason is not None: raise QueryCancelled(self.reason)
+
+
+@contextmanager
+def guarded_statement(cursor, cancellation=None, timeout=DB_QUERY_TIMEOUT):
+    """Attaches `cursor` to the cancellation handle and arms the timeout watchdog for the duration of the block."""
+    cancellation = cancellation or QueryCancellation()
+    cancellation.attach(cursor)
+    _bump("statements")
+    timer = None
+    if timeout:
+        timer = threading.Timer(timeout, cancellation.cancel, args=("timeout",))
+        timer.daemon = True; timer.start()
+    try:
+        yield cancellation
+    finally:
+        if timer is not None: timer.cancel()
+        cancellation.detach()
+
+
+# --- Estimated cost guard ---
+_SUBTREE_COST_RE = re.compile(r'StatementSubTreeCost="([0-9.eE+-]+)"')
+
+def estimate_query_cost(conn, sql_query):
+    """Optimizer's estimated cost of `sql_query` from its SHOWPLAN_XML (nothing is executed), or None if no plan came back."""
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SET SHOWPLAN_XML ON") # Must be alone in its batch
+        try:
+            cursor.execute(sql_query)
+            row = cursor.fetchone()
+            plan = str(row[0]) if row else ""
+            while cursor.nextset(): pass
+        finally: cursor.execute("SET SHOWPLAN_XML OFF")
+    finally: cursor.close()
+    costs = [float(c) for c in _SUBTREE_COST_RE.findall(plan)]
+    return max(costs) if costs else None
+
+def check_query_cost(conn, sql_query, max_cost=None):
+    """
+    Returns a refusal message when the estimated cost is over max_cost (default SQL_MAX_ESTIMATED_COST), else None.
+    Estimation errors don't block the query (they are counted in cost_check_errors).
+    """
+    if not SQL_COST_GUARD_ENABLED: return None
+    max_cost = SQL_MAX_ESTIMATED_COST if max_cost is None else max_cost
+    _bump("cost_checks")
+    try: cost = estimate_query_cost(conn, sql_query)
+    except Exception as e:
+        _bump("cost_check_errors"); print(f"Warning: could not estimate query cost: {e}"); return None
+    print(f"Estimated query cost: {cost}")
+    if cost is None or cost <= max_cost: return None
+    _bump("refused_cost")
+    return f"This query is estimated to be too expensive to run (cost {cost:,.0f}, limit {max_cost:,.0f}). Try narrowing it, e.g. with a date range or fewer joined tables."
+
+
+if __name__ == "__main__":
+    import time
+
+    class FakeCursor:
+        def __init__(self, plan_cost=None): self.cancelled = False; self.plan_cost = plan_cost; self.showplan = False
+        def execute(self, sql):
+            if sql.startswith("SET SHOWPLAN_XML"): self.showplan = sql.endswith("ON")
+            return self
+        def fetchone(self): return (f'<ShowPlanXML><StmtSimple StatementSubTreeCost="{self.plan_cost}"/></ShowPlanXML>',) if self.showplan else (1,)
+        def nextset(self): return False
+        def cancel(self): self.cancelled = True
+        def close(self): pass
+
+    class FakeConnection:
+        def __init__(self, plan_cost): self.plan_cost = plan_cost
+        def cursor(self): return FakeCursor(self.plan_cost)
+
+    cursor = FakeCursor()
+    with guarded_statement(cursor, timeout=0.05) as guard:
+        time.sleep(0.2)
+        assert cursor.cancelled and guard.reason == "timeout"
+    shared = QueryCancellation(); shared.join(); shared.join()
+    cursor = FakeCursor()
+    with guarded_statement(cursor, shared, timeout=0):
+        shared.leave(gave_up=True); assert not cursor.cancelled, "one waiter left, the other still wants the result"
+        shared.leave(gave_up=True); assert cursor.cancelled and shared.reason == "client_disconnected"
+    assert estimate_query_cost(FakeConnection(1234.5), "SELECT 1") == 1234.5
+    SQL_COST_GUARD_ENABLED = True
+    assert check_query_cost(FakeConnection(1234.5), "SELECT 1", max_cost=100) and check_query_cost(FakeConnection(12.0), "SELECT 1", max_cost=100) is None
+    print(get_query_guard_stats())
+    print("Query guard self-check passed.")
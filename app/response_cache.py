@@ -0,0 +1,193 @@
+# project_root/app/response_cache.py
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+if __name__ == "__main__" and __package__ is None:
+    from columnar import estimate_row_bytes
+else:
+    from .columnar import estimate_row_bytes
+
+# --- Configuration ---
+RESPONSE_CACHE_ENABLED = os.environ.get("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL_SECONDS = float(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", 300))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 500))
+RESPONSE_CACHE_MAX_BYTES = int(float(os.environ.get("RESPONSE_CACHE_MAX_MB", 128)) * 1024 * 1024)
+
+
+def estimate_response_bytes(response):
+    """Approximate in-memory size of an assistant response, dominated by its raw_table rows (and their ResultColumns)."""
+    table = response.get("raw_table") or {}
+    # The typed columns a TableData carries hold the values and string forms again: about twice the rows' size
+    size = estimate_row_bytes(table.get("rows") or []) * (2 if getattr(table, "columns", None) is not None else 1)
+    data = (response.get("chart") or {}).get("data") or {}
+    points = len(data.get("labels") or []) + sum(len(d.get("data") or []) for d in data.get("datasets") or [])
+    return size + 64 * points + 1024
+
+
+class _InFlight:
+    """A computation that concurrent callers with the same key wait on instead of repeating."""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ResponseCache:
+    """
+    In-process TTL + LRU cache of full assistant responses with single-flight coalescing:
+    while one caller computes a key, other callers asking for the same key wait for that result.
+    Bounded by max_entries and by max_bytes, with each value's size estimated by `size_fn`.
+    """
+
+    def __init__(self, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES, max_bytes=RESPONSE_CACHE_MAX_BYTES, size_fn=estimate_response_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_fn = size_fn
+        self._entries = OrderedDict() # key -> (expires_at, value, size); most recently used last
+        self._bytes = 0
+        self._in_flight = {}
+        self._async_in_flight = {} # key -> asyncio.Task, for aget_or_compute
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "expired": 0, "evicted": 0, "not_cached": 0, "too_large": 0}
+
+    def get_or_compute(self, key, compute_fn, should_cache=None):
+        """
+        Returns the cached value for `key`, the result of an identical in-flight computation,
+        or the result of `compute_fn()`. Results are stored only if `should_cache(result)` is truthy.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._entries[key]; self._bytes -= entry[2]; self._stats["expired"] += 1
+            flight = self._in_flight.get(key)
+            is_leader = flight is None
+            if is_leader:
+                flight = self._in_flight[key] = _InFlight()
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None: raise flight.error
+            return flight.result
+
+        try:
+            flight.result = compute_fn()
+            if should_cache is None or should_cache(flight.result): self._store(key, flight.result)
+            else:
+                with self._lock: self._stats["not_cached"] += 1
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock: self._in_flight.pop(key, None)
+            flight.done.set()
+
+    async def aget_or_compute(self, key, compute_coro_fn, should_cache=None):
+        """
+        asyncio counterpart of get_or_compute: identical concurrent requests await one task on the running loop.
+        The task stays in flight (and its result is cached) until it finishes, even when the caller that started it is cancelled.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[1]
+                del self._entries[key]; self._bytes -= entry[2]; self._stats["expired"] += 1
+            task = self._async_in_flight.get(key)
+            if task is None:
+                task = self._async_in_flight[key] = asyncio.ensure_future(compute_coro_fn())
+                task.add_done_callback(lambda done: self._finish_async(key, done, should_cache))
+                self._stats["misses"] += 1
+            else:
+                self._stats["coalesced"] += 1
+        return await asyncio.shield(task) # A cancelled waiter must not cancel the shared computation
+
+    def _finish_async(self, key, task, should_cache):
+        """Done-callback of an aget_or_compute task: leaves the in-flight map, caches the result, retrieves any exception."""
+        with self._lock:
+            if self._async_in_flight.get(key) is task: del self._async_in_flight[key]
+        if task.cancelled(): return
+        if task.exception() is not None: return # Retrieved here, so a task nobody awaits anymore doesn't log "never retrieved"
+        result = task.result()
+        if should_cache is None or should_cache(result): self._store(key, result)
+        else:
+            with self._lock: self._stats["not_cached"] += 1
+
+    def _store(self, key, value):
+        size = self.size_fn(value) if self.size_fn else 0
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None: self._bytes -= old[2]
+            if size > self.max_bytes:
+                self._stats["too_large"] += 1; return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size); self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted[2]; self._stats["evicted"] += 1
+
+    def clear(self):
+        with self._lock: self._entries.clear(); self._bytes = 0
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["in_flight"] = len(self._in_flight) + len(self._async_in_flight)
+        served = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / served if served else 0.0
+        return stats
+
+
+if __name__ == "__main__":
+    print("--- Testing ResponseCache ---")
+    cache = ResponseCache(ttl_seconds=0.3, max_entries=2)
+    calls = {"count": 0}
+    def slow_compute():
+        calls["count"] += 1; time.sleep(0.1); return {"answer": "42"}
+    threads = [threading.Thread(target=cache.get_or_compute, args=("q", slow_compute)) for _ in range(5)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert calls["count"] == 1, "concurrent identical requests should share one computation"
+    assert cache.get_or_compute("q", slow_compute) == {"answer": "42"} and calls["count"] == 1
+    time.sleep(0.35)
+    cache.get_or_compute("q", slow_compute); assert calls["count"] == 2, "entry should expire after TTL"
+    cache.get_or_compute("err", lambda: {"answer": None}, should_cache=lambda r: r["answer"])
+    assert cache.get_stats()["not_cached"] == 1
+    sized = ResponseCache(max_bytes=3000)
+    for key in ("a", "b"): sized.get_or_compute(key, lambda: {"raw_table": {"headers": ["x"], "rows": [["1"]] * 10}})
+    assert sized.get_stats()["entries"] == 1 and sized.get_stats()["evicted"] == 1, "entries are evicted past max_bytes"
+    sized.get_or_compute("big", lambda: {"raw_table": {"headers": ["x"], "rows": [["1" * 100]] * 100}})
+    assert sized.get_stats()["too_large"] == 1
+    async def check_async_coalescing():
+        async def slow_coro():
+            calls["count"] += 1; await asyncio.sleep(0.1); return {"answer": "async"}
+        results = await asyncio.gather(*[cache.aget_or_compute("aq", slow_coro) for _ in range(5)])
+        assert all(r == {"answer": "async"} for r in results)
+    calls["count"] = 0
+    asyncio.run(check_async_coalescing()); assert calls["count"] == 1, "concurrent async requests should share one task"
+    async def check_leader_cancelled():
+        async def slow_coro():
+            calls["count"] += 1; await asyncio.sleep(0.1); return {"answer": "kept"}
+        leader = asyncio.ensure_future(cache.aget_or_compute("lq", slow_coro)); await asyncio.sleep(0.01)
+        leader.cancel(); await asyncio.sleep(0)
+        assert await cache.aget_or_compute("lq", slow_coro) == {"answer": "kept"}, "a waiter after the leader left joins its task"
+        await asyncio.sleep(0)
+        assert cache.get_or_compute("lq", lambda: {"answer": "recomputed"}) == {"answer": "kept"}, "and its result is cached"
+    calls["count"] = 0
+    asyncio.run(check_leader_cancelled()); assert calls["count"] == 1, "the leader's cancellation doesn't start a second run"
+    print(f"Response cache stats: {cache.get_stats()}")
+    print("ResponseCache self-check passed.")
@@ -0,0 +1,116 @@
+# project_root/app/result_buffer.py
+"""
+Per-conversation buffer of the last query result, for follow-ups that only change the presentation
+("show that as a pie chart", "make it a line graph").
+
+analyzer_visualizer_node stores the ResultSet, its ResultColumns (column types and the str / float conversions
+already computed) and the SQL under the request's conversation_id. intent_detection_node classifies the next
+question with is_presentation_only(); when it is and the conversation has a buffered result, the graph goes
+straight to analyzer_visualizer with it, skipping retrieval, the LLM and the database.
+Bounded by RESULT_BUFFER_MAX_CONVERSATIONS and RESULT_BUFFER_MAX_MB (LRU), entries expire after RESULT_BUFFER_TTL_SECONDS.
+"""
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+
+if __name__ == "__main__" and __package__ is None:
+    from columnar import estimate_row_bytes, ResultSet
+else:
+    from .columnar import estimate_row_bytes, ResultSet
+
+# --- Configuration ---
+RESULT_BUFFER_ENABLED = os.environ.get("RESULT_BUFFER_ENABLED", "true").lower() == "true"
+RESULT_BUFFER_TTL_SECONDS = float(os.environ.get("RESULT_BUFFER_TTL_SECONDS", 1800))
+RESULT_BUFFER_MAX_CONVERSATIONS = int(os.environ.get("RESULT_BUFFER_MAX_CONVERSATIONS", 1000))
+RESULT_BUFFER_MAX_BYTES = int(float(os.environ.get("RESULT_BUFFER_MAX_MB", 512)) * 1024 * 1024)
+
+# --- Presentation-only follow-up classifier ---
+_CHART_PHRASE_RE = re.compile(r"\b(pie char[t]?|donut chart|doughnut chart|line chart|line graph|area chart|bar chart|bar graph|horizontal bar|scatter plot|trend)s?\b")
+_WORD_RE = re.compile(r"[a-z']+|\d+")
+# Words a follow-up may use besides the chart type without asking for different data
+_PRESENTATION_WORDS = {
+    "show", "display", "plot", "draw", "render", "make", "turn", "convert", "change", "switch", "put", "visualize", "visualise", "view", "see", "redo", "try",
+    "it", "that", "this", "these", "those", "them", "same", "data", "result", "results", "numbers", "chart", "graph", "one",
+    "as", "a", "an", "the", "into", "to", "in", "instead", "now", "please", "can", "could", "would", "you", "me", "i", "we",
+    "want", "like", "use", "using", "rather", "than", "of", "with", "again", "pie", "bar", "line", "donut", "doughnut", "scatter", "area",
+}
+
+def is_presentation_only(query):
+    """True for a question that names a chart type and otherwise only refers back to the previous result."""
+    text = (query or "").lower()
+    if not _CHART_PHRASE_RE.search(text): return False
+    return all(word in _PRESENTATION_WORDS for word in _WORD_RE.findall(_CHART_PHRASE_RE.sub(" ", text)))
+
+
+class BufferedResult:
+    __slots__ = ("result", "columns", "sql", "query", "size", "expires_at")
+
+    def __init__(self, result, columns, sql, query, size, expires_at):
+        self.result = result; self.columns = columns; self.sql = sql; self.query = query; self.size = size; self.expires_at = expires_at
+
+
+class ResultBuffer:
+    """conversation_id -> BufferedResult of its last query, LRU within a conversation count and a byte budget."""
+
+    def __init__(self, ttl_seconds=RESULT_BUFFER_TTL_SECONDS, max_conversations=RESULT_BUFFER_MAX_CONVERSATIONS, max_bytes=RESULT_BUFFER_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.max_conversations = max_conversations
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict() # Most recently used last
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"stores": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0, "too_large": 0}
+
+    def put(self, conversation_id, result, columns, sql=None, query=None):
+        # Rows plus the transposed columns and their cached string forms: about twice the rows' size
+        size = 2 * estimate_row_bytes(result.rows)
+        with self._lock:
+            old = self._entries.pop(conversation_id, None)
+            if old is not None: self._bytes -= old.size
+            if size > self.max_bytes:
+                self._stats["too_large"] += 1; return False
+            self._entries[conversation_id] = BufferedResult(result, columns, sql, query, size, time.monotonic() + self.ttl_seconds)
+            self._bytes += size; self._stats["stores"] += 1
+            while len(self._entries) > self.max_conversations or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size; self._stats["evicted"] += 1
+        return True
+
+    def get(self, conversation_id):
+        """The conversation's BufferedResult, or None."""
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                del self._entries[conversation_id]; self._bytes -= entry.size
+                self._stats["expired"] += 1; entry = None
+            if entry is None:
+                self._stats["misses"] += 1; return None
+            self._entries.move_to_end(conversation_id)
+            self._stats["hits"] += 1
+            return entry
+
+    def drop(self, conversation_id):
+        with self._lock:
+            entry = self._entries.pop(conversation_id, None)
+            if entry is not None: self._bytes -= entry.size
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(conversations=len(self._entries), bytes=self._bytes)
+        return stats
+
+
+if __name__ == "__main__":
+    for q in ["show that as a pie chart", "Make it a line graph", "can you put this in a bar chart instead?", "pie chart please", "show the trend"]:
+        assert is_presentation_only(q), q
+    for q in ["pie chart of shipments by carrier", "shipment trend in 2024", "show me the top 10 carriers", "line chart of cost by month for 2023"]:
+        assert not is_presentation_only(q), q
+    buffer = ResultBuffer(ttl_seconds=0.2, max_conversations=2)
+    for conversation in ("a", "b", "c"): buffer.put(conversation, ResultSet(["x"], [(1,)]), None, "SELECT 1", "q")
+    assert buffer.get("a") is None and buffer.get("c").sql == "SELECT 1", "a is evicted by the conversation limit"
+    time.sleep(0.25); assert buffer.get("c") is None, "entries expire"
+    print(buffer.get_stats())
+    print("Result buffer self-check passed.")
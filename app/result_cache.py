@@ -0,0 +1,228 @@
+# project_root/app/result_cache.py
+"""
+Cache of SQL results for sql_executor_node, so the same query is not re-run against OTM when another
+phrasing (or another user) produces the same SQL.
+
+- Key: the canonicalized SQL (sql_preflight.canonicalize_sql), so whitespace, keyword and identifier case
+  and comments don't matter. String literals and TOP values are part of the key.
+- Tags: the OTM.* tables the query reads. invalidate_tables() drops every entry that read one of them
+  (e.g. after a load into OTM.SHIPMENT); /api/admin/result-cache/invalidate calls it.
+- TTL: RESULT_CACHE_TTL_SECONDS, or per table with RESULT_CACHE_TABLE_TTL_SECONDS
+  ("OTM.LOCATION=86400,OTM.SHIPMENT=60"); an entry lives as long as its shortest-lived table allows.
+- Memory budget: RESULT_CACHE_MAX_MB of (estimated) result size, LRU eviction. With RESULT_CACHE_SPILL_DIR set,
+  evicted entries are pickled there (up to RESULT_CACHE_SPILL_MAX_MB, also LRU) and promoted back on a hit.
+"""
+import os
+import time
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+if __name__ == "__main__" and __package__ is None:
+    from columnar import estimate_row_bytes, ResultSet
+    from sql_preflight import canonicalize_sql
+else:
+    from .columnar import estimate_row_bytes, ResultSet
+    from .sql_preflight import canonicalize_sql
+
+# --- Configuration ---
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "true").lower() == "true"
+RESULT_CACHE_TTL_SECONDS = float(os.environ.get("RESULT_CACHE_TTL_SECONDS", 600))
+RESULT_CACHE_TABLE_TTL_SECONDS = os.environ.get("RESULT_CACHE_TABLE_TTL_SECONDS", "") # "OTM.LOCATION=86400,OTM.SHIPMENT=60"
+RESULT_CACHE_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_MAX_MB", 256)) * 1024 * 1024)
+RESULT_CACHE_SPILL_DIR = os.environ.get("RESULT_CACHE_SPILL_DIR", "") # Empty: evicted entries are dropped
+RESULT_CACHE_SPILL_MAX_BYTES = int(float(os.environ.get("RESULT_CACHE_SPILL_MAX_MB", 1024)) * 1024 * 1024)
+
+
+def parse_table_ttls(spec):
+    """{"OTM.LOCATION": 86400.0, ...} from "OTM.LOCATION=86400,OTM.SHIPMENT=60"."""
+    ttls = {}
+    for part in (spec or "").split(","):
+        table, _, seconds = part.partition("=")
+        if table.strip() and seconds.strip():
+            try: ttls[table.strip().upper()] = float(seconds)
+            except ValueError: print(f"Warning: ignoring result cache TTL '{part.strip()}'.")
+    return ttls
+
+def result_cache_key(sql):
+    """(key, tables) for a query: a hash of its canonical text and the OTM.* tables it reads."""
+    canonical, tables = canonicalize_sql(sql)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest(), tables
+
+
+class _Entry:
+    __slots__ = ("result", "tables", "expires_at", "size")
+
+    def __init__(self, result, tables, expires_at, size):
+        self.result = result; self.tables = tables; self.expires_at = expires_at; self.size = size
+
+
+class ResultCache:
+    """
+    TTL + LRU cache of ResultSets under a byte budget, with table tags for invalidation and an optional
+    on-disk second tier for entries evicted from memory. Cached ResultSets are shared; callers must not mutate them.
+    """
+
+    def __init__(self, ttl_seconds=RESULT_CACHE_TTL_SECONDS, table_ttls=None, max_bytes=RESULT_CACHE_MAX_BYTES,
+                 spill_dir=RESULT_CACHE_SPILL_DIR, spill_max_bytes=RESULT_CACHE_SPILL_MAX_BYTES):
+        self.ttl_seconds = ttl_seconds
+        self.table_ttls = parse_table_ttls(RESULT_CACHE_TABLE_TTL_SECONDS) if table_ttls is None else {t.upper(): s for t, s in table_ttls.items()}
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or None
+        self.spill_max_bytes = spill_max_bytes
+        self._memory = OrderedDict() # key -> _Entry with the ResultSet; most recently used last
+        self._disk = OrderedDict() # key -> _Entry with the pickle path as `result`
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "too_large": 0,
+                       "evictions": 0, "spills": 0, "spill_errors": 0, "invalidated": 0, "expired": 0}
+        if self.spill_dir:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            for name in os.listdir(self.spill_dir): # Spilled entries of a previous process: their tags are unknown
+                if name.endswith(".pkl"): self._remove_file(os.path.join(self.spill_dir, name))
+
+    def _ttl_for(self, tables):
+        return min([self.table_ttls.get(t, self.ttl_seconds) for t in tables] or [self.ttl_seconds])
+
+    @staticmethod
+    def _remove_file(path):
+        try: os.remove(path)
+        except OSError: pass
+
+    def get(self, key):
+        """The cached ResultSet for `key`, or None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry.expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1; self._stats["memory_hits"] += 1
+                    return entry.result
+                self._drop_memory(key); self._stats["expired"] += 1
+            entry = self._disk.pop(key, None)
+            if entry is not None: self._disk_bytes -= entry.size
+        if entry is None or entry.expires_at <= now:
+            with self._lock: self._stats["misses"] += 1
+            if entry is not None:
+                with self._lock: self._stats["expired"] += 1
+                self._remove_file(entry.result)
+            return None
+        try: # Read outside the lock: a large spilled result takes a while to unpickle
+            with open(entry.result, "rb") as f: result = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: could not read spilled result {entry.result}: {e}")
+            with self._lock: self._stats["misses"] += 1; self._stats["spill_errors"] += 1
+            return None
+        finally: self._remove_file(entry.result)
+        with self._lock: self._stats["hits"] += 1; self._stats["disk_hits"] += 1
+        self._put_memory(key, _Entry(result, entry.tables, entry.expires_at, entry.size)) # Promoted back to memory
+        return result
+
+    def put(self, key, result, tables):
+        """Caches `result` (a ResultSet) under `key`, tagged with `tables`. Results over the memory budget are not cached."""
+        size = estimate_row_bytes(result.rows) + 64 * len(result.headers)
+        if size > self.max_bytes:
+            with self._lock: self._stats["too_large"] += 1
+            return False
+        tables = tuple(t.upper() for t in tables)
+        self._put_memory(key, _Entry(result, tables, time.monotonic() + self._ttl_for(tables), size))
+        with self._lock: self._stats["stores"] += 1
+        return True
+
+    def _put_memory(self, key, entry):
+        evicted = []
+        with self._lock:
+            self._drop_memory(key); self._drop_disk(key)
+            self._memory[key] = entry; self._memory_bytes += entry.size
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                old_key, old = self._memory.popitem(last=False)
+                self._memory_bytes -= old.size; self._stats["evictions"] += 1
+                if old.expires_at > time.monotonic(): evicted.append((old_key, old))
+        if self.spill_dir:
+            for old_key, old in evicted: self._spill(old_key, old)
+
+    def _spill(self, key, entry):
+        """Writes an entry evicted from memory to the spill directory."""
+        if entry.size > self.spill_max_bytes: return
+        path = os.path.join(self.spill_dir, f"{key}.pkl")
+        try:
+            with open(path, "wb") as f: pickle.dump(entry.result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            print(f"Warning: could not spill cached result to {path}: {e}")
+            with self._lock: self._stats["spill_errors"] += 1
+            self._remove_file(path); return
+        stale = []
+        with self._lock:
+            if key in self._memory: stale.append(path) # Cached again while it was being written
+            else:
+                self._disk[key] = _Entry(path, entry.tables, entry.expires_at, entry.size); self._disk_bytes += entry.size
+                self._stats["spills"] += 1
+                while self._disk_bytes > self.spill_max_bytes and self._disk:
+                    _, old = self._disk.popitem(last=False)
+                    self._disk_bytes -= old.size; self._stats["evictions"] += 1; stale.append(old.result)
+        for stale_path in stale: self._remove_file(stale_path)
+
+    def _drop_memory(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None: self._memory_bytes -= entry.size
+
+    def _drop_disk(self, key):
+        entry = self._disk.pop(key, None)
+        if entry is not None: self._disk_bytes -= entry.size; self._remove_file(entry.result)
+
+    def invalidate_tables(self, tables):
+        """Drops every entry that read one of `tables` (names like "OTM.SHIPMENT", any case); returns how many."""
+        tables = {t.strip().upper() for t in tables}
+        with self._lock:
+            keys = [k for k, e in self._memory.items() if tables.intersection(e.tables)]
+            disk_keys = [k for k, e in self._disk.items() if tables.intersection(e.tables)]
+            for key in keys: self._drop_memory(key)
+            for key in disk_keys: self._drop_disk(key)
+            self._stats["invalidated"] += len(keys) + len(disk_keys)
+        if keys or disk_keys: print(f"Result cache: invalidated {len(keys) + len(disk_keys)} entries for {', '.join(sorted(tables))}.")
+        return len(keys) + len(disk_keys)
+
+    def clear(self):
+        """Drops every entry; returns how many."""
+        with self._lock:
+            count = len(self._memory) + len(self._disk)
+            for key in list(self._disk): self._drop_disk(key)
+            self._memory.clear(); self._memory_bytes = 0
+            self._stats["invalidated"] += count
+        return count
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(entries=len(self._memory), memory_bytes=self._memory_bytes, disk_entries=len(self._disk), disk_bytes=self._disk_bytes)
+            tables = {}
+            for entry in list(self._memory.values()) + list(self._disk.values()):
+                for table in entry.tables: tables[table] = tables.get(table, 0) + 1
+        served = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / served if served else 0.0
+        stats["entries_by_table"] = dict(sorted(tables.items(), key=lambda item: -item[1]))
+        return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+    key_a, tables_a = result_cache_key("SELECT TOP 10 s.SHIPMENT_GID FROM OTM.SHIPMENT s JOIN otm.location l ON l.LOCATION_GID = s.SOURCE_LOCATION_GID")
+    key_b, _ = result_cache_key("select top 10 S.shipment_gid\n  from otm.SHIPMENT S join OTM.LOCATION L on L.location_gid = S.source_location_gid -- same query")
+    assert key_a == key_b and tables_a == ["OTM.LOCATION", "OTM.SHIPMENT"], (key_a, key_b, tables_a)
+    assert result_cache_key("SELECT 1 FROM OTM.SHIPMENT WHERE X = 'a'")[0] != result_cache_key("SELECT 1 FROM OTM.SHIPMENT WHERE X = 'A'")[0]
+    result = ResultSet(["ID", "Name"], [(i, f"name {i}") for i in range(2000)])
+    size = estimate_row_bytes(result.rows) + 128
+    with tempfile.TemporaryDirectory() as spill_dir:
+        cache = ResultCache(ttl_seconds=60, table_ttls={"OTM.LOCATION": 0.2}, max_bytes=int(size * 1.5), spill_dir=spill_dir)
+        cache.put("a", result, ["OTM.SHIPMENT"]); cache.put("b", result, ["OTM.LOCATION", "OTM.SHIPMENT"])
+        assert cache.get_stats()["spills"] == 1 and os.path.exists(os.path.join(spill_dir, "a.pkl")), "a is evicted to disk"
+        assert cache.get("a").rows == result.rows and cache.get_stats()["disk_hits"] == 1, "a is read back from disk"
+        assert cache.get("b") is not None, "b was spilled when a came back, and is read back"
+        time.sleep(0.25); assert cache.get("b") is None, "OTM.LOCATION entries expire after 0.2s"
+        assert cache.get("a") is not None and cache.invalidate_tables(["otm.shipment"]) == 1 and cache.get("a") is None
+        assert not cache.put("big", ResultSet(["x"], [(str(i) * 20,) for i in range(20000)]), []), "over the budget"
+        print(cache.get_stats())
+    print("Result cache self-check passed.")
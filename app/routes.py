@@ -1,74 +1,26 @@
 # project_root/app/routes.py
-from flask import Blueprint, render_template, request, jsonify
+from flask import Blueprint, render_template, request, jsonify, Response, stream_with_context
 import os
+import hmac
 import json
-import uuid 
+import hashlib
 
-from .assistant_engine import get_assistant_response
+from .insights_store import get_insights_store, DEFAULT_WORKPLACE_ID
+from .assistant_engine import get_assistant_response, stream_assistant_response, get_engine_stats, invalidate_cached_results, get_answer_sql
+from .wire_format import wants_columnar, encode_response, encode_columnar, dumps as wire_dumps
+from .batch_jobs import batch_jobs, BATCH_MAX_QUERIES
+from .insight_refresh import refresh_interval, get_refresh_stats
 
 bp = Blueprint('main', __name__)
-insights_file_path = os.path.join(os.path.dirname(__file__), '..', 'insights.json')
-
-DEFAULT_WORKPLACE_ID = "default_wp_001"
-DEFAULT_WORKPLACE_NAME = "My General Insights"
-
-def get_default_insights_structure():
-    return {"workplaces": {DEFAULT_WORKPLACE_ID: {"name": DEFAULT_WORKPLACE_NAME, "insights": []}}, "activeWorkplaceId": DEFAULT_WORKPLACE_ID}
-
-def initialize_insights_file():
-    """Initializes insights.json robustly if it doesn't exist or is empty/invalid."""
-    if not os.path.exists(insights_file_path):
-        print(f"Insights file not found at {insights_file_path}. Creating with default structure.")
-        save_insights_data(get_default_insights_structure())
-        return
-    try:
-        with open(insights_file_path, 'r') as f:
-            content = f.read()
-            if not content.strip(): # Empty file
-                print(f"Insights file at {insights_file_path} is empty. Initializing with default structure.")
-                save_insights_data(get_default_insights_structure())
-                return
-            data = json.loads(content)
-            # Check for the expected top-level 'workplaces' key and its type
-            if not isinstance(data, dict) or "workplaces" not in data or not isinstance(data.get("workplaces"), dict):
-                raise ValueError("Invalid root structure or missing 'workplaces' dictionary.")
-            
-            # Ensure default workplace exists if no workplaces are present or if default is missing
-            if not data["workplaces"] or DEFAULT_WORKPLACE_ID not in data["workplaces"]:
-                 data["workplaces"][DEFAULT_WORKPLACE_ID] = {"name": DEFAULT_WORKPLACE_NAME, "insights": []}
-                 # If activeWorkplaceId is missing or invalid, set it to default
-                 if "activeWorkplaceId" not in data or data.get("activeWorkplaceId") not in data["workplaces"]:
-                     data["activeWorkplaceId"] = DEFAULT_WORKPLACE_ID
-                 save_insights_data(data)
-            # Ensure there's an activeWorkplaceId if workplaces exist and it's not set or invalid
-            elif "activeWorkplaceId" not in data or data.get("activeWorkplaceId") not in data["workplaces"]:
-                 data["activeWorkplaceId"] = next(iter(data["workplaces"]), DEFAULT_WORKPLACE_ID) # first workplace or default
-                 save_insights_data(data)
-
-    except (json.JSONDecodeError, ValueError, TypeError) as e:
-        print(f"Warning: {insights_file_path} is invalid or has wrong structure ({e}). Re-initializing.")
-        save_insights_data(get_default_insights_structure())
-    except Exception as e: 
-        print(f"Unexpected error during insights file initialization: {e}. Re-initializing.")
-        save_insights_data(get_default_insights_structure())
-
-def load_insights_data():
-    initialize_insights_file() 
-    try:
-        with open(insights_file_path, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Critical error loading insights data: {e}. Returning default structure.")
-        return get_default_insights_structure()
-
-def save_insights_data(data):
-    try:
-        with open(insights_file_path, 'w') as f:
-            json.dump(data, f, indent=2)
-    except Exception as e:
-        print(f"Error saving insights data: {e}")
-
-initialize_insights_file() 
+ADMIN_API_TOKEN = os.environ.get("ADMIN_API_TOKEN") # Required in X-Admin-Token by the /api/admin endpoints; unset disables them
+INSIGHTS_PAGE_SIZE = int(os.environ.get("INSIGHTS_PAGE_SIZE", 24)) # Default ?limit of the insight list
+INSIGHTS_MAX_PAGE_SIZE = 200
+
+def _admin_denied():
+    """Error response when the request may not use the admin endpoints, else None."""
+    if not ADMIN_API_TOKEN: return jsonify({"error": "Admin API is disabled (ADMIN_API_TOKEN is not set)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), ADMIN_API_TOKEN): return jsonify({"error": "Invalid admin token"}), 401
+    return None
 
 @bp.route('/')
 def index(): return render_template('chat.html', welcome_message="Welcome to RXO Logistics AI!")
@@ -79,99 +31,172 @@ def chat():
         payload = request.json; user_query = payload.get('query')
         conversation_history_raw = payload.get('conversation_history', [])
         if not user_query: return jsonify({"error": "No query provided"}), 400
-        response_data = get_assistant_response(user_query, conversation_history_raw=conversation_history_raw)
+        response_data = get_assistant_response(user_query, conversation_history_raw=conversation_history_raw, conversation_id=payload.get('conversation_id'))
+        if wants_columnar(request.headers.get('Accept')):
+            body, headers = encode_response(response_data, request.headers.get('Accept-Encoding'))
+            return Response(body, headers=headers)
         return jsonify(response_data)
     return render_template('chat.html', welcome_message="Welcome to RXO Logistics AI! Ask me anything.")
 
+@bp.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Server-Sent Events variant of /chat: emits pipeline progress, the SQL, table row chunks, the chart and the final answer."""
+    payload = request.json or {}; user_query = payload.get('query')
+    columnar = wants_columnar(request.headers.get('Accept')) # The final answer ('done') in the columnar wire format
+    conversation_history_raw = payload.get('conversation_history', [])
+    if not user_query: return jsonify({"error": "No query provided"}), 400
+
+    def generate():
+        events = stream_assistant_response(user_query, conversation_history_raw=conversation_history_raw, conversation_id=payload.get('conversation_id'))
+        try:
+            for event_name, data in events:
+                if event_name == "heartbeat": yield ": keep-alive\n\n"; continue # SSE comment; writing it fails once the client has gone
+                body = wire_dumps(encode_columnar(data)).decode("utf-8") if columnar and event_name == "done" else json.dumps(data, default=str)
+                yield f"event: {event_name}\ndata: {body}\n\n"
+        finally: events.close() # Client disconnected early: cancels the in-flight SQL statement
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"} # Disable proxy buffering so events flush immediately
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@bp.route('/chat/batch', methods=['POST'])
+def chat_batch():
+    """Body: {"queries": ["...", ...]}. Starts a batch job and answers 202 with its id; poll or stream its results."""
+    payload = request.get_json(silent=True) or {}; queries = payload.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({"error": "Provide 'queries', a non-empty list of questions"}), 400
+    if len(queries) > BATCH_MAX_QUERIES: return jsonify({"error": f"At most {BATCH_MAX_QUERIES} queries per batch"}), 400
+    job = batch_jobs.submit([q.strip() for q in queries])
+    if job is None: return jsonify({"error": "Too many batch jobs are running; retry later"}), 429
+    return jsonify({"job_id": job.id, "total": len(job.queries), "status_url": f"/chat/batch/{job.id}", "stream_url": f"/chat/batch/{job.id}/stream"}), 202
+
+@bp.route('/chat/batch/<job_id>', methods=['GET'])
+def chat_batch_status(job_id):
+    """Status plus the results completed after the first ?since=N (completion order); ?wait=S long-polls up to 30 s for a new one."""
+    job = batch_jobs.get(job_id)
+    if job is None: return jsonify({"error": "Unknown or expired batch job"}), 404
+    since = max(request.args.get('since', 0, type=int), 0)
+    job.results_since(since, timeout=min(max(request.args.get('wait', 0, type=float), 0), 30))
+    return jsonify(job.status(since))
+
+@bp.route('/chat/batch/<job_id>/stream', methods=['GET'])
+def chat_batch_stream(job_id):
+    """Server-Sent Events: one "result" event per completed question, then "done"."""
+    job = batch_jobs.get(job_id)
+    if job is None: return jsonify({"error": "Unknown or expired batch job"}), 404
+
+    def generate():
+        sent = 0
+        while True:
+            results = job.results_since(sent, timeout=10)
+            if not results and not job.done: yield ": keep-alive\n\n"; continue
+            for result in results: yield f"event: result\ndata: {json.dumps(result, default=str)}\n\n"
+            sent += len(results)
+            if job.done and sent >= len(job.queries): yield f"event: done\ndata: {json.dumps({'job_id': job.id, 'total': len(job.queries)})}\n\n"; return
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+@bp.route('/api/stats', methods=['GET'])
+def engine_stats():
+    # Hit / miss / coalesced counts of the response and SQL caches, plus DB pool checkout counters
+    return jsonify(dict(get_engine_stats(), batch_jobs=batch_jobs.get_stats(), insight_refresh=get_refresh_stats()))
+
+@bp.route('/api/admin/result-cache', methods=['GET'])
+def result_cache_stats():
+    denied = _admin_denied()
+    if denied: return denied
+    return jsonify(get_engine_stats()["result_cache"])
+
+@bp.route('/api/admin/result-cache/invalidate', methods=['POST'])
+def invalidate_result_cache():
+    """Body: {"tables": ["OTM.SHIPMENT", ...]} drops the results that read those tables; {"all": true} drops everything."""
+    denied = _admin_denied()
+    if denied: return denied
+    payload = request.get_json(silent=True) or {}; tables = payload.get('tables')
+    if payload.get('all') is True: return jsonify(invalidate_cached_results())
+    if not isinstance(tables, list) or not tables or not all(isinstance(t, str) and t.strip() for t in tables):
+        return jsonify({"error": "Provide 'tables' (a list of table names like OTM.SHIPMENT) or 'all': true"}), 400
+    return jsonify(invalidate_cached_results(tables))
+
 @bp.route('/insights')
 def insights_page(): return render_template('insights.html')
 
 @bp.route('/api/workplaces', methods=['GET'])
 def get_workplaces():
-    data = load_insights_data()
-    workplaces_list = [{"id": wid, "name": wdata["name"]} for wid, wdata in data.get("workplaces", {}).items()]
-    return jsonify(workplaces_list)
+    return jsonify(get_insights_store().list_workplaces())
 
 @bp.route('/api/workplaces', methods=['POST'])
 def create_workplace():
     payload = request.json; workplace_name = payload.get('name')
     if not workplace_name: return jsonify({"error": "Workplace name required"}), 400
-    data = load_insights_data()
-    for w_data in data.get("workplaces", {}).values():
-        if w_data["name"] == workplace_name: return jsonify({"error": f"Workplace '{workplace_name}' exists"}), 409
-    workplace_id = "wp_" + str(uuid.uuid4().hex[:8])
-    data.setdefault("workplaces", {})[workplace_id] = {"name": workplace_name, "insights": []}
-    # Optionally set the new workplace as active, or let user select
-    # data["activeWorkplaceId"] = workplace_id 
-    save_insights_data(data)
+    workplace_id = get_insights_store().create_workplace(workplace_name)
+    if not workplace_id: return jsonify({"error": f"Workplace '{workplace_name}' exists"}), 409
     return jsonify({"message": "Workplace created", "id": workplace_id, "name": workplace_name}), 201
 
 @bp.route('/api/workplaces/<workplace_id>', methods=['DELETE'])
 def delete_workplace(workplace_id):
-    data = load_insights_data()
-    if workplace_id == DEFAULT_WORKPLACE_ID and len(data.get("workplaces", {})) <= 1 :
+    if workplace_id == DEFAULT_WORKPLACE_ID and get_insights_store().count_workplaces() <= 1:
         return jsonify({"error": "Cannot delete the last default workplace."}), 403
-    
-    if workplace_id in data.get("workplaces", {}):
-        deleted_wp_name = data["workplaces"][workplace_id].get("name", workplace_id)
-        del data["workplaces"][workplace_id]
-        
-        if data.get("activeWorkplaceId") == workplace_id:
-            # Set active to another existing workplace, or to default if it exists, or make a new default
-            data["activeWorkplaceId"] = next(iter(data.get("workplaces", {})), None) 
-            if not data["activeWorkplaceId"]: # No other workplaces left
-                data["workplaces"][DEFAULT_WORKPLACE_ID] = {"name": DEFAULT_WORKPLACE_NAME, "insights": []}
-                data["activeWorkplaceId"] = DEFAULT_WORKPLACE_ID
-        
-        save_insights_data(data)
+    # If the last workplace goes, the store recreates the default one
+    deleted_wp_name = get_insights_store().delete_workplace(workplace_id)
+    if deleted_wp_name is not None:
         return jsonify({"message": f"Workplace '{deleted_wp_name}' deleted successfully"}), 200
     return jsonify({"error": f"Workplace {workplace_id} not found"}), 404
 
+def _conditional(response, etag):
+    """Sets the ETag (clients revalidate every time) and answers 304 when it matches the request's If-None-Match."""
+    response.set_etag(etag); response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
 @bp.route('/api/workplaces/<workplace_id>/insights', methods=['GET'])
 def get_insights_for_workplace(workplace_id):
-    data = load_insights_data()
-    workplace = data.get("workplaces", {}).get(workplace_id)
-    if workplace: 
-        return jsonify(workplace.get("insights", []))
-    
-    # Fallback or error if specific workplace not found
-    # For now, let's be strict and return 404 if not found, rather than defaulting.
-    # Client-side can then decide to load default if this fails.
-    # default_wp_data = data.get("workplaces",{}).get(DEFAULT_WORKPLACE_ID, {"insights":[]})
-    # print(f"Workplace {workplace_id} not found, attempting to return default insights for {DEFAULT_WORKPLACE_ID}.")
-    # return jsonify(default_wp_data.get("insights",[])) 
-    return jsonify({"error": f"Workplace {workplace_id} not found"}), 404
+    """
+    One page (?offset, ?limit) of the workplace's insights as metadata: no chart / table body, but its payload_hash.
+    The bodies come from /api/workplaces/<workplace_id>/insights/<insight_id>/payload.
+    """
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', INSIGHTS_PAGE_SIZE, type=int), 1), INSIGHTS_MAX_PAGE_SIZE)
+    listed = get_insights_store().list_insights(workplace_id, offset=offset, limit=limit)
+    # Strict 404 rather than defaulting; the client can decide to load the default workplace instead.
+    if listed is None: return jsonify({"error": f"Workplace {workplace_id} not found"}), 404
+    insights, total = listed
+    page = {"insights": insights, "total": total, "offset": offset, "limit": limit, "next_offset": offset + len(insights) if offset + len(insights) < total else None}
+    body = json.dumps(page)
+    return _conditional(Response(body, mimetype='application/json'), hashlib.sha256(body.encode("utf-8")).hexdigest())
+
+@bp.route('/api/workplaces/<workplace_id>/insights/<insight_id>/payload', methods=['GET'])
+def get_insight_payload(workplace_id, insight_id):
+    """The insight's chart / table body ({"type", "data", "options"}); its ETag is the content hash from the list."""
+    found = get_insights_store().get_insight_payload(workplace_id, insight_id)
+    if found is None: return jsonify({"error": "Insight not found"}), 404
+    blob_hash, body = found
+    if body is None: return jsonify({"type": None, "data": None, "options": None})
+    return _conditional(Response(body, mimetype='application/json'), blob_hash)
 
 
 @bp.route('/api/workplaces/<workplace_id>/insights', methods=['POST'])
 def save_insight_to_workplace(workplace_id):
+    """Saves an insight; one from a recent chat answer keeps its SQL and is refreshed every refresh_seconds (optional)."""
     insight_data = request.json
     if not insight_data or not insight_data.get("id"): return jsonify({"error": "Insight data/ID missing"}), 400
-    data = load_insights_data()
-    
-    if workplace_id not in data.get("workplaces", {}):
-        # Option: create workplace if it doesn't exist, or error out
-        # For now, error out if specific workplace ID is provided and not found
+    workplace = get_insights_store().get_workplace(workplace_id)
+    if not workplace:
         return jsonify({"error": f"Target workplace {workplace_id} not found."}), 404
-
-    workplace = data["workplaces"][workplace_id]
-    existing_insight_index = next((i for i, insight in enumerate(workplace.get("insights",[])) if insight.get("id") == insight_data.get("id")), -1)
-    if existing_insight_index != -1:
-        print(f"Insight {insight_data.get('id')} already in {workplace_id}. Updating.")
-        workplace["insights"][existing_insight_index] = insight_data
-    else:
-        workplace.setdefault("insights", []).append(insight_data)
-    save_insights_data(data)
-    return jsonify({"message": f"Insight saved to workplace '{workplace['name']}' successfully"}), 201
+    refresh_seconds = refresh_interval(insight_data.pop("refresh_seconds", None))
+    sql = get_answer_sql(insight_data["id"]) # Looked up server-side; SQL sent by the client is never stored
+    insight_data.pop("sql", None)
+    outcome = get_insights_store().save_insight(workplace_id, insight_data, sql=sql, refresh_seconds=refresh_seconds)
+    if outcome is None: return jsonify({"error": f"Target workplace {workplace_id} not found."}), 404
+    if outcome == "updated": print(f"Insight {insight_data.get('id')} already in {workplace_id}. Updating.")
+    result = {"message": f"Insight saved to workplace '{workplace['name']}' successfully", "refreshable": bool(sql)}
+    if not sql: result["warning"] = "No stored query was found for this answer, so the insight is saved as a snapshot and will not be refreshed."
+    return jsonify(result), 201
 
 @bp.route('/api/workplaces/<workplace_id>/insights/<insight_id>', methods=['DELETE'])
 def delete_insight_from_workplace(workplace_id, insight_id):
-    data = load_insights_data(); workplace = data.get("workplaces", {}).get(workplace_id)
-    if not workplace: return jsonify({"error": "Workplace not found"}), 404
-    initial_len = len(workplace.get("insights", []))
-    workplace["insights"] = [i for i in workplace.get("insights", []) if i.get("id") != insight_id]
-    if len(workplace["insights"]) < initial_len:
-        save_insights_data(data); return jsonify({"message": "Insight deleted"}), 200
+    if not get_insights_store().get_workplace(workplace_id): return jsonify({"error": "Workplace not found"}), 404
+    if get_insights_store().delete_insight(workplace_id, insight_id):
+        return jsonify({"message": "Insight deleted"}), 200
     return jsonify({"error": "Insight not found"}), 404
 
 @bp.route('/charts')
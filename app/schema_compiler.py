@@ -0,0 +1,205 @@
+# project_root/app/schema_compiler.py
+"""
+Compiles a schema CSV (mainTableName, COLUMN_NAME, DATA_TYPE, referenceTableName, refColumnName,
+optional TABLE_DESCRIPTION / COLUMN_DESCRIPTION) into a compact, versioned binary artifact.
+
+The artifact holds the tables, columns, PK/FK flags and the rendered Chroma document strings, built
+with vectorized pandas operations. It is written next to the CSV as `<csv>.compiled` and rebuilt
+automatically when the CSV changes, so indexing and retrieval never re-parse the CSV row by row.
+"""
+import os
+import json
+import pickle
+import hashlib
+import threading
+
+ARTIFACT_MAGIC = b"STGSCHEMA"
+ARTIFACT_VERSION = 1
+NULL_LIKE_REFERENCES = ['NULL', 'Null', 'null']
+
+
+def content_id(prefix, document, metadata):
+    """Stable ID derived from the document content: unchanged documents keep their ID across re-indexing runs."""
+    digest = hashlib.sha1((document + "\x00" + json.dumps(metadata, sort_keys=True)).encode("utf-8")).hexdigest()[:16]
+    return f"{prefix}_{digest}"
+
+def default_artifact_path(csv_path):
+    return f"{csv_path}.compiled"
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class CompiledSchema:
+    """
+    Columnar view of a schema: one entry per table in `table_*`, one entry per column in `col_*`
+    (col_table_idx points into the table arrays). Document strings are pre-rendered.
+    """
+
+    def __init__(self, source, table_names, table_descriptions, table_documents, col_table_idx, col_names,
+                 col_types, col_descriptions, col_is_pk, col_fk_tables, col_fk_columns, col_documents):
+        self.source = source
+        self.table_names = table_names
+        self.table_descriptions = table_descriptions
+        self.table_documents = table_documents
+        self.col_table_idx = col_table_idx
+        self.col_names = col_names
+        self.col_types = col_types
+        self.col_descriptions = col_descriptions
+        self.col_is_pk = col_is_pk
+        self.col_fk_tables = col_fk_tables
+        self.col_fk_columns = col_fk_columns
+        self.col_documents = col_documents
+
+    @property
+    def num_tables(self): return len(self.table_names)
+
+    @property
+    def num_columns(self): return len(self.col_names)
+
+    def table_column_ranges(self):
+        """(start, stop) slice into the col_* arrays for each table; columns of a table are contiguous."""
+        import numpy as np
+        bounds = np.searchsorted(self.col_table_idx, np.arange(self.num_tables + 1))
+        return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+    def to_structure(self):
+        """Same {"tables": [...]} structure load_schema_from_csv has always returned."""
+        tables = []
+        for t_idx, (start, stop) in enumerate(self.table_column_ranges()):
+            columns = []
+            for c in range(start, stop):
+                fk = {"references_table": self.col_fk_tables[c], "references_column": self.col_fk_columns[c]} if self.col_fk_tables[c] is not None else None
+                columns.append({"name": self.col_names[c], "type": self.col_types[c], "description": self.col_descriptions[c],
+                                "primary_key": bool(self.col_is_pk[c]), "foreign_key": fk})
+            tables.append({"name": self.table_names[t_idx], "description": self.table_descriptions[t_idx], "columns": columns})
+        return {"tables": tables}
+
+    def documents(self):
+        """(documents, metadatas, ids) for Chroma, in the order create_schema_documents_from_structure produces them."""
+        documents, metadatas, ids = [], [], []
+        for t_idx, (start, stop) in enumerate(self.table_column_ranges()):
+            table_name = self.table_names[t_idx]
+            table_slug = table_name.lower().replace(' ', '_')
+            table_meta = {"type": "table", "table_name": table_name, "source": "csv_schema"}
+            documents.append(self.table_documents[t_idx]); metadatas.append(table_meta)
+            ids.append(content_id(f"table_{table_slug}", self.table_documents[t_idx], table_meta))
+            for c in range(start, stop):
+                col_name = self.col_names[c]
+                col_meta = {"type": "column", "table_name": table_name, "column_name": col_name, "source": "csv_schema"}
+                documents.append(self.col_documents[c]); metadatas.append(col_meta)
+                ids.append(content_id(f"col_{table_slug}_{col_name.lower().replace(' ', '_')}", self.col_documents[c], col_meta))
+        return documents, metadatas, ids
+
+
+def compile_schema_csv(csv_path):
+    """Builds a CompiledSchema from the CSV with vectorized pandas operations (no per-row Python loop)."""
+    import numpy as np
+    import pandas as pd # Only needed when the artifact is (re)built
+    df = pd.read_csv(csv_path, dtype=str, keep_default_na=True)
+    for ref_col in ('referenceTableName', 'refColumnName'):
+        df[ref_col] = df[ref_col].where(df[ref_col].notna() & ~df[ref_col].isin(NULL_LIKE_REFERENCES), None)
+
+    table_col = df['mainTableName']
+    table_desc = df['TABLE_DESCRIPTION'] if 'TABLE_DESCRIPTION' in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+    table_desc = table_desc.fillna("Table containing " + table_col.str.lower() + " data.")
+    col_desc = df['COLUMN_DESCRIPTION'] if 'COLUMN_DESCRIPTION' in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+    col_desc = col_desc.fillna("Column named " + df['COLUMN_NAME'] + ".")
+    col_type = df['DATA_TYPE'].fillna("")
+
+    has_fk = (df['referenceTableName'].notna() & df['refColumnName'].notna()).to_numpy()
+    upper_names = df['COLUMN_NAME'].str.upper()
+    # PK heuristic (unchanged from the row-by-row loader): *ID / *SEQ_NO columns, except FKs that reference their own table
+    looks_like_key = (upper_names.str.endswith('ID') | upper_names.str.endswith('SEQ_NO')).to_numpy()
+    self_reference = (df['referenceTableName'] == table_col).fillna(False).to_numpy(dtype=bool)
+    is_pk = looks_like_key & ~(has_fk & self_reference)
+
+    fk_table = df['referenceTableName'].fillna("")
+    fk_column = df['refColumnName'].fillna("")
+    pk_doc_suffix = np.where(is_pk, " This column is a primary key.", "")
+    fk_doc_suffix = np.where(has_fk, " This column is a foreign key referencing table " + fk_table + ", column " + fk_column + ".", "")
+    col_documents = ("Table: " + table_col + ", Column: " + df['COLUMN_NAME'] + ". Type: " + col_type + ". Description: " + col_desc + "."
+                     + pk_doc_suffix + fk_doc_suffix)
+    pk_info_suffix = np.where(is_pk, " This is a primary key.", "")
+    fk_info_suffix = np.where(has_fk, " This is a foreign key referencing " + fk_table + "(" + fk_column + ").", "")
+    col_infos = "Column: " + df['COLUMN_NAME'] + " (Type: " + col_type + "). Description: " + col_desc + pk_info_suffix + fk_info_suffix
+
+    # Group columns by table, keeping first-appearance order of tables and CSV order within each table
+    table_codes, table_names = pd.factorize(table_col, sort=False)
+    order = np.argsort(table_codes, kind="stable")
+    grouped_infos = pd.Series(col_infos.to_numpy()[order]).groupby(table_codes[order], sort=True).agg(" | ".join)
+    first_rows = pd.Series(np.arange(len(df))[order]).groupby(table_codes[order], sort=True).first().to_numpy()
+    table_descriptions = table_desc.to_numpy()[first_rows]
+    table_documents = ("Table: " + pd.Series(table_names, dtype=object) + ". Description: " + pd.Series(table_descriptions, dtype=object)
+                       + ". Columns include: " + grouped_infos.reset_index(drop=True))
+
+    fk_tables_out = np.where(has_fk, df['referenceTableName'].to_numpy(dtype=object), None)[order]
+    fk_columns_out = np.where(has_fk, df['refColumnName'].to_numpy(dtype=object), None)[order]
+    source = dict(_source_signature(csv_path), path=os.path.abspath(csv_path))
+    return CompiledSchema(
+        source=source,
+        table_names=[str(t) for t in table_names],
+        table_descriptions=table_descriptions.tolist(),
+        table_documents=table_documents.tolist(),
+        col_table_idx=table_codes[order].astype(np.int32),
+        col_names=df['COLUMN_NAME'].to_numpy(dtype=object)[order].tolist(),
+        col_types=col_type.to_numpy(dtype=object)[order].tolist(),
+        col_descriptions=col_desc.to_numpy(dtype=object)[order].tolist(),
+        col_is_pk=is_pk[order],
+        col_fk_tables=fk_tables_out.tolist(),
+        col_fk_columns=fk_columns_out.tolist(),
+        col_documents=col_documents.to_numpy(dtype=object)[order].tolist(),
+    )
+
+def write_artifact(compiled, artifact_path):
+    tmp_path = f"{artifact_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(ARTIFACT_MAGIC + ARTIFACT_VERSION.to_bytes(2, "little"))
+        pickle.dump(compiled.__dict__, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, artifact_path) # Atomic: readers never see a half-written artifact
+
+def read_artifact(artifact_path):
+    """Returns the CompiledSchema stored at artifact_path, or None if it is missing or from another format version."""
+    try:
+        with open(artifact_path, "rb") as f:
+            header = f.read(len(ARTIFACT_MAGIC) + 2)
+            if header[:len(ARTIFACT_MAGIC)] != ARTIFACT_MAGIC or int.from_bytes(header[len(ARTIFACT_MAGIC):], "little") != ARTIFACT_VERSION:
+                return None
+            state = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    compiled = CompiledSchema.__new__(CompiledSchema)
+    compiled.__dict__.update(state)
+    return compiled
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def load_compiled_schema(csv_path, artifact_path=None):
+    """
+    Returns the CompiledSchema for csv_path: from memory, else from the on-disk artifact, else compiled
+    from the CSV (and written back as the artifact). Raises FileNotFoundError if the CSV doesn't exist.
+    """
+    artifact_path = artifact_path or default_artifact_path(csv_path)
+    signature = _source_signature(csv_path)
+    key = os.path.abspath(csv_path)
+    with _loaded_lock:
+        cached = _loaded.get(key)
+        if cached is not None and all(cached.source.get(k) == v for k, v in signature.items()): return cached
+        compiled = read_artifact(artifact_path)
+        if compiled is None or any(compiled.source.get(k) != v for k, v in signature.items()):
+            compiled = compile_schema_csv(csv_path)
+            try: write_artifact(compiled, artifact_path)
+            except OSError as e: print(f"Warning: could not write schema artifact {artifact_path}: {e}")
+        _loaded[key] = compiled
+        return compiled
+
+
+if __name__ == "__main__":
+    import sys
+    csv_to_compile = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(__file__), "..", "schema2.csv")
+    compiled_schema = compile_schema_csv(csv_to_compile)
+    write_artifact(compiled_schema, default_artifact_path(csv_to_compile))
+    print(f"Compiled {compiled_schema.num_tables} tables / {compiled_schema.num_columns} columns into {default_artifact_path(csv_to_compile)}")
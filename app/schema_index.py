@@ -1,17 +1,46 @@
 # project_root/app/schema_index.py
-import chromadb
 import os
-import pandas as pd
+import hashlib
+import threading
+
+if __name__ == "__main__" and __package__ is None:
+    from schema_compiler import CompiledSchema, load_compiled_schema, content_id
+    from lexical_index import get_lexical_index, LEXICAL_INDEX_ENABLED
+    from join_graph import get_join_graph, tables_in_documents, JOIN_GRAPH_ENABLED
+else:
+    from .schema_compiler import CompiledSchema, load_compiled_schema, content_id
+    from .lexical_index import get_lexical_index, LEXICAL_INDEX_ENABLED
+    from .join_graph import get_join_graph, tables_in_documents, JOIN_GRAPH_ENABLED
 
 # --- Configuration ---
 # Path to your schema CSV file (relative to project_root)
 SCHEMA_CSV_FILE_PATH = os.path.join(os.path.dirname(__file__), "..", "schema2.csv") 
 
 CHROMA_DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "chroma_data")
-os.makedirs(CHROMA_DATA_PATH, exist_ok=True) # Ensure the directory exists
-
-client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
 SCHEMA_COLLECTION_NAME = "logistics_schema_csv_v1" # Changed collection name for clarity
+INDEX_BATCH_SIZE = int(os.environ.get("SCHEMA_INDEX_BATCH_SIZE", 256)) # Documents per embedding/upsert call
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_chroma_client():
+    """The ChromaDB client, created on first use (importing chromadb alone takes about a second)."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import chromadb
+                os.makedirs(CHROMA_DATA_PATH, exist_ok=True) # Ensure the directory exists
+                _client = chromadb.PersistentClient(path=CHROMA_DATA_PATH)
+    return _client
+
+def warm_up_schema_index(collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH):
+    """Opens the Chroma client and collection and loads the compiled schema, so the first question doesn't pay for it."""
+    try: get_chroma_client().get_collection(name=collection_name)
+    except Exception as e: print(f"Warning: schema collection '{collection_name}' not available yet: {e}")
+    compiled = load_compiled_schema_or_none(csv_path)
+    if compiled is not None and LEXICAL_INDEX_ENABLED: get_lexical_index(compiled)
+    if compiled is not None and JOIN_GRAPH_ENABLED: get_join_graph(compiled)
 
 # Optional: OpenAI embeddings (ensure OPENAI_API_KEY is set in .env)
 # from dotenv import load_dotenv
@@ -28,13 +57,14 @@ def load_schema_from_csv(csv_path):
     Expected CSV columns: mainTableName, COLUMN_NAME, DATA_TYPE, 
                            referenceTableName, refColumnName
                            (Optional: TABLE_DESCRIPTION, COLUMN_DESCRIPTION)
+    The CSV is parsed once into a compiled artifact (see schema_compiler.py) that later calls reuse.
     """
-    try:
-        df = pd.read_csv(csv_path)
-        # Replace NaN or NULL-like strings in reference columns with None for easier handling
-        df['referenceTableName'] = df['referenceTableName'].replace(['NULL', 'Null', 'null', float('nan')], None)
-        df['refColumnName'] = df['refColumnName'].replace(['NULL', 'Null', 'null', float('nan')], None)
+    compiled = load_compiled_schema_or_none(csv_path)
+    return compiled.to_structure() if compiled else None
 
+def load_compiled_schema_or_none(csv_path=SCHEMA_CSV_FILE_PATH):
+    try:
+        return load_compiled_schema(csv_path)
     except FileNotFoundError:
         print(f"Error: Schema CSV file not found at {csv_path}")
         return None
@@ -42,55 +72,15 @@ def load_schema_from_csv(csv_path):
         print(f"Error reading schema CSV: {e}")
         return None
 
-    tables_data = {}
-    for _, row in df.iterrows():
-        table_name = row['mainTableName']
-        if table_name not in tables_data:
-            tables_data[table_name] = {
-                "name": table_name,
-                # Check if TABLE_DESCRIPTION column exists in CSV, otherwise default
-                "description": row.get('TABLE_DESCRIPTION', f"Table containing {table_name.lower()} data."), 
-                "columns": []
-            }
-        
-        column_info = {
-            "name": row['COLUMN_NAME'],
-            "type": row['DATA_TYPE'],
-            # Check if COLUMN_DESCRIPTION column exists, otherwise default
-            "description": row.get('COLUMN_DESCRIPTION', f"Column named {row['COLUMN_NAME']}."),
-            "primary_key": False, # Assuming CSV doesn't directly state PK. This might need adjustment.
-                                  # Or you can add a 'IS_PRIMARY_KEY' column to your CSV.
-            "foreign_key": None
-        }
-
-        if pd.notna(row['referenceTableName']) and pd.notna(row['refColumnName']):
-            column_info["foreign_key"] = {
-                "references_table": row['referenceTableName'],
-                "references_column": row['refColumnName']
-            }
-        
-        # A simple heuristic for primary keys (e.g., if column name ends with ID or SEQ_NO)
-        # This is just an example; a dedicated column in CSV is better.
-        if row['COLUMN_NAME'].upper().endswith('ID') or row['COLUMN_NAME'].upper().endswith('SEQ_NO'):
-             # To avoid marking all IDs as PK if it's a FK, check if it's already an FK
-            if not column_info["foreign_key"] or column_info["foreign_key"]["references_table"] != table_name : # crude check
-                 column_info["primary_key"] = True
-
-
-        tables_data[table_name]["columns"].append(column_info)
-    
-    # Convert the dictionary of tables into a list format similar to LOGISTICS_SCHEMA
-    schema_structure = {"tables": list(tables_data.values())}
-    return schema_structure
-
 def create_schema_documents_from_structure(schema_data):
     """
     Creates text documents from the restructured schema data (from CSV).
+    A CompiledSchema can be passed instead, in which case its pre-rendered documents are returned.
     """
+    if isinstance(schema_data, CompiledSchema): return schema_data.documents()
     documents = []
     metadatas = []
     ids = []
-    doc_id_counter = 1
 
     if not schema_data or not schema_data.get("tables"):
         print("No table data found in the processed schema structure.")
@@ -117,8 +107,7 @@ def create_schema_documents_from_structure(schema_data):
 
         documents.append(table_doc_content)
         metadatas.append({"type": "table", "table_name": table_name, "source": "csv_schema"})
-        ids.append(f"table_{table_name.lower().replace(' ', '_')}_{doc_id_counter}")
-        doc_id_counter += 1
+        ids.append(content_id(f"table_{table_name.lower().replace(' ', '_')}", table_doc_content, metadatas[-1]))
 
         # Individual documents for each column
         for column in table.get("columns", []):
@@ -140,64 +129,65 @@ def create_schema_documents_from_structure(schema_data):
                 "column_name": col_name,
                 "source": "csv_schema"
             })
-            ids.append(f"col_{table_name.lower().replace(' ', '_')}_{col_name.lower().replace(' ', '_')}_{doc_id_counter}")
-            doc_id_counter += 1
+            ids.append(content_id(f"col_{table_name.lower().replace(' ', '_')}_{col_name.lower().replace(' ', '_')}", col_doc_content, metadatas[-1]))
             
     return documents, metadatas, ids
 
-def index_schema(collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH):
+def _batches(items, size):
+    for start in range(0, len(items), size): yield items[start:start + size]
+
+def index_schema(collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH, batch_size=INDEX_BATCH_SIZE):
     """
-    Initializes ChromaDB, loads schema from CSV, and indexes schema documents.
+    Incrementally indexes schema documents from the CSV into ChromaDB.
+
+    Document IDs are content hashes, so only new or changed documents are embedded (upserted in
+    batches of `batch_size`), and documents no longer produced from the CSV are deleted afterwards.
+    The collection is never dropped, so queries keep working while a re-index runs.
     """
     print(f"Initializing ChromaDB client with persistence at: {CHROMA_DATA_PATH}")
-    
     # Determine embedding function
     # current_embedding_function = openai_ef if "openai_ef" in globals() else None
     # if current_embedding_function:
     #     print("Using OpenAI embeddings.")
-    #     collection = client.get_or_create_collection(name=collection_name, embedding_function=current_embedding_function)
+    #     collection = get_chroma_client().get_or_create_collection(name=collection_name, embedding_function=current_embedding_function)
     # else:
     print("Using default ChromaDB embeddings (Sentence Transformers).")
-    collection = client.get_or_create_collection(name=collection_name)
-    
+    collection = get_chroma_client().get_or_create_collection(name=collection_name)
     print(f"Using collection: '{collection_name}'")
 
-    print("Clearing existing collection (if any) and re-indexing schema for development...")
-    try:
-        client.delete_collection(name=collection_name)
-    except Exception as e:
-        print(f"Note: Could not delete collection (it might not exist yet): {e}")
-    
-    # Recreate the collection (with specific embedding function if chosen)
-    # if current_embedding_function:
-    #    collection = client.get_or_create_collection(name=collection_name, embedding_function=current_embedding_function)
-    # else:
-    collection = client.get_or_create_collection(name=collection_name)
-
-
-    # Load schema from CSV
-    schema_structure = load_schema_from_csv(csv_path)
-    if not schema_structure:
+    # Load schema from the compiled artifact (recompiled from the CSV if it changed)
+    compiled_schema = load_compiled_schema_or_none(csv_path)
+    if not compiled_schema:
         print("Failed to load or process schema from CSV. Aborting indexing.")
         return
 
-    documents, metadatas, ids = create_schema_documents_from_structure(schema_structure)
+    documents, metadatas, ids = create_schema_documents_from_structure(compiled_schema)
     
     if not documents:
         print("No schema documents generated. Please check your CSV file and processing logic.")
         return
 
     print(f"Generated {len(documents)} documents for indexing from CSV.")
-    
+
     try:
-        # Ensure no duplicate IDs if re-running without clearing effectively
-        # Or handle by add/update logic if ChromaDB version supports it easily
-        collection.add(
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        print(f"Successfully indexed {len(documents)} schema documents into collection '{collection_name}'.")
+        existing_ids = set(collection.get(include=[])["ids"])
+        wanted = {doc_id: (doc, meta) for doc_id, doc, meta in zip(ids, documents, metadatas)} # Also drops duplicate documents
+        to_upsert = [doc_id for doc_id in wanted if doc_id not in existing_ids]
+        to_delete = [doc_id for doc_id in existing_ids if doc_id not in wanted]
+        print(f"Index diff: {len(to_upsert)} new/changed, {len(to_delete)} removed, {len(wanted) - len(to_upsert)} unchanged.")
+
+        for batch_ids in _batches(to_upsert, batch_size):
+            collection.upsert(ids=batch_ids, documents=[wanted[i][0] for i in batch_ids], metadatas=[wanted[i][1] for i in batch_ids])
+            print(f"  Upserted {len(batch_ids)} documents.")
+        # Deleted last, so retrieval always sees either the old or the new version of a document
+        for batch_ids in _batches(to_delete, batch_size):
+            collection.delete(ids=batch_ids)
+            print(f"  Deleted {len(batch_ids)} stale documents.")
+
+        content_hash = hashlib.sha1("\n".join(sorted(wanted)).encode("utf-8")).hexdigest()
+        if (collection.metadata or {}).get("content_hash") != content_hash:
+            collection.modify(metadata={**(collection.metadata or {}), "content_hash": content_hash})
+        print(f"Successfully indexed schema documents into collection '{collection_name}'.")
         print(f"Total documents in collection: {collection.count()}")
     except Exception as e:
         print(f"Error indexing documents: {e}")
@@ -207,7 +197,7 @@ def query_schema(query_texts, n_results=10, collection_name=SCHEMA_COLLECTION_NA
     Queries the schema collection in ChromaDB.
     """
     try:
-        collection_to_query = client.get_collection(name=collection_name) # Use get_collection for querying
+        collection_to_query = get_chroma_client().get_collection(name=collection_name) # Use get_collection for querying
         results = collection_to_query.query(
             query_texts=query_texts,
             n_results=n_results,
@@ -219,11 +209,89 @@ def query_schema(query_texts, n_results=10, collection_name=SCHEMA_COLLECTION_NA
         print(f"Error querying schema in collection '{collection_name}': {e}. Collection might not exist or be empty.")
         return None
 
+RRF_K = 60 # Reciprocal rank fusion constant used to merge lexical and vector rankings
+_retrieval_stats = {"lexical_only": 0, "hybrid": 0, "vector_only": 0}
+_retrieval_stats_lock = threading.Lock()
+
+def _count_retrieval(kind):
+    with _retrieval_stats_lock: _retrieval_stats[kind] += 1
+
+def _lexical_search(query, n_results, csv_path):
+    """(lexical hits, whether they alone answer the question) for retrieve_schema_parts / retrieve_schema_parts_batch."""
+    compiled = load_compiled_schema_or_none(csv_path) if LEXICAL_INDEX_ENABLED else None
+    if compiled is None: return [], False
+    return get_lexical_index(compiled).search(query, n_results=n_results)
+
+def _fuse(lexical_docs, vector_docs, n_results):
+    if not lexical_docs:
+        _count_retrieval("vector_only"); return list(vector_docs)
+    _count_retrieval("hybrid")
+    fused = {}
+    for ranking in (lexical_docs, vector_docs):
+        for rank, doc in enumerate(ranking): fused[doc] = fused.get(doc, 0.0) + 1.0 / (RRF_K + rank)
+    return sorted(fused, key=lambda doc: -fused[doc])[:n_results]
+
+def retrieve_schema_parts(query, n_results=12, collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH):
+    """
+    Hybrid schema retrieval: exact identifier + BM25 hits from the lexical index (lexical_index.py),
+    merged with the Chroma vector search by reciprocal rank fusion. When every table/column name written
+    in the question matched exactly, the lexical results are returned alone and no embedding is computed.
+    Returns a list of document strings (empty if nothing was found).
+    """
+    lexical_docs, confident = _lexical_search(query, n_results, csv_path)
+    if confident and lexical_docs:
+        _count_retrieval("lexical_only"); return lexical_docs
+    vector_results = query_schema(query_texts=[query], n_results=n_results, collection_name=collection_name)
+    vector_docs = vector_results["documents"][0] if vector_results and vector_results.get("documents") else []
+    return _fuse(lexical_docs, vector_docs, n_results)
+
+def retrieve_schema_parts_batch(queries, n_results=12, collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH):
+    """retrieve_schema_parts for many questions: the ones that need the vector search share one multi-text query_schema call."""
+    results, pending = {}, {}
+    for query in dict.fromkeys(queries):
+        lexical_docs, confident = _lexical_search(query, n_results, csv_path)
+        if confident and lexical_docs: _count_retrieval("lexical_only"); results[query] = lexical_docs
+        else: pending[query] = lexical_docs
+    if pending:
+        vector_results = query_schema(query_texts=list(pending), n_results=n_results, collection_name=collection_name)
+        vector_lists = vector_results["documents"] if vector_results and vector_results.get("documents") else [[] for _ in pending]
+        for (query, lexical_docs), vector_docs in zip(pending.items(), vector_lists): results[query] = _fuse(lexical_docs, vector_docs, n_results)
+    return results
+
+def describe_joins(documents, csv_path=SCHEMA_CSV_FILE_PATH):
+    """Join path + key columns for the tables the retrieved documents belong to (see join_graph.py), or None."""
+    if not JOIN_GRAPH_ENABLED: return None
+    tables = tables_in_documents(documents)
+    compiled = load_compiled_schema_or_none(csv_path) if tables else None
+    return get_join_graph(compiled).describe(tables) if compiled is not None else None
+
+def get_retrieval_stats():
+    with _retrieval_stats_lock: return dict(_retrieval_stats)
+
+def get_schema_fingerprint(collection_name=SCHEMA_COLLECTION_NAME, csv_path=SCHEMA_CSV_FILE_PATH):
+    """
+    Returns a string that changes whenever the schema CSV or the Chroma collection changes.
+    Used by caches of LLM output that depend on the schema (see sql_cache.py).
+    """
+    try:
+        stat = os.stat(csv_path)
+        csv_part = f"{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        csv_part = "missing"
+    try:
+        collection = get_chroma_client().get_collection(name=collection_name)
+        # index_schema records a hash of the indexed document IDs (which are content hashes)
+        collection_part = (collection.metadata or {}).get("content_hash") or f"{collection.id}:{collection.count()}"
+    except Exception:
+        collection_part = "missing"
+    return f"csv={csv_part};collection={collection_part}"
+
 if __name__ == "__main__":
     print("Starting schema indexing process from CSV...")
     # Create a dummy database_schema.csv for testing if it doesn't exist
     dummy_csv_path = SCHEMA_CSV_FILE_PATH
     if not os.path.exists(dummy_csv_path):
+        import pandas as pd
         print(f"Creating a dummy '{os.path.basename(dummy_csv_path)}' for testing purposes.")
         dummy_data = {
             'mainTableName': ['ALLOCATION_BASE', 'ALLOCATION_BASE', 'ALLOCATION_BASE', 'ALLOCATION_BASE', 'ORDERS', 'ORDERS', 'ORDER_ITEMS', 'ORDER_ITEMS'],
@@ -243,7 +311,7 @@ if __name__ == "__main__":
     print("\n--- Testing schema query ---")
     # Ensure collection exists and has documents before querying
     try:
-        collection_for_test = client.get_collection(name=SCHEMA_COLLECTION_NAME)
+        collection_for_test = get_chroma_client().get_collection(name=SCHEMA_COLLECTION_NAME)
         if collection_for_test.count() > 0:
             test_queries = [
                 "allocated costs",
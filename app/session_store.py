@@ -0,0 +1,225 @@
+# project_root/app/session_store.py
+"""
+Server-side conversation sessions, keyed by the conversation_id chat.js sends, so a /chat request only carries
+the new question instead of the client re-sending the transcript.
+
+A session keeps its newest SESSION_KEEP_MESSAGES messages verbatim. Older messages are folded, as they fall out
+of that window, into a running extractive summary (one shortened line per message, the oldest lines dropped past
+SESSION_SUMMARY_TOKENS), so a session's size stays bounded however long the conversation gets.
+Sessions live in process memory, LRU-evicted past SESSION_MAX_SESSIONS / SESSION_MAX_MB and expired after
+SESSION_TTL_SECONDS without activity. With SESSION_SPILL_ENABLED, evicted sessions (and all sessions at exit) are
+written to SQLite and loaded back on their next request. Run one worker, or route a conversation to one worker.
+"""
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+if __name__ == "__main__" and __package__ is None:
+    from prompt_builder import count_tokens, summarize_messages
+else:
+    from .prompt_builder import count_tokens, summarize_messages
+
+# --- Configuration ---
+SESSION_STORE_ENABLED = os.environ.get("SESSION_STORE_ENABLED", "true").lower() == "true"
+SESSION_KEEP_MESSAGES = int(os.environ.get("SESSION_KEEP_MESSAGES", 6)) # Newest messages kept verbatim (3 Q&A turns)
+SESSION_SUMMARY_TOKENS = int(os.environ.get("SESSION_SUMMARY_TOKENS", 300))
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", 7 * 24 * 3600))
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", 5000))
+SESSION_MAX_BYTES = int(float(os.environ.get("SESSION_MAX_MB", 64)) * 1024 * 1024)
+SESSION_SPILL_ENABLED = os.environ.get("SESSION_SPILL_ENABLED", "true").lower() == "true"
+SESSION_SPILL_PATH = os.environ.get("SESSION_SPILL_PATH", os.path.join(os.path.dirname(__file__), "..", "sessions.sqlite3"))
+SESSION_MESSAGE_MAX_CHARS = 4000 # Longer messages are cut before they are stored
+
+
+class _Message:
+    """The .type / .content shape prompt_builder.summarize_messages expects."""
+    __slots__ = ("type", "content")
+
+    def __init__(self, role, content): self.type = "human" if role == "user" else "ai"; self.content = content
+
+
+class Session:
+    __slots__ = ("summary", "messages", "turns", "updated_at")
+
+    def __init__(self, summary="", messages=None, turns=0, updated_at=None):
+        self.summary = summary
+        self.messages = messages or [] # [{"role": "user" | "assistant", "content": ...}, ...], oldest first
+        self.turns = turns
+        self.updated_at = time.time() if updated_at is None else updated_at
+
+    @property
+    def size(self): return len(self.summary) + sum(len(m["content"]) + 32 for m in self.messages) + 128
+
+    def history(self):
+        """The session as conversation_history items: the summary first (role "summary"), then the verbatim messages."""
+        return ([{"role": "summary", "content": self.summary}] if self.summary else []) + [dict(m) for m in self.messages]
+
+    def to_json(self): return json.dumps({"summary": self.summary, "messages": self.messages, "turns": self.turns})
+
+    @classmethod
+    def from_json(cls, text, updated_at):
+        data = json.loads(text)
+        return cls(data.get("summary", ""), data.get("messages", []), data.get("turns", 0), updated_at)
+
+
+def fold_into_summary(summary, messages, budget=SESSION_SUMMARY_TOKENS):
+    """`summary` with one line per message of `messages` appended, oldest lines dropped to stay within `budget` tokens."""
+    new_lines = summarize_messages([_Message(m["role"], m["content"]) for m in messages], budget=budget)
+    lines = [line for line in (summary.split("\n") if summary else []) + (new_lines.split("\n") if new_lines else []) if line]
+    while lines and count_tokens("\n".join(lines)) > budget: lines.pop(0)
+    return "\n".join(lines)
+
+
+class SessionStore:
+    """In-memory LRU of Sessions by conversation id, with an optional SQLite spill for evicted sessions."""
+
+    def __init__(self, keep_messages=SESSION_KEEP_MESSAGES, summary_tokens=SESSION_SUMMARY_TOKENS, ttl_seconds=SESSION_TTL_SECONDS,
+                 max_sessions=SESSION_MAX_SESSIONS, max_bytes=SESSION_MAX_BYTES, spill_path=SESSION_SPILL_PATH if SESSION_SPILL_ENABLED else None):
+        self.keep_messages = keep_messages
+        self.summary_tokens = summary_tokens
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.spill_path = spill_path
+        self._sessions = OrderedDict() # Most recently used last
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "loaded": 0, "spilled": 0, "evicted": 0, "expired": 0, "turns": 0, "messages_summarized": 0}
+        if self.spill_path:
+            with self._connect() as conn:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("CREATE TABLE IF NOT EXISTS sessions (conversation_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.ttl_seconds,))
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.spill_path, timeout=5)
+        try:
+            with conn: yield conn
+        finally: conn.close()
+
+    def _bump(self, name, amount=1):
+        with self._lock: self._stats[name] += amount
+
+    def _load(self, conversation_id):
+        """The session from memory, else from the spill, else None (caller holds no lock)."""
+        with self._lock:
+            session = self._sessions.get(conversation_id)
+            if session is not None:
+                if session.updated_at + self.ttl_seconds > time.time():
+                    self._sessions.move_to_end(conversation_id); return session
+                del self._sessions[conversation_id]; self._bytes -= session.size; self._stats["expired"] += 1
+        if not self.spill_path: return None
+        try:
+            with self._connect() as conn:
+                row = conn.execute("SELECT data, updated_at FROM sessions WHERE conversation_id = ?", (conversation_id,)).fetchone()
+                if row is not None: conn.execute("DELETE FROM sessions WHERE conversation_id = ?", (conversation_id,)) # Memory is the live copy again
+        except sqlite3.Error as e:
+            print(f"Warning: could not read spilled session: {e}"); return None
+        if row is None: return None
+        if row[1] + self.ttl_seconds <= time.time(): self._bump("expired"); return None
+        self._bump("loaded")
+        session = Session.from_json(row[0], row[1])
+        self._store(conversation_id, session)
+        return session
+
+    def _store(self, conversation_id, session):
+        evicted = []
+        with self._lock:
+            old = self._sessions.pop(conversation_id, None)
+            if old is not None: self._bytes -= old.size
+            self._sessions[conversation_id] = session; self._bytes += session.size
+            while len(self._sessions) > 1 and (len(self._sessions) > self.max_sessions or self._bytes > self.max_bytes):
+                evicted_id, evicted_session = self._sessions.popitem(last=False)
+                self._bytes -= evicted_session.size; self._stats["evicted"] += 1
+                evicted.append((evicted_id, evicted_session))
+        if evicted: self._spill(evicted)
+
+    def _spill(self, sessions):
+        if not self.spill_path: return
+        try:
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO sessions (conversation_id, data, updated_at) VALUES (?, ?, ?)",
+                                 [(cid, session.to_json(), session.updated_at) for cid, session in sessions])
+            self._bump("spilled", len(sessions))
+        except sqlite3.Error as e: print(f"Warning: could not spill {len(sessions)} sessions: {e}")
+
+    def get_history(self, conversation_id):
+        """The conversation's history items (see Session.history), empty for an unknown conversation."""
+        session = self._load(conversation_id)
+        if session is None: return []
+        with self._lock: return session.history()
+
+    def append_turn(self, conversation_id, question, answer):
+        """Adds a question / answer pair, folding messages beyond keep_messages into the summary."""
+        session = self._load(conversation_id)
+        if session is None:
+            session = Session(); self._bump("created")
+        with self._lock:
+            if self._sessions.get(conversation_id) is session: # Re-added by _store() with its new size
+                del self._sessions[conversation_id]; self._bytes -= session.size
+            session.messages.append({"role": "user", "content": str(question or "")[:SESSION_MESSAGE_MAX_CHARS]})
+            session.messages.append({"role": "assistant", "content": str(answer or "")[:SESSION_MESSAGE_MAX_CHARS]})
+            session.turns += 1; session.updated_at = time.time()
+            overflow = len(session.messages) - self.keep_messages
+            if overflow > 0:
+                folded, session.messages = session.messages[:overflow], session.messages[overflow:]
+                session.summary = fold_into_summary(session.summary, folded, self.summary_tokens)
+                self._stats["messages_summarized"] += len(folded)
+            self._stats["turns"] += 1
+        self._store(conversation_id, session)
+
+    def end_session(self, conversation_id):
+        with self._lock:
+            session = self._sessions.pop(conversation_id, None)
+            if session is not None: self._bytes -= session.size
+        if self.spill_path:
+            with self._connect() as conn: conn.execute("DELETE FROM sessions WHERE conversation_id = ?", (conversation_id,))
+        return session is not None
+
+    def flush(self):
+        """Writes every in-memory session to the spill (at exit), so a restart keeps them."""
+        with self._lock: sessions = list(self._sessions.items())
+        if sessions: self._spill(sessions)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update(sessions=len(self._sessions), bytes=self._bytes, spill_enabled=bool(self.spill_path))
+        return stats
+
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store():
+    """The process-wide SessionStore, created on first use (None when SESSION_STORE_ENABLED is false)."""
+    global _store
+    if _store is None and SESSION_STORE_ENABLED:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore()
+                if _store.spill_path: atexit.register(_store.flush)
+    return _store
+
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SessionStore(keep_messages=4, summary_tokens=60, max_sessions=2, spill_path=os.path.join(tmp, "sessions.sqlite3"))
+        for i in range(10): store.append_turn("a", f"Question {i}? With detail.", f"Answer {i}. More detail.")
+        history = store.get_history("a")
+        assert history[0]["role"] == "summary" and "Question 9?" in history[-2]["content"] and len(history) == 5, history
+        assert "Question 0" not in history[0]["content"] and "Answer 5" in history[0]["content"], "oldest summary lines are dropped past the budget"
+        store.append_turn("b", "b?", "b."); store.append_turn("c", "c?", "c.")
+        assert "a" not in store._sessions and store.get_stats()["spilled"] == 1, "a is evicted to SQLite"
+        assert store.get_history("a") == history and store.get_stats()["loaded"] == 1, "and loaded back"
+        assert store.end_session("a") and store.get_history("a") == []
+        print(store.get_stats())
+    print("Session store self-check passed.")
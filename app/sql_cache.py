@@ -0,0 +1,158 @@
+# project_root/app/sql_cache.py
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+
+# --- Configuration ---
+SQL_CACHE_ENABLED = os.environ.get("SQL_CACHE_ENABLED", "true").lower() == "true"
+SQL_CACHE_PATH = os.environ.get("SQL_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", "sql_cache.sqlite3"))
+SQL_CACHE_TTL_SECONDS = float(os.environ.get("SQL_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", 5000))
+# How often (seconds) the schema fingerprint is re-checked; 0 checks on every lookup
+SQL_CACHE_FINGERPRINT_CHECK_INTERVAL = float(os.environ.get("SQL_CACHE_FINGERPRINT_CHECK_INTERVAL", 30))
+
+
+def normalize_question(text):
+    """Lowercases, collapses whitespace and drops trailing punctuation so trivially different phrasings share a key."""
+    text = re.sub(r"\s+", " ", (text or "").strip().lower())
+    return text.rstrip(" ?.!;")
+
+def _sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def hash_schema_parts(schema_parts):
+    # retrieved_schema_parts comes from list(set(...)), so its order is not stable between runs
+    return _sha256("\n".join(sorted(schema_parts or [])))
+
+def hash_history(messages):
+    """Hashes LangChain messages (or {'role','content'} dicts) in order, including who said what."""
+    items = []
+    for msg in messages or []:
+        if isinstance(msg, dict): items.append([msg.get("role", ""), msg.get("content", "")])
+        else: items.append([getattr(msg, "type", type(msg).__name__), getattr(msg, "content", "")])
+    return _sha256(json.dumps(items))
+
+def make_sql_cache_key(cleaned_query, retrieved_schema_parts, follow_up_context):
+    return _sha256("|".join([normalize_question(cleaned_query), hash_schema_parts(retrieved_schema_parts), hash_history(follow_up_context)]))
+
+
+class SQLCache:
+    """
+    On-disk (SQLite) cache of generated SQL with LRU + TTL eviction.
+
+    The whole cache is dropped whenever `fingerprint_fn()` returns a value different from the one
+    the entries were written under (e.g. schema2.csv or the Chroma collection changed).
+    """
+
+    def __init__(self, path=SQL_CACHE_PATH, ttl_seconds=SQL_CACHE_TTL_SECONDS, max_entries=SQL_CACHE_MAX_ENTRIES,
+                 fingerprint_fn=None, fingerprint_check_interval=SQL_CACHE_FINGERPRINT_CHECK_INTERVAL):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.fingerprint_fn = fingerprint_fn
+        self.fingerprint_check_interval = fingerprint_check_interval
+        self._last_fingerprint_check = 0.0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidations": 0, "writes": 0}
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, sql TEXT NOT NULL, created_at REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries(last_access)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per operation keeps this safe across threads and gunicorn workers
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn: yield conn # Commits on success, rolls back on error
+        finally:
+            conn.close()
+
+    def _bump(self, name, amount=1):
+        with self._lock: self._stats[name] += amount
+
+    def _check_fingerprint(self, conn):
+        if not self.fingerprint_fn: return
+        now = time.monotonic()
+        if now - self._last_fingerprint_check < self.fingerprint_check_interval: return
+        self._last_fingerprint_check = now
+        try: current = self.fingerprint_fn()
+        except Exception as e:
+            print(f"Warning: could not compute schema fingerprint for SQL cache: {e}")
+            return
+        row = conn.execute("SELECT value FROM meta WHERE name = 'fingerprint'").fetchone()
+        if row is None or row[0] != current:
+            if row is not None:
+                print("Schema fingerprint changed. Invalidating SQL cache.")
+                self._bump("invalidations")
+            conn.execute("DELETE FROM entries")
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('fingerprint', ?)", (current,))
+
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            self._check_fingerprint(conn)
+            row = conn.execute("SELECT sql, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump("misses"); return None
+            sql, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._bump("expired"); self._bump("misses"); return None
+            conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+        self._bump("hits")
+        return sql
+
+    def put(self, key, sql):
+        now = time.time()
+        with self._connect() as conn:
+            self._check_fingerprint(conn)
+            conn.execute("INSERT OR REPLACE INTO entries (key, sql, created_at, last_access) VALUES (?, ?, ?, ?)", (key, sql, now, now))
+            conn.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+            (count,) = conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+            overflow = count - self.max_entries
+            if overflow > 0:
+                conn.execute("DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_access ASC LIMIT ?)", (overflow,))
+                self._bump("evicted", overflow)
+        self._bump("writes")
+
+    def clear(self):
+        with self._connect() as conn: conn.execute("DELETE FROM entries")
+        self._bump("invalidations")
+
+    def get_stats(self):
+        with self._lock: stats = dict(self._stats)
+        try:
+            with self._connect() as conn: stats["entries"] = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        except sqlite3.Error: stats["entries"] = None
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+if __name__ == "__main__":
+    import tempfile
+    print("--- Testing SQLCache ---")
+    fingerprint = {"value": "v1"}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = SQLCache(path=os.path.join(tmp_dir, "cache.sqlite3"), ttl_seconds=0.5, max_entries=2,
+                         fingerprint_fn=lambda: fingerprint["value"], fingerprint_check_interval=0)
+        k1 = make_sql_cache_key("Total shipments?", ["b", "a"], [])
+        assert k1 == make_sql_cache_key("  total   SHIPMENTS ", ["a", "b"], []), "normalization/ordering should not change the key"
+        assert k1 != make_sql_cache_key("total shipments", ["a", "b"], [{"role": "user", "content": "hi"}])
+        cache.put(k1, "SELECT COUNT(*) FROM OTM.SHIPMENT")
+        assert cache.get(k1) == "SELECT COUNT(*) FROM OTM.SHIPMENT"
+        cache.put("k2", "SELECT 2"); cache.get(k1); cache.put("k3", "SELECT 3")
+        assert cache.get("k2") is None and cache.get(k1), "least recently used entry should be evicted"
+        time.sleep(0.6)
+        assert cache.get(k1) is None, "entry should expire after TTL"
+        cache.put(k1, "SELECT 1"); fingerprint["value"] = "v2"
+        assert cache.get(k1) is None, "fingerprint change should invalidate the cache"
+        print(f"SQL cache stats: {cache.get_stats()}")
+    print("SQLCache self-check passed.")
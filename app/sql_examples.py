@@ -0,0 +1,230 @@
+# project_root/app/sql_examples.py
+"""
+Store of past (question, SQL) pairs that ran successfully, indexed in a Chroma collection next to the schema.
+
+For a new standalone question, sql_generator looks up the most similar stored questions:
+- Reuse: when the best match is at least SQL_EXAMPLES_REUSE_MIN_SIMILARITY similar and every difference between
+  the two questions is a value that appears as a literal in the stored SQL (a year, a number such as a top-N, a
+  status or name in a string literal), the stored SQL is reused with those literals substituted and no LLM call is
+  made. "shipment count by year using START_TIME for 2023" -> "... for 2024" is the typical case. Differences
+  that don't map to a literal (another column, another grouping) fall through to the LLM.
+- Few-shot: otherwise the matches above SQL_EXAMPLES_FEW_SHOT_MIN_SIMILARITY are put in the prompt as examples.
+Reused SQL still goes through sql_preflight. Pairs are recorded after their query executed without error.
+"""
+import os
+import re
+import time
+import difflib
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+if __name__ == "__main__" and __package__ is None:
+    from schema_index import get_chroma_client
+    from sql_cache import normalize_question
+else:
+    from .schema_index import get_chroma_client
+    from .sql_cache import normalize_question
+
+# --- Configuration ---
+SQL_EXAMPLES_ENABLED = os.environ.get("SQL_EXAMPLES_ENABLED", "true").lower() == "true"
+SQL_EXAMPLES_COLLECTION_NAME = os.environ.get("SQL_EXAMPLES_COLLECTION_NAME", "logistics_sql_examples_v1")
+SQL_EXAMPLES_REUSE_MIN_SIMILARITY = float(os.environ.get("SQL_EXAMPLES_REUSE_MIN_SIMILARITY", 0.9)) # Cosine similarity
+SQL_EXAMPLES_FEW_SHOT_MIN_SIMILARITY = float(os.environ.get("SQL_EXAMPLES_FEW_SHOT_MIN_SIMILARITY", 0.6))
+SQL_EXAMPLES_FEW_SHOT_COUNT = int(os.environ.get("SQL_EXAMPLES_FEW_SHOT_COUNT", 3))
+
+# Words that may be added or dropped between two phrasings of the same question
+_FILLER_WORDS = {"a", "an", "the", "please", "show", "me", "give", "list", "get", "what", "what's", "is", "are", "was", "were",
+                 "of", "for", "in", "on", "during", "all", "my", "our", "can", "you", "could", "tell", "how", "many", "much"}
+_QUESTION_TOKEN_RE = re.compile(r"'[^']*'|\"[^\"]*\"|[\w.%-]+")
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|(?<![\w.@#])\d+(?:\.\d+)?(?![\w.])")
+_YEAR_RE = re.compile(r"^(19|20)\d\d$")
+_DATE_STRING_YEAR_RE = re.compile(r"^'((?:19|20)\d\d)(?=[-/])")
+
+_stats = {"lookups": 0, "reused": 0, "few_shot": 0, "no_match": 0, "not_adaptable": 0, "lookup_errors": 0, "recorded": 0, "record_errors": 0}
+_lookup_ms = deque(maxlen=1000) # Recent lookup latencies, for the percentiles in get_example_stats()
+_llm_ms = deque(maxlen=1000) # Recent SQL generation LLM latencies, to compare with
+_stats_lock = threading.Lock()
+
+def _bump(name, amount=1):
+    with _stats_lock: _stats[name] += amount
+
+def record_llm_latency(seconds):
+    """Called by sql_generator after each LLM call, so the stats show what a reuse saves."""
+    with _stats_lock: _llm_ms.append(seconds * 1000.0)
+
+def _percentiles(samples):
+    if not samples: return {"avg": None, "p50": None, "p95": None}
+    ordered = sorted(samples)
+    return {"avg": round(sum(ordered) / len(ordered), 1), "p50": round(ordered[len(ordered) // 2], 1), "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1)}
+
+def get_example_stats():
+    with _stats_lock:
+        stats = dict(_stats); lookup_ms = list(_lookup_ms); llm_ms = list(_llm_ms)
+    stats["reuse_rate"] = stats["reused"] / stats["lookups"] if stats["lookups"] else 0.0
+    stats["lookup_ms"] = _percentiles(lookup_ms); stats["llm_ms"] = _percentiles(llm_ms)
+    return stats
+
+
+_collection = None
+_collection_lock = threading.Lock()
+
+def get_examples_collection():
+    """The Chroma collection of (question, SQL) pairs, created on first use (cosine distance)."""
+    global _collection
+    if _collection is None:
+        with _collection_lock:
+            if _collection is None:
+                _collection = get_chroma_client().get_or_create_collection(name=SQL_EXAMPLES_COLLECTION_NAME, metadata={"hnsw:space": "cosine"})
+    return _collection
+
+
+# --- Literal substitution ---
+def _question_tokens(text):
+    return _QUESTION_TOKEN_RE.findall(text or "")
+
+def _unquote(text):
+    return text[1:-1] if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"" else text
+
+def _match_case(value, like):
+    """`value` written in the case style of the SQL literal it replaces."""
+    if like.isupper(): return value.upper()
+    if like.islower(): return value.lower()
+    return value
+
+def _year_of(literal):
+    """The year of a numeric year literal (2023) or of a date string literal ('2023-01-01'), else None."""
+    if literal.startswith("'"):
+        match = _DATE_STRING_YEAR_RE.match(literal)
+        return match.group(1) if match else None
+    return literal if _YEAR_RE.match(literal) else None
+
+def _substitute(sql, old, new):
+    """
+    `sql` with the literal(s) equal to question value `old` replaced by `new`, or None when `old` isn't a
+    literal of the query or the replacement would be ambiguous.
+    """
+    literals = list(_SQL_LITERAL_RE.finditer(sql))
+    if _YEAR_RE.match(old):
+        if not _YEAR_RE.match(new): return None
+        years = [(m, _year_of(m.group())) for m in literals]
+        years = [(m, y) for m, y in years if y]
+        if not years or any(y != old for _, y in years): return None # e.g. a date range spanning two years: the other bound would be wrong
+        edits = [(m.start(), m.end(), m.group().replace(old, new, 1)) for m, _ in years]
+    elif re.fullmatch(r"\d+(?:\.\d+)?", old):
+        if not re.fullmatch(r"\d+(?:\.\d+)?", new): return None
+        edits = [(m.start(), m.end(), new) for m in literals if m.group() == old]
+        if len(edits) != 1: return None # The same number elsewhere in the query (a flag, a HAVING bound) must not change with it
+    else:
+        edits = []
+        for m in literals:
+            content = m.group()[1:-1] if m.group().startswith("'") else None
+            if content is None: continue
+            core = content.strip("%")
+            if core and core.lower() == old.lower():
+                replacement = _match_case(new, core).replace("'", "''")
+                edits.append((m.start(), m.end(), "'" + content.replace(core, replacement, 1) + "'"))
+    if not edits: return None
+    for start, stop, text in reversed(edits): sql = sql[:start] + text + sql[stop:]
+    return sql
+
+def adapt_sql(stored_question, stored_sql, question):
+    """
+    The stored SQL rewritten for `question`, or None when the two questions differ by more than literal values.
+    Token differences are found with difflib; replaced spans must map to literals of the SQL, and inserted or
+    dropped words must be fillers ("please", "show me", ...).
+    """
+    old_tokens, new_tokens = _question_tokens(stored_question), _question_tokens(question)
+    matcher = difflib.SequenceMatcher(a=[t.lower() for t in old_tokens], b=[t.lower() for t in new_tokens], autojunk=False)
+    sql = stored_sql
+    for op, a1, a2, b1, b2 in matcher.get_opcodes():
+        if op == "equal": continue
+        if all(t.lower() in _FILLER_WORDS for t in old_tokens[a1:a2] + new_tokens[b1:b2]): continue # "show me" vs "list"
+        if op in ("insert", "delete"): return None
+        old, new = _unquote(" ".join(old_tokens[a1:a2])), _unquote(" ".join(new_tokens[b1:b2]))
+        sql = _substitute(sql, old, new)
+        if sql is None: return None
+    return sql
+
+
+# --- Lookup and recording ---
+def find_examples(question, n_results=None):
+    """[(similarity, stored question, stored SQL), ...] most similar first; empty when the store is empty or unavailable."""
+    n_results = n_results or max(SQL_EXAMPLES_FEW_SHOT_COUNT, 1)
+    collection = get_examples_collection()
+    count = collection.count()
+    if not count: return []
+    results = collection.query(query_texts=[question], n_results=min(n_results, count), include=["metadatas", "distances"])
+    matches = []
+    for metadata, distance in zip(results["metadatas"][0], results["distances"][0]):
+        if metadata and metadata.get("sql"): matches.append((1.0 - float(distance), metadata.get("question", ""), metadata["sql"]))
+    return matches
+
+def match_question(question):
+    """
+    (reused SQL or None, few-shot examples) for a standalone question. The few-shot list holds
+    (question, SQL) pairs and is empty when the SQL is reused. Lookup errors are logged and treated as no match.
+    """
+    if not SQL_EXAMPLES_ENABLED: return None, []
+    started = time.perf_counter()
+    _bump("lookups")
+    try: matches = find_examples(question)
+    except Exception as e:
+        print(f"Warning: SQL example lookup failed: {e}"); _bump("lookup_errors"); matches = []
+    reused = None
+    for similarity, stored_question, stored_sql in matches:
+        if similarity < SQL_EXAMPLES_REUSE_MIN_SIMILARITY: break
+        reused = adapt_sql(stored_question, stored_sql, question)
+        if reused is not None:
+            print(f"SQL example reuse (similarity {similarity:.3f}): '{stored_question}' -> '{question}'"); break
+    with _stats_lock: _lookup_ms.append((time.perf_counter() - started) * 1000.0)
+    if reused is not None:
+        _bump("reused"); return reused, []
+    few_shot = [(q, s) for similarity, q, s in matches if similarity >= SQL_EXAMPLES_FEW_SHOT_MIN_SIMILARITY][:SQL_EXAMPLES_FEW_SHOT_COUNT]
+    if matches and matches[0][0] >= SQL_EXAMPLES_REUSE_MIN_SIMILARITY: _bump("not_adaptable")
+    _bump("few_shot" if few_shot else "no_match")
+    return None, few_shot
+
+def format_few_shot(examples):
+    """Prompt section with the few-shot examples ("" when there are none)."""
+    if not examples: return ""
+    lines = ["Previous questions and the SQL that answered them correctly (adapt, don't copy blindly):", "------------------------"]
+    for question, sql in examples: lines.extend([f"Question: {question}", f"SQL: {sql}", ""])
+    return "\n".join(lines) + "------------------------\n"
+
+def _store_example(question, sql):
+    try:
+        key = hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+        get_examples_collection().upsert(ids=[key], documents=[question], metadatas=[{"question": question, "sql": sql, "recorded_at": time.time()}])
+        _bump("recorded")
+    except Exception as e:
+        print(f"Warning: could not record SQL example: {e}"); _bump("record_errors")
+
+_record_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sql-example-record") # One writer: Chroma upserts queue up instead of a thread per answer
+
+def remember_example(question, sql, background=True):
+    """Records a (question, SQL) pair that ran successfully. Embedding it takes a few ms, so by default it's done off the request thread."""
+    if not SQL_EXAMPLES_ENABLED or not question or not sql: return
+    if not background: _store_example(question, sql); return
+    _record_executor.submit(_store_example, question, sql)
+
+
+if __name__ == "__main__":
+    stored_q = "shipment count by year using START_TIME for 2023"
+    stored_sql = "SELECT YEAR(START_TIME) AS ShipmentYear, COUNT(*) AS ShipmentCount FROM OTM.SHIPMENT WHERE YEAR(START_TIME) = 2023 GROUP BY YEAR(START_TIME)"
+    assert adapt_sql(stored_q, stored_sql, "Shipment count by year using START_TIME for 2024?") == stored_sql.replace("2023", "2024")
+    assert adapt_sql(stored_q, stored_sql, "please show me shipment count by year using START_TIME for 2021").endswith("= 2021 GROUP BY YEAR(START_TIME)")
+    assert adapt_sql(stored_q, stored_sql, "shipment count by month using START_TIME for 2024") is None, "month isn't a literal"
+    ranged = "SELECT COUNT(*) FROM OTM.SHIPMENT WHERE START_TIME >= '2023-01-01' AND START_TIME < '2024-01-01'"
+    assert adapt_sql("shipments in 2023", ranged, "shipments in 2022") is None, "the upper bound would be wrong"
+    top_n = "SELECT TOP 10 C.SERVPROV_NAME, COUNT(*) AS Shipments FROM OTM.SHIPMENT S JOIN OTM.SERVPROV C ON C.SERVPROV_GID = S.SERVPROV_GID WHERE S.STATUS = 'DELIVERED' GROUP BY C.SERVPROV_NAME ORDER BY Shipments DESC"
+    adapted = adapt_sql("top 10 carriers by delivered shipments", top_n, "top 5 carriers by cancelled shipments")
+    assert adapted == top_n.replace("TOP 10", "TOP 5").replace("'DELIVERED'", "'CANCELLED'"), adapted
+    assert adapt_sql("top 10 carriers by delivered shipments", top_n, "top 10 carriers by delivered shipments last week") is None
+    flagged = "SELECT COUNT(*) FROM OTM.SHIPMENT WHERE TOTAL_WEIGHT > 1 AND IS_ACTIVE = 1"
+    assert adapt_sql("shipments with weight over 1", flagged, "shipments with weight over 500") is None, "IS_ACTIVE = 1 must not become 500"
+    lanes = "SELECT TOP 10 SOURCE_LOCATION_GID, COUNT(*) AS Shipments FROM OTM.SHIPMENT GROUP BY SOURCE_LOCATION_GID HAVING COUNT(*) > 10 ORDER BY Shipments DESC"
+    assert adapt_sql("top 10 lanes with more than 10 shipments", lanes, "top 5 lanes with more than 10 shipments") is None, "the HAVING bound must not change"
+    assert "Question: q1" in format_few_shot([("q1", "SELECT 1")]) and format_few_shot([]) == ""
+    print("SQL example adaptation self-check passed.")
@@ -0,0 +1,221 @@
+# project_root/app/sql_preflight.py
+"""
+Local pre-flight check of generated SQL, run between sql_generator and sql_executor.
+
+The query is parsed as T-SQL with sqlglot and rejected without a database round trip when it:
+- does not parse, or is more than one statement;
+- is not a read-only SELECT (DML/DDL, EXEC, SELECT ... INTO);
+- references a table that is not in the compiled schema (schema2.csv), or a column that the
+  table it is qualified with (or, for unqualified columns, any table in the query) doesn't have.
+A query that passes gets `TOP n` injected into its outermost SELECT when it has no TOP / OFFSET-FETCH.
+The rejection message is written for the LLM: assistant_engine sends it back to the generator once.
+sqlglot is optional; without it the check is skipped and the SQL is passed through unchanged.
+"""
+import os
+import re
+import difflib
+import threading
+
+# sqlglot (optional; ~120 ms to import) is loaded on the first check, see _load_sqlglot()
+sqlglot = exp = SqlglotError = TokenType = None
+_WRITE_NODES = ()
+_sqlglot_resolved = False
+_sqlglot_lock = threading.Lock()
+
+# --- Configuration ---
+SQL_PREFLIGHT_ENABLED = os.environ.get("SQL_PREFLIGHT_ENABLED", "true").lower() == "true"
+SQL_PREFLIGHT_MAX_RETRIES = int(os.environ.get("SQL_PREFLIGHT_MAX_RETRIES", 1)) # Generator retries after a rejection
+
+_stats = {"checked": 0, "passed": 0, "top_injected": 0, "rejected": 0, "retries": 0, "skipped": 0}
+_stats_lock = threading.Lock()
+
+def _bump(name, amount=1):
+    with _stats_lock: _stats[name] += amount
+
+def record_retry(): _bump("retries")
+
+def get_preflight_stats():
+    with _stats_lock: return dict(_stats)
+
+
+class SchemaCatalog:
+    """Upper-cased table -> column names of a CompiledSchema, also reachable by the table name without its schema prefix."""
+
+    def __init__(self, compiled_schema):
+        self.columns = {}
+        for t_idx, (start, stop) in enumerate(compiled_schema.table_column_ranges()):
+            self.columns[compiled_schema.table_names[t_idx].upper()] = {name.upper() for name in compiled_schema.col_names[start:stop]}
+        self._by_short_name = {}
+        for table in self.columns: self._by_short_name.setdefault(table.rsplit(".", 1)[-1], table)
+
+    def resolve(self, schema, name):
+        """Full upper-cased table name for a (schema, name) reference, or None if the schema has no such table."""
+        if schema: return f"{schema}.{name}".upper() if f"{schema}.{name}".upper() in self.columns else None
+        return self._by_short_name.get(name.upper())
+
+    def suggest(self, name, candidates):
+        matches = difflib.get_close_matches(name.upper(), list(candidates), n=3, cutoff=0.6)
+        return f" Did you mean: {', '.join(matches)}?" if matches else ""
+
+
+_catalog_cache = {} # id(compiled schema) -> (compiled schema, catalog)
+_catalog_lock = threading.Lock()
+
+def get_schema_catalog(compiled_schema):
+    """The SchemaCatalog for a CompiledSchema, built once per compiled schema (i.e. per CSV version)."""
+    with _catalog_lock:
+        cached = _catalog_cache.get(id(compiled_schema))
+        if cached is not None and cached[0] is compiled_schema: return cached[1]
+        catalog = SchemaCatalog(compiled_schema)
+        _catalog_cache.clear() # Only the current schema version is kept
+        _catalog_cache[id(compiled_schema)] = (compiled_schema, catalog)
+        return catalog
+
+
+def _load_sqlglot():
+    """Imports sqlglot on first use; returns it, or None when it isn't installed."""
+    global sqlglot, exp, SqlglotError, TokenType, _WRITE_NODES, _sqlglot_resolved
+    if not _sqlglot_resolved:
+        with _sqlglot_lock:
+            if not _sqlglot_resolved:
+                try:
+                    import sqlglot as sqlglot_module
+                    from sqlglot import exp as exp_module
+                    from sqlglot.errors import SqlglotError as error_class
+                    from sqlglot.tokens import TokenType as token_types
+                    exp, SqlglotError, TokenType = exp_module, error_class, token_types
+                    _WRITE_NODES = tuple(getattr(exp, name) for name in ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "TruncateTable", "Command", "Execute") if hasattr(exp, name))
+                    sqlglot = sqlglot_module
+                except ImportError: # Optional: no pre-flight without it
+                    print("Warning: sqlglot is not installed; SQL pre-flight checks are skipped.")
+                _sqlglot_resolved = True
+    return sqlglot
+
+def warm_up_preflight(compiled_schema=None):
+    """Imports sqlglot and builds the schema catalog ahead of the first query."""
+    if _load_sqlglot() is not None: sqlglot.parse_one("SELECT 1", read="tsql")
+    if compiled_schema is not None: get_schema_catalog(compiled_schema)
+
+
+# --- Checks ---
+
+def _check_read_only(statement):
+    if not isinstance(statement, (exp.Select, exp.Union, exp.Intersect, exp.Except)):
+        return f"Only SELECT queries are allowed, got {statement.key.upper()}."
+    for node in statement.walk():
+        if isinstance(node, _WRITE_NODES): return f"Only SELECT queries are allowed; the query contains {node.key.upper()}."
+        if isinstance(node, exp.Select) and node.args.get("into"): return "SELECT ... INTO is not allowed; return the rows instead."
+    return None
+
+def _check_names(statement, catalog):
+    """Error message for the first unknown table or column reference, or None."""
+    derived = {cte.alias_or_name.upper() for cte in statement.find_all(exp.CTE)}
+    derived |= {sub.alias.upper() for sub in statement.find_all(exp.Subquery) if sub.alias}
+    aliases = {} # qualifier -> set of full table names
+    for table in statement.find_all(exp.Table):
+        if not table.db and table.name.upper() in derived: continue
+        full_name = catalog.resolve(table.db, table.name)
+        if full_name is None:
+            reference = f"{table.db}.{table.name}" if table.db else table.name
+            return f"Unknown table '{reference}'.{catalog.suggest(reference, catalog.columns)}"
+        for qualifier in {table.alias_or_name.upper(), table.name.upper(), full_name}: aliases.setdefault(qualifier, set()).add(full_name)
+    output_names = {alias.alias.upper() for alias in statement.find_all(exp.Alias)}
+    all_columns = set().union(*(catalog.columns[t] for tables in aliases.values() for t in tables)) if aliases else set()
+    for column in statement.find_all(exp.Column):
+        name = column.name.upper()
+        if not name or name == "*": continue
+        qualifier = ".".join(part for part in (column.text("db"), column.table) if part).upper() # "S", or "OTM.SHIPMENT" in OTM.SHIPMENT.COL
+        if qualifier:
+            if qualifier in derived or qualifier not in aliases: continue # CTE / derived table / unresolvable qualifier: not checked
+            if not any(name in catalog.columns[t] for t in aliases[qualifier]):
+                table_columns = set().union(*(catalog.columns[t] for t in aliases[qualifier]))
+                return f"Unknown column '{column.table}.{column.name}': {', '.join(sorted(aliases[qualifier]))} has no column {column.name}.{catalog.suggest(name, table_columns)}"
+        elif not derived and name not in all_columns and name not in output_names:
+            return f"Unknown column '{column.name}': none of the tables in the query has it.{catalog.suggest(name, all_columns)}"
+    return None
+
+def _has_row_limit(statement):
+    return bool(statement.args.get("limit") or statement.args.get("fetch") or statement.args.get("offset"))
+
+def _is_single_row_aggregate(statement):
+    """SELECT COUNT(*) ... without GROUP BY: always one row, no TOP needed."""
+    return not statement.args.get("group") and all(e.find(exp.AggFunc) for e in statement.expressions)
+
+def inject_top(sql, top_limit):
+    """`sql` with `TOP top_limit` after the outermost SELECT [DISTINCT|ALL], edited in the original text so nothing else is reformatted."""
+    depth = 0
+    tokens = sqlglot.Dialect.get_or_raise("tsql").tokenize(sql)
+    for i, token in enumerate(tokens):
+        if token.token_type == TokenType.L_PAREN: depth += 1
+        elif token.token_type == TokenType.R_PAREN: depth -= 1
+        elif token.token_type == TokenType.SELECT and depth == 0:
+            anchor = tokens[i + 1] if i + 1 < len(tokens) and tokens[i + 1].token_type in (TokenType.DISTINCT, TokenType.ALL) else token
+            return f"{sql[:anchor.end + 1]} TOP {int(top_limit)}{sql[anchor.end + 1:]}"
+    return sql
+
+_QUOTED_OR_SPACE_RE = re.compile(r"('(?:[^']|'')*'|\"[^\"]*\"|\[[^\]]*\])|\s+")
+_STRING_LITERAL_RE = re.compile(r"'(?:[^']|'')*'")
+_OTM_TABLE_RE = re.compile(r"\bOTM\s*\.\s*\[?(\w+)\]?", re.IGNORECASE)
+
+def canonicalize_sql(sql):
+    """
+    (canonical text, sorted upper-cased SCHEMA.TABLE names) of a query, for the result cache key and its table tags.
+    With sqlglot the query is re-rendered with normalized identifiers, so whitespace, keyword case, comments and
+    identifier case don't matter; the rendering is only used as a key, never executed. Without sqlglot (or for SQL it
+    can't parse) whitespace outside quotes is collapsed and the OTM.* tables are found with a regex.
+    """
+    if _load_sqlglot() is not None:
+        try:
+            statement = sqlglot.parse_one(sql, read="tsql")
+            tables = sorted({f"{t.db}.{t.name}".upper() for t in statement.find_all(exp.Table) if t.db})
+            return statement.sql(dialect="tsql", normalize=True, comments=False), tables
+        except SqlglotError: pass
+    text = _QUOTED_OR_SPACE_RE.sub(lambda m: m.group(1) or " ", sql.strip().rstrip(";")).strip()
+    return text, sorted({f"OTM.{name.upper()}" for name in _OTM_TABLE_RE.findall(_STRING_LITERAL_RE.sub("''", sql))})
+
+_ANSI_RE = re.compile(r"\x1b\[[0-9;]*m") # sqlglot underlines the offending token for terminals
+
+def preflight_sql(sql, compiled_schema, top_limit=None):
+    """
+    Returns (sql to execute, None) when the query passes, possibly with TOP injected, or (None, error message).
+    Without sqlglot, or when pre-flight is disabled, returns (sql, None) unchanged.
+    """
+    if not SQL_PREFLIGHT_ENABLED or _load_sqlglot() is None:
+        _bump("skipped"); return sql, None
+    _bump("checked")
+    try: statements = [s for s in sqlglot.parse(sql, read="tsql") if s is not None]
+    except SqlglotError as e:
+        _bump("rejected"); return None, f"Syntax error: {' '.join(_ANSI_RE.sub('', str(e)).split())}"
+    error = None
+    if len(statements) != 1: error = f"Expected exactly one SQL statement, got {len(statements)}."
+    else: error = _check_read_only(statements[0]) or (_check_names(statements[0], get_schema_catalog(compiled_schema)) if compiled_schema is not None else None)
+    if error:
+        _bump("rejected"); return None, error
+    _bump("passed")
+    statement = statements[0]
+    if top_limit and isinstance(statement, exp.Select) and not _has_row_limit(statement) and not _is_single_row_aggregate(statement):
+        rewritten = inject_top(sql.strip().rstrip(";"), top_limit)
+        if rewritten != sql: _bump("top_injected"); print(f"Pre-flight: added TOP {int(top_limit)} to the outermost SELECT.")
+        return rewritten, None
+    return sql, None
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.insert(0, os.path.dirname(__file__))
+    from schema_compiler import compile_schema_csv
+    compiled = compile_schema_csv(os.path.join(os.path.dirname(__file__), "..", "schema2.csv"))
+    ok = "SELECT YEAR(S.START_TIME) AS ShipmentYear, COUNT(*) AS ShipmentCount FROM OTM.SHIPMENT S GROUP BY YEAR(S.START_TIME) ORDER BY ShipmentYear"
+    sql, error = preflight_sql(ok, compiled, top_limit=1001)
+    assert error is None and sql.startswith("SELECT TOP 1001 YEAR(S.START_TIME)"), (sql, error)
+    assert preflight_sql("SELECT COUNT(*) AS Total FROM OTM.SHIPMENT", compiled, 1001) == ("SELECT COUNT(*) AS Total FROM OTM.SHIPMENT", None)
+    assert preflight_sql("SELECT TOP 5 SHIPMENT_GID FROM OTM.SHIPMENT", compiled, 1001)[0] == "SELECT TOP 5 SHIPMENT_GID FROM OTM.SHIPMENT"
+    cte = "WITH x AS (SELECT SHIPMENT_GID FROM OTM.SHIPMENT) SELECT DISTINCT x.SHIPMENT_GID FROM x"
+    assert preflight_sql(cte, compiled, 10)[0] == "WITH x AS (SELECT SHIPMENT_GID FROM OTM.SHIPMENT) SELECT DISTINCT TOP 10 x.SHIPMENT_GID FROM x"
+    for bad in ["DELETE FROM OTM.SHIPMENT", "SELECT 1; DROP TABLE OTM.SHIPMENT", "SELECT SHIPMENT_GID INTO #t FROM OTM.SHIPMENT",
+                "SELECT S.NOT_A_COLUMN FROM OTM.SHIPMENT S", "SELECT SHIPMENT_GID FROM OTM.NOT_A_TABLE", "SELEC x FRM y"]:
+        sql, error = preflight_sql(bad, compiled, 1001)
+        assert sql is None and error, bad
+        print(f"  rejected: {bad[:50]:<50} -> {error[:110]}")
+    print(get_preflight_stats())
+    print("SQL pre-flight self-check passed.")
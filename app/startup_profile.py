@@ -0,0 +1,68 @@
+# app/startup_profile.py
+"""
+Startup profiler: how long importing the web app takes, broken down by top-level package.
+
+    python -m app.startup_profile [--top 15] [--module app.routes] [--warmup]
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter, so the numbers are a cold
+worker start. --warmup additionally times each lazily initialized resource (LLM client, graph,
+Chroma client/collection, SQL cache, DB pool) the first time it is requested.
+"""
+import os
+import sys
+import time
+import argparse
+import subprocess
+from collections import defaultdict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import_times(module="app.routes"):
+    """Returns (total_us, {top_level_package: self_us}) for a cold import of `module`."""
+    env = dict(os.environ, ASSISTANT_WARMUP="false")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=PROJECT_ROOT, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode != 0: raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-2000:]}")
+    by_package = defaultdict(int)
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        # Format: "import time: <self us> | <cumulative us> | <indented module name>"
+        if not line.startswith("import time:") or "self [us]" in line: continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|", 2)]
+        by_package[name.split(".")[0]] += int(self_us)
+        total_us += int(self_us)
+    return total_us, dict(by_package)
+
+def measure_warm_up():
+    """Times each lazy accessor of assistant_engine on first use, in this process."""
+    if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
+    os.environ["ASSISTANT_WARMUP"] = "false"
+    from app import assistant_engine as engine
+    from app.schema_index import warm_up_schema_index
+    timings = []
+    for name, init_fn in [("llm", engine.get_llm), ("graph", engine.get_app_graph), ("schema", warm_up_schema_index),
+                          ("sql_cache", engine.get_sql_cache), ("db_pool", engine.get_db_pool)]:
+        started = time.perf_counter()
+        try: init_fn(); status = "ok"
+        except Exception as e: status = f"failed: {e}"
+        timings.append((name, time.perf_counter() - started, status))
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.routes", help="Module to import (default: app.routes)")
+    parser.add_argument("--top", type=int, default=15, help="Number of packages to list")
+    parser.add_argument("--warmup", action="store_true", help="Also time first use of each lazily initialized resource")
+    args = parser.parse_args()
+
+    total_us, by_package = measure_import_times(args.module)
+    print(f"Cold import of {args.module}: {total_us / 1e6:.3f}s")
+    print(f"{'package':<28}{'self time':>12}{'share':>9}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:<28}{self_us / 1e6:>11.3f}s{100.0 * self_us / total_us:>8.1f}%")
+    if args.warmup:
+        print("\nFirst use of lazily initialized resources:")
+        for name, seconds, status in measure_warm_up():
+            print(f"  {name:<12}{seconds:>8.3f}s  {status}")
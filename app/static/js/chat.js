@@ -4,7 +4,8 @@ document.addEventListener('DOMContentLoaded', () => {
     const userInput = document.getElementById('user-input');
     const sendButton = document.getElementById('send-button');
     const CHAT_HISTORY_KEY = 'rxoLogisticsAIChatHistory';
-    const MAX_HISTORY_TURNS = 5; // Number of recent Q&A pairs for LLM context
+    // The server keeps the conversation (recent turns + a summary of older ones) under this id, so requests only carry the new question
+    const CONVERSATION_ID_KEY = 'rxoLogisticsAIConversationId';
 
     // Workplace Modal Elements
     const workplaceModal = document.getElementById('workplace-selection-modal');
@@ -34,6 +35,15 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
     
+    function getConversationId() {
+        let conversationId = localStorage.getItem(CONVERSATION_ID_KEY);
+        if (!conversationId) {
+            conversationId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `conv_${Date.now()}_${Math.random().toString(36).slice(2)}`;
+            try { localStorage.setItem(CONVERSATION_ID_KEY, conversationId); } catch (e) { console.error("Error saving conversation id:", e); }
+        }
+        return conversationId;
+    }
+
     function renderMessage(messageObj) { 
         addMessage(messageObj.text, messageObj.sender, messageObj.chart, messageObj.table, false, messageObj.id, messageObj.query);
     }
@@ -196,7 +206,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (!saveResponse.ok) {
                 alert(`Error saving insight: ${saveResult.error || 'Unknown error'}`);
             } else {
-                alert(`Insight saved to workplace successfully!`);
+                alert(saveResult.warning ? `Insight saved to workplace. ${saveResult.warning}` : `Insight saved to workplace successfully!`);
                 closeWorkplaceModal();
             }
         } catch (error) { alert(`Failed to save insight: ${error}`); }
@@ -213,6 +223,135 @@ document.addEventListener('DOMContentLoaded', () => {
         }
      }
 
+    // Progress text shown after each graph node completes (/chat/stream 'node' events)
+    const NODE_PROGRESS_LABELS = {
+        intent_detection: 'Finding relevant tables...',
+        schema_retriever: 'Writing the query...',
+        sql_generator: 'Running the query...',
+        sql_executor: 'Analyzing the results...',
+        analyzer_visualizer: 'Finishing up...',
+        response_formatter: 'Finishing up...'
+    };
+
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                let eventName = 'message';
+                const dataLines = [];
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                    else if (line.startsWith('data:')) dataLines.push(line.slice(5).trim());
+                });
+                if (dataLines.length) onEvent(eventName, JSON.parse(dataLines.join('\n')));
+            }
+        }
+    }
+
+    // Renders /chat/stream events into the "thinking" bubble as they arrive.
+    // Returns the streamed table so the final message can be stored without the server resending it.
+    function createStreamRenderer(liveMsgDiv) {
+        const progressP = liveMsgDiv.querySelector('p');
+        const streamedTable = { headers: [], rows: [] };
+        let tbody = null;
+        const scrollToBottom = () => { conversationView.scrollTop = conversationView.scrollHeight; };
+        return {
+            streamedTable,
+            onEvent(eventName, data) {
+                if (eventName === 'node') {
+                    const label = NODE_PROGRESS_LABELS[data.node];
+                    if (label) progressP.innerHTML = `<span class="thinking-spinner"></span> ${label}`;
+                } else if (eventName === 'sql') {
+                    const sqlDetails = document.createElement('details');
+                    const summary = document.createElement('summary'); summary.textContent = 'Generated SQL';
+                    const pre = document.createElement('pre'); pre.textContent = data.sql;
+                    sqlDetails.appendChild(summary); sqlDetails.appendChild(pre);
+                    liveMsgDiv.appendChild(sqlDetails);
+                } else if (eventName === 'table_header') {
+                    streamedTable.headers = data.headers;
+                    const tableContainer = document.createElement('div');
+                    tableContainer.classList.add('table-container');
+                    const table = document.createElement('table');
+                    const thead = document.createElement('thead'); const headerRow = document.createElement('tr');
+                    data.headers.forEach(headerText => { const th = document.createElement('th'); th.textContent = headerText; headerRow.appendChild(th); });
+                    thead.appendChild(headerRow); table.appendChild(thead);
+                    tbody = document.createElement('tbody'); table.appendChild(tbody);
+                    tableContainer.appendChild(table); liveMsgDiv.appendChild(tableContainer);
+                } else if (eventName === 'rows' && tbody) {
+                    const fragment = document.createDocumentFragment();
+                    data.rows.forEach(rowData => { const row = document.createElement('tr'); rowData.forEach(cellData => { const td = document.createElement('td'); td.textContent = cellData; row.appendChild(td); }); fragment.appendChild(row); });
+                    tbody.appendChild(fragment);
+                    streamedTable.rows.push(...data.rows);
+                } else if (eventName === 'chart' && typeof Chart !== 'undefined') {
+                    const chartContainer = document.createElement('div');
+                    chartContainer.classList.add('chart-wrapper');
+                    const chartCanvas = document.createElement('canvas');
+                    chartContainer.appendChild(chartCanvas);
+                    liveMsgDiv.insertBefore(chartContainer, progressP.nextSibling);
+                    try { new Chart(chartCanvas, { type: data.chart.type, data: data.chart.data, options: data.chart.options }); }
+                    catch (e) { console.error("Error rendering streamed chart:", e, data.chart); }
+                }
+                scrollToBottom();
+            }
+        };
+    }
+
+    // --- Columnar wire format (app/wire_format.py): rebuilt into the usual { raw_table, chart } shape ---
+    const COLUMNAR_MEDIA_TYPE = 'application/vnd.stg.columnar+json';
+    function decodeColumn(column) { return column.dict ? column.codes.map(code => code === null ? null : column.dict[code]) : column.values; }
+    // Columns whose str() JS can't rebuild (floats, decimals, big ids, datetimes) arrive as 'text' with raw_table's strings
+    function decodeColumnCells(column) { return column.text || decodeColumn(column); }
+    function formatCell(value) { return value === null || value === undefined ? 'None' : String(value); }
+    function decodeColumnarResponse(payload) {
+        const table = payload.table;
+        const columns = table ? table.columns.map(decodeColumnCells) : [];
+        const cellColumns = columns.map(values => values.map(formatCell));
+        const resolve = (ref, asLabels) => {
+            if (!ref || typeof ref !== 'object' || Array.isArray(ref)) return ref;
+            if ('$labels' in ref) return payload.labels[ref['$labels']];
+            if ('$column' in ref) return asLabels ? cellColumns[ref['$column']] : columns[ref['$column']].map(v => v === null ? 0 : Number(v));
+            return ref;
+        };
+        const { table: _table, labels: _labels, format: _format, ...data } = payload;
+        if (table) data.raw_table = { headers: table.headers, rows: Array.from({ length: table.num_rows }, (_, r) => cellColumns.map(col => col[r])) };
+        if (payload.chart && payload.chart.data) {
+            const chartData = { ...payload.chart.data, labels: resolve(payload.chart.data.labels, true) };
+            chartData.datasets = (chartData.datasets || []).map(ds => ({ ...ds, data: resolve(ds.data, false) }));
+            data.chart = { ...payload.chart, data: chartData };
+        }
+        return data;
+    }
+
+    async function fetchNonStreamingAnswer(query) {
+        const response = await fetch('/chat', { method: 'POST', headers: { 'Content-Type': 'application/json', 'Accept': `${COLUMNAR_MEDIA_TYPE}, application/json` }, body: JSON.stringify({ query: query, conversation_id: getConversationId() }), });
+        if (!response.ok) { const errData = await response.json(); return { error: errData.error || response.statusText }; }
+        const payload = await response.json();
+        return (response.headers.get('Content-Type') || '').startsWith(COLUMNAR_MEDIA_TYPE) ? decodeColumnarResponse(payload) : payload;
+    }
+
+    async function fetchStreamingAnswer(query, liveMsgDiv) {
+        const response = await fetch('/chat/stream', { method: 'POST', headers: { 'Content-Type': 'application/json', 'Accept': `text/event-stream, ${COLUMNAR_MEDIA_TYPE}` }, body: JSON.stringify({ query: query, conversation_id: getConversationId() }), });
+        if (!response.ok || !response.body) return fetchNonStreamingAnswer(query); // e.g. proxy without streaming support
+        const renderer = createStreamRenderer(liveMsgDiv);
+        let finalData = null;
+        await readEventStream(response, (eventName, data) => {
+            if (eventName === 'done') finalData = data.format ? decodeColumnarResponse(data) : data;
+            else if (eventName === 'error') finalData = { error: data.error };
+            else renderer.onEvent(eventName, data);
+        });
+        if (!finalData) return { error: 'The answer stream ended unexpectedly.' };
+        if (finalData.table_streamed) finalData.raw_table = renderer.streamedTable;
+        return finalData;
+    }
+
     async function handleUserQuery() {
         const query = userInput.value.trim();
         if (!query) return;
@@ -224,13 +363,10 @@ document.addEventListener('DOMContentLoaded', () => {
         conversationView.appendChild(thinkingMsgDiv);
         conversationView.scrollTop = conversationView.scrollHeight;
 
-        const allHistory = loadMessages();
-        const recentHistoryForLLM = allHistory.slice(-(MAX_HISTORY_TURNS * 2)).map(msg => ({ role: msg.sender === 'user' ? 'user' : 'assistant', content: msg.text }));
         try {
-            const response = await fetch('/chat', { method: 'POST', headers: { 'Content-Type': 'application/json', }, body: JSON.stringify({ query: query, conversation_history: recentHistoryForLLM }), });
+            const data = await fetchStreamingAnswer(query, thinkingMsgDiv);
             if (conversationView.contains(thinkingMsgDiv)) conversationView.removeChild(thinkingMsgDiv); 
-            if (!response.ok) { const errData = await response.json(); addMessage(`Error: ${errData.error || response.statusText}`, 'ai', null, null, true, `error_${Date.now()}`, query); return; }
-            const data = await response.json();
+            if (data.error) { addMessage(`Error: ${data.error}`, 'ai', null, null, true, `error_${Date.now()}`, query); return; }
             addMessage(data.answer, 'ai', data.chart, data.raw_table, true, data.id, query); 
         } catch (error) { 
             if (conversationView.contains(thinkingMsgDiv)) conversationView.removeChild(thinkingMsgDiv);
@@ -124,99 +124,181 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // The list endpoint returns metadata only; chart / table bodies are fetched (and charts built) when a card scrolls into view
+    const payloadCache = new Map(); // payload_hash -> body; content-addressed, so it never goes stale
+    let renderedCharts = [];
+    let bodyObserver = null;
+    let loadGeneration = 0;
+
+    async function fetchInsightPayload(workplaceId, insight) {
+        if (insight.payload_hash && payloadCache.has(insight.payload_hash)) return payloadCache.get(insight.payload_hash);
+        const response = await fetch(`/api/workplaces/${workplaceId}/insights/${encodeURIComponent(insight.id)}/payload`);
+        if (!response.ok) throw new Error('Failed to load insight data');
+        const payload = await response.json();
+        if (insight.payload_hash) payloadCache.set(insight.payload_hash, payload);
+        return payload;
+    }
+
+    function renderInsightBody(bodyDiv, insight, payload) {
+        bodyDiv.innerHTML = '';
+        bodyDiv.classList.remove('pending');
+        if (payload.type && payload.type !== 'table' && payload.type !== 'text' && payload.data && payload.data.datasets) {
+            const chartWrapper = document.createElement('div');
+            chartWrapper.classList.add('insight-chart-wrapper');
+            const chartCanvas = document.createElement('canvas');
+            chartWrapper.appendChild(chartCanvas);
+            bodyDiv.appendChild(chartWrapper);
+
+            if (typeof Chart !== 'undefined') {
+                try {
+                    // Use saved options, including title and legend settings
+                    renderedCharts.push(new Chart(chartCanvas, { 
+                        type: payload.type, 
+                        data: payload.data, 
+                        options: payload.options || { responsive: true, maintainAspectRatio: false, plugins: { legend: { display: true }, title: {display: true, text: insight.summary || insight.query}}} 
+                    }));
+                } catch (e) { 
+                    console.error("Error rendering insight chart:", e, insight);
+                    const errorP = document.createElement('p'); errorP.textContent = "[Chart error]"; errorP.style.color='red';
+                    chartWrapper.appendChild(errorP);
+                }
+            } else { /* Chart.js missing */ }
+        } else if (payload.type === 'table' && payload.data && payload.data.headers && payload.data.rows) { 
+            const tableContainer = document.createElement('div');
+            tableContainer.classList.add('table-container');
+            const table = document.createElement('table'); /* ... table rendering ... */ 
+            const thead = document.createElement('thead'); const tbody = document.createElement('tbody'); const headerRow = document.createElement('tr');
+            payload.data.headers.forEach(h => {const th=document.createElement('th'); th.textContent=h; headerRow.appendChild(th);});
+            thead.appendChild(headerRow); table.appendChild(thead);
+            payload.data.rows.forEach(rD => {const r=document.createElement('tr'); rD.forEach(cD => {const td=document.createElement('td'); td.textContent=cD; r.appendChild(td);}); tbody.appendChild(r);});
+            table.appendChild(tbody); tableContainer.appendChild(table); bodyDiv.appendChild(tableContainer);
+        }
+    }
+
+    async function loadInsightBody(bodyDiv) {
+        const { workplaceId, insight, generation } = bodyDiv._insight;
+        try {
+            const payload = await fetchInsightPayload(workplaceId, insight);
+            if (generation === loadGeneration) renderInsightBody(bodyDiv, insight, payload);
+        } catch (error) {
+            bodyDiv.classList.remove('pending');
+            bodyDiv.innerHTML = '<p style="color:red">[Could not load insight data]</p>';
+            console.error('Error loading insight payload:', error, insight);
+        }
+    }
+
+    function observeInsightBody(bodyDiv) {
+        if (!('IntersectionObserver' in window)) { loadInsightBody(bodyDiv); return; }
+        if (!bodyObserver) {
+            bodyObserver = new IntersectionObserver(entries => {
+                entries.forEach(entry => {
+                    if (!entry.isIntersecting) return;
+                    bodyObserver.unobserve(entry.target);
+                    loadInsightBody(entry.target);
+                });
+            }, { rootMargin: '300px 0px' }); // Start loading a little before the card is on screen
+        }
+        bodyObserver.observe(bodyDiv);
+    }
+
+    function buildInsightCard(workplaceId, selectedWorkplaceName, insight) {
+        const card = document.createElement('div');
+        card.classList.add('insight-card');
+        
+        const queryTitle = document.createElement('h3');
+        queryTitle.classList.add('insight-query-title');
+        queryTitle.textContent = `Original Query: "${insight.query}"`;
+        card.appendChild(queryTitle);
+
+        // The 'summary' is the textual explanation/title from the chat
+        if (insight.summary) {
+            const summaryP = document.createElement('p');
+            summaryP.classList.add('insight-summary-text');
+            summaryP.textContent = insight.summary; 
+            card.appendChild(summaryP);
+        }
+
+        const timestamp = document.createElement('p');
+        timestamp.classList.add('insight-timestamp');
+        timestamp.textContent = `Saved: ${new Date(insight.timestamp).toLocaleString()}`;
+        if (insight.refreshed_at) timestamp.textContent += ` · Data refreshed: ${new Date(insight.refreshed_at).toLocaleString()}`; // Re-run on the server from the stored SQL
+        card.appendChild(timestamp);
+
+        if (insight.payload_hash) {
+            const bodyDiv = document.createElement('div');
+            bodyDiv.classList.add('insight-body', 'pending');
+            bodyDiv._insight = { workplaceId, insight, generation: loadGeneration };
+            card.appendChild(bodyDiv);
+            observeInsightBody(bodyDiv);
+        }
+        
+        const actionsDiv = document.createElement('div');
+        actionsDiv.classList.add('actionsDiv'); // Class for styling
+        const deleteInsightBtn = document.createElement('button');
+        deleteInsightBtn.textContent = 'Remove Insight';
+        deleteInsightBtn.onclick = async () => {
+            if (confirm(`Remove this insight (Query: "${insight.query}") from "${selectedWorkplaceName}"?`)) {
+                try {
+                    const delResponse = await fetch(`/api/workplaces/${workplaceId}/insights/${insight.id}`, { method: 'DELETE' });
+                    const delResult = await delResponse.json();
+                    if (delResponse.ok) { loadInsightsForWorkplace(workplaceId); } 
+                    else { alert(`Error removing insight: ${delResult.error}`); }
+                } catch (err) { alert(`Failed to remove insight: ${err}`); }
+            }
+        };
+        actionsDiv.appendChild(deleteInsightBtn);
+        card.appendChild(actionsDiv);
+        return card;
+    }
+
+    async function fetchInsightsPage(workplaceId, offset) {
+        const response = await fetch(`/api/workplaces/${workplaceId}/insights?offset=${offset}`); // ETag: unchanged pages revalidate with a 304
+        if (!response.ok) {
+            const err = await response.json();
+            throw new Error(err.error || 'Failed to load insights');
+        }
+        return response.json();
+    }
+
+    async function appendInsightsPage(workplaceId, selectedWorkplaceName, offset, generation, fetchedPage = null) {
+        const page = fetchedPage || await fetchInsightsPage(workplaceId, offset);
+        if (generation !== loadGeneration) return; // Another workplace was selected meanwhile
+        const oldMoreBtn = chartsContainer.querySelector('.load-more-insights-btn');
+        if (oldMoreBtn) oldMoreBtn.remove();
+        page.insights.forEach(insight => chartsContainer.appendChild(buildInsightCard(workplaceId, selectedWorkplaceName, insight)));
+        if (page.next_offset !== null && page.next_offset !== undefined) {
+            const moreBtn = document.createElement('button');
+            moreBtn.classList.add('load-more-insights-btn');
+            moreBtn.textContent = `Load more (${page.total - page.next_offset} remaining)`;
+            moreBtn.onclick = () => {
+                moreBtn.disabled = true;
+                appendInsightsPage(workplaceId, selectedWorkplaceName, page.next_offset, generation).catch(error => {
+                    moreBtn.disabled = false; console.error('Error loading more insights:', error);
+                });
+            };
+            chartsContainer.appendChild(moreBtn);
+        }
+        return page;
+    }
+
     async function loadInsightsForWorkplace(workplaceId) {
         const selectedWorkplaceOption = Array.from(workplaceSelect.options).find(opt => opt.value === workplaceId);
         const selectedWorkplaceName = selectedWorkplaceOption ? selectedWorkplaceOption.text : "Selected Workplace";
+        const generation = ++loadGeneration;
+        if (bodyObserver) bodyObserver.disconnect();
+        renderedCharts.forEach(chart => chart.destroy()); renderedCharts = [];
         
         currentWorkplaceTitle.textContent = `Insights in: ${selectedWorkplaceName}`;
         chartsContainer.innerHTML = '<p>Loading insights...</p>';
         try {
-            const response = await fetch(`/api/workplaces/${workplaceId}/insights`);
-            if (!response.ok) {
-                const err = await response.json();
-                throw new Error(err.error || 'Failed to load insights');
-            }
-            const insights = await response.json();
-
-            if (!insights || insights.length === 0) {
+            const firstPage = await fetchInsightsPage(workplaceId, 0);
+            if (generation !== loadGeneration) return;
+            if (!firstPage.insights || firstPage.insights.length === 0) {
                 chartsContainer.innerHTML = '<p>No insights saved in this workplace yet. Go to the Chat Assistant to generate and save some!</p>';
                 return;
             }
             chartsContainer.innerHTML = ''; 
-
-            insights.forEach(insight => {
-                const card = document.createElement('div');
-                card.classList.add('insight-card');
-                
-                const queryTitle = document.createElement('h3');
-                queryTitle.classList.add('insight-query-title');
-                queryTitle.textContent = `Original Query: "${insight.query}"`;
-                card.appendChild(queryTitle);
-
-                // The 'summary' is the textual explanation/title from the chat
-                if (insight.summary) {
-                    const summaryP = document.createElement('p');
-                    summaryP.classList.add('insight-summary-text');
-                    summaryP.textContent = insight.summary; 
-                    card.appendChild(summaryP);
-                }
-
-                const timestamp = document.createElement('p');
-                timestamp.classList.add('insight-timestamp');
-                timestamp.textContent = `Saved: ${new Date(insight.timestamp).toLocaleString()}`;
-                card.appendChild(timestamp);
-
-                if (insight.type && insight.type !== 'table' && insight.type !== 'text' && insight.data && insight.data.datasets) {
-                    const chartWrapper = document.createElement('div');
-                    chartWrapper.classList.add('insight-chart-wrapper');
-                    const chartCanvas = document.createElement('canvas');
-                    chartWrapper.appendChild(chartCanvas);
-                    card.appendChild(chartWrapper);
-
-                    if (typeof Chart !== 'undefined') {
-                        try {
-                            // Use saved options, including title and legend settings
-                            new Chart(chartCanvas, { 
-                                type: insight.type, 
-                                data: insight.data, 
-                                options: insight.options || { responsive: true, maintainAspectRatio: false, plugins: { legend: { display: true }, title: {display: true, text: insight.summary || insight.query}}} 
-                            });
-                        } catch (e) { 
-                            console.error("Error rendering insight chart:", e, insight);
-                            const errorP = document.createElement('p'); errorP.textContent = "[Chart error]"; errorP.style.color='red';
-                            chartWrapper.appendChild(errorP);
-                        }
-                    } else { /* Chart.js missing */ }
-                } else if (insight.type === 'table' && insight.data && insight.data.headers && insight.data.rows) { 
-                    const tableContainer = document.createElement('div');
-                    tableContainer.classList.add('table-container');
-                    const table = document.createElement('table'); /* ... table rendering ... */ 
-                    const thead = document.createElement('thead'); const tbody = document.createElement('tbody'); const headerRow = document.createElement('tr');
-                    insight.data.headers.forEach(h => {const th=document.createElement('th'); th.textContent=h; headerRow.appendChild(th);});
-                    thead.appendChild(headerRow); table.appendChild(thead);
-                    insight.data.rows.forEach(rD => {const r=document.createElement('tr'); rD.forEach(cD => {const td=document.createElement('td'); td.textContent=cD; r.appendChild(td);}); tbody.appendChild(r);});
-                    table.appendChild(tbody); tableContainer.appendChild(table); card.appendChild(tableContainer);
-                }
-                
-                const actionsDiv = document.createElement('div');
-                actionsDiv.classList.add('actionsDiv'); // Class for styling
-                const deleteInsightBtn = document.createElement('button');
-                deleteInsightBtn.textContent = 'Remove Insight';
-                deleteInsightBtn.onclick = async () => {
-                    if (confirm(`Remove this insight (Query: "${insight.query}") from "${selectedWorkplaceName}"?`)) {
-                        try {
-                            const delResponse = await fetch(`/api/workplaces/${workplaceId}/insights/${insight.id}`, { method: 'DELETE' });
-                            const delResult = await delResponse.json();
-                            if (delResponse.ok) { loadInsightsForWorkplace(workplaceId); } 
-                            else { alert(`Error removing insight: ${delResult.error}`); }
-                        } catch (err) { alert(`Failed to remove insight: ${err}`); }
-                    }
-                };
-                actionsDiv.appendChild(deleteInsightBtn);
-                card.appendChild(actionsDiv);
-                chartsContainer.appendChild(card);
-            });
-
+            await appendInsightsPage(workplaceId, selectedWorkplaceName, 0, generation, firstPage);
         } catch (error) {
             chartsContainer.innerHTML = `<p>Could not load insights for ${selectedWorkplaceName}: ${error.message}</p>`;
             console.error('Error in loadInsightsForWorkplace:', error);
@@ -0,0 +1,170 @@
+# project_root/app/wire_format.py
+"""
+Opt-in compact response format for /chat, selected with `Accept: application/vnd.stg.columnar+json`.
+
+Instead of raw_table rows of strings plus chart arrays that repeat the same data, the response carries:
+    table:  {"headers": [...], "num_rows": N, "columns": [column, ...]} with typed columns:
+            {"type": "number" | "string", "values": [...]}, for repetitive strings
+            {"type": "string", "dict": [distinct values], "codes": [index or null, ...]}, or, for values whose
+            raw_table string JavaScript can't rebuild (7.0, Decimal 12.50, ids past 2**53, datetimes),
+            {"type": "number" | "datetime", "text": [str(value) or null, ...]}
+    labels: label arrays that don't match a table column (e.g. time-sorted chart labels)
+    chart:  the Chart.js config, with data.labels / dataset data replaced by {"$column": i} or {"$labels": i}
+            when the same values are already in the payload.
+It is serialized with orjson when installed (datetime and numpy natively, Decimal as float) and
+compressed with brotli or gzip according to Accept-Encoding. chat.js decodes it back to the usual shape, with
+table cells and chart labels equal to the plain JSON response's. The 'done' event of /chat/stream uses it too.
+numpy is imported only where it's needed, so importing this module (and app.routes) doesn't load it.
+"""
+import os
+import gzip
+import json
+from decimal import Decimal
+from datetime import datetime, date, time
+
+try:
+    import orjson
+except ImportError: # Optional: falls back to the standard json module
+    orjson = None
+try:
+    import brotli
+except ImportError: # Optional: gzip is used instead
+    brotli = None
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.stg.columnar+json"
+WIRE_FORMAT_VERSION = "columnar-v1"
+WIRE_COMPRESS_MIN_BYTES = int(os.environ.get("WIRE_COMPRESS_MIN_BYTES", 1024))
+WIRE_GZIP_LEVEL = int(os.environ.get("WIRE_GZIP_LEVEL", 5))
+WIRE_DICT_ENCODE_MAX_RATIO = 0.5 # Dictionary-encode string columns with at most this share of distinct values
+_JS_MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+
+def wants_columnar(accept_header):
+    return COLUMNAR_MEDIA_TYPE in (accept_header or "")
+
+def _default(value):
+    import numpy as np
+    if isinstance(value, Decimal): return float(value)
+    if isinstance(value, (datetime, date, time)): return value.isoformat()
+    if isinstance(value, np.generic): return value.item()
+    if isinstance(value, np.ndarray): return value.tolist()
+    if isinstance(value, (bytes, bytearray)): return value.hex()
+    return str(value)
+
+def dumps(payload):
+    """JSON bytes; Decimal, datetime and numpy values are handled without a pre-pass over the data."""
+    if orjson is not None: return orjson.dumps(payload, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
+
+def compress(body, accept_encoding):
+    """Returns (body, content_encoding or None) for the client's Accept-Encoding."""
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    if len(body) < WIRE_COMPRESS_MIN_BYTES: return body, None
+    if brotli is not None and "br" in accepted: return brotli.compress(body, quality=5), "br"
+    if "gzip" in accepted: return gzip.compress(body, compresslevel=WIRE_GZIP_LEVEL), "gzip"
+    return body, None
+
+
+# --- Columnar encoding ---
+def _text(values, strings=None):
+    """raw_table's cell strings (str(value)) of a column, None kept as null."""
+    strings = strings if strings is not None else [str(v) for v in values]
+    return [None if v is None else s for v, s in zip(values, strings)]
+
+def _number_column(values, strings=None):
+    if all(v is None or (type(v) is int and -_JS_MAX_SAFE_INTEGER <= v <= _JS_MAX_SAFE_INTEGER) for v in values): return {"type": "number", "values": list(values)}
+    # JavaScript's String() can't give back str() of 7.0, Decimal('12.50') or ids past 2**53: send raw_table's strings (chat.js parses the numbers)
+    return {"type": "number", "text": _text(values, strings)}
+
+def _encode_column(values, column_type, strings=None):
+    """One typed column of the table; `strings` are the column's raw_table cells when already computed."""
+    if column_type in ("numeric", "categorical_year"): return _number_column(values, strings)
+    sample = next((v for v in values if v is not None), None)
+    if isinstance(sample, (datetime, date, time)): return {"type": "datetime", "text": _text(values, strings)}
+    if isinstance(sample, (Decimal, int, float)) and all(v is None or isinstance(v, (Decimal, int, float)) for v in values):
+        return _number_column(values, strings) # e.g. DECIMAL/MONEY columns from pyodbc
+    strings = [v if v is None or isinstance(v, str) else str(v) for v in values]
+    distinct = dict.fromkeys(v for v in strings if v is not None)
+    if len(strings) >= 8 and len(distinct) <= WIRE_DICT_ENCODE_MAX_RATIO * len(strings):
+        codes = {v: i for i, v in enumerate(distinct)}
+        return {"type": "string", "dict": list(distinct), "codes": [None if v is None else codes[v] for v in strings]}
+    return {"type": "string", "values": strings}
+
+def _encode_table(raw_table):
+    """(table payload, ResultColumns or None). Tables without typed columns (e.g. saved insights) become string columns."""
+    if not raw_table: return None, None
+    result_columns = getattr(raw_table, "columns", None)
+    headers = list(raw_table.get("headers") or [])
+    if result_columns is not None:
+        types = result_columns.column_types()
+        columns = [_encode_column(result_columns.values(h), types.get(h), result_columns.strings(h)) for h in headers]
+        return {"headers": headers, "num_rows": result_columns.num_rows, "columns": columns}, result_columns
+    rows = raw_table.get("rows") or []
+    columns = [_encode_column(list(col), "categorical") for col in zip(*rows)] if rows else [{"type": "string", "values": []} for _ in headers]
+    return {"headers": headers, "num_rows": len(rows), "columns": columns}, None
+
+def _find_column(result_columns, values, as_strings):
+    """Index of the table column whose labels (str values) or numbers (no NULLs) equal `values`, or None."""
+    import numpy as np
+    if result_columns is None or len(values) != result_columns.num_rows: return None
+    types = result_columns.column_types()
+    for i, header in enumerate(result_columns.headers):
+        if as_strings:
+            if result_columns.strings(header) == values: return i
+        elif types.get(header) in ("numeric", "categorical_year"):
+            raw = np.array(result_columns.values(header), dtype=float)
+            if not np.isnan(raw).any() and raw.tolist() == values: return i
+    return None
+
+def encode_columnar(response):
+    """The compact payload for an assistant response dict (see the module docstring)."""
+    table, result_columns = _encode_table(response.get("raw_table"))
+    label_pool = []
+    chart = response.get("chart")
+    if chart and isinstance(chart.get("data"), dict):
+        data = dict(chart["data"])
+        labels = data.get("labels")
+        if isinstance(labels, list) and labels:
+            column_index = _find_column(result_columns, labels, as_strings=True)
+            if column_index is not None: data["labels"] = {"$column": column_index}
+            else: label_pool.append(labels); data["labels"] = {"$labels": len(label_pool) - 1}
+        datasets = []
+        for dataset in data.get("datasets") or []:
+            values = dataset.get("data")
+            column_index = _find_column(result_columns, values, as_strings=False) if isinstance(values, list) and values and not isinstance(values[0], dict) else None
+            datasets.append(dict(dataset, data={"$column": column_index}) if column_index is not None else dataset)
+        data["datasets"] = datasets
+        chart = dict(chart, data=data)
+    payload = {k: v for k, v in response.items() if k not in ("raw_table", "chart")}
+    payload.update({"format": WIRE_FORMAT_VERSION, "table": table, "labels": label_pool, "chart": chart})
+    return payload
+
+def encode_response(response, accept_encoding=None):
+    """(body bytes, headers) of the columnar response, compressed when the client accepts it."""
+    body, content_encoding = compress(dumps(encode_columnar(response)), accept_encoding)
+    headers = {"Content-Type": COLUMNAR_MEDIA_TYPE, "Vary": "Accept, Accept-Encoding"}
+    if content_encoding: headers["Content-Encoding"] = content_encoding
+    return body, headers
+
+
+if __name__ == "__main__":
+    import sys
+    sys.path.insert(0, os.path.dirname(__file__))
+    from columnar import ResultColumns, TableData
+    records = [{"Carrier": f"Carrier {i % 20}", "Shipped": datetime(2024, 1, 1 + i % 28), "Cost": Decimal("12.50") if i % 2 else 7.0, "Count": i} for i in range(20000)]
+    cols = ResultColumns.from_records(records)
+    raw_table = TableData(cols.headers, cols.table_rows(), columns=cols)
+    response = {"answer": "ok", "id": "x", "raw_table": raw_table,
+                "chart": {"type": "bar", "data": {"labels": cols.strings("Carrier"), "datasets": [{"label": "Count", "data": cols.floats("Count").tolist()}]}}}
+    legacy_size = len(json.dumps(response, default=str).encode("utf-8"))
+    body, headers = encode_response(response, "gzip, deflate")
+    payload = json.loads(gzip.decompress(body)) if headers.get("Content-Encoding") == "gzip" else json.loads(body)
+    assert payload["chart"]["data"]["labels"] == {"$column": 0} and payload["chart"]["data"]["datasets"][0]["data"] == {"$column": 3}
+    assert payload["table"]["columns"][2] == {"type": "number", "text": ["12.50" if i % 2 else "7.0" for i in range(20000)]}, "cells as raw_table has them"
+    assert payload["table"]["columns"][3] == {"type": "number", "values": list(range(20000))}
+    assert payload["table"]["columns"][1]["text"][0] == raw_table["rows"][0][1] == "2024-01-01 00:00:00"
+    big_ids = ResultColumns.from_records([{"Id": 2 ** 60 + i} for i in range(3)])
+    assert _encode_table(TableData(big_ids.headers, big_ids.table_rows(), columns=big_ids))[0]["columns"][0] == {"type": "number", "text": [str(2 ** 60 + i) for i in range(3)]}
+    assert payload["table"]["columns"][0]["dict"][payload["table"]["columns"][0]["codes"][5]] == "Carrier 5"
+    print(f"Legacy JSON: {legacy_size / 1024:.0f} KiB; columnar: {len(dumps(encode_columnar(response))) / 1024:.0f} KiB, compressed ({headers.get('Content-Encoding')}): {len(body) / 1024:.0f} KiB")
+    print("Wire format self-check passed.")
@@ -0,0 +1,281 @@
+# benchmarks/bench_analyzer.py
+"""
+analyzer_visualizer_node CPU time: the original row-by-row implementation vs. the columnar one.
+
+    python benchmarks/bench_analyzer.py [--sizes 1000,100000,1000000]
+
+Synthetic results of each size are run through both nodes for three shapes (year trend, category
+totals, two-number scatter); the outputs are compared for equality before timing is reported.
+"""
+import os
+import re
+import sys
+import time
+import copy
+import argparse
+from datetime import datetime, date
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
+os.environ.setdefault("ASSISTANT_WARMUP", "false")
+os.environ["CHART_DOWNSAMPLE_ENABLED"] = "false" # Full-resolution charts, so both outputs can be compared (see bench_chart_payload.py)
+from app.assistant_engine import analyzer_visualizer_node
+
+
+# --- Original implementation (row-by-row), kept here as the baseline ---
+def is_numeric(value):
+    if value is None: return False
+    return isinstance(value, (int, float))
+
+def is_date_like(column_name_or_value):
+    if isinstance(column_name_or_value, str):
+        name = column_name_or_value.lower()
+        if any(term in name for term in ["date", "year", "month", "time", "dt", "period"]): return True
+        if re.match(r"^\d{4}(-\d{2}(-\d{2}(T\d{2}:\d{2}(:\d{2}(\.\d+)?Z?)?)?)?)?$", column_name_or_value): return True
+    elif isinstance(column_name_or_value, (datetime, date)):
+        return True
+    return False
+
+def get_column_types(query_result, headers):
+    col_types = {}
+    if not query_result: return col_types
+    sample_row = query_result[0] 
+    for header in headers:
+        value = sample_row.get(header)
+        is_strictly_numeric_col = True
+        for row in query_result:
+            val_in_col = row.get(header)
+            if val_in_col is not None and not is_numeric(val_in_col):
+                is_strictly_numeric_col = False; break
+        is_date_col_by_name = is_date_like(header)
+        # Check if first value looks like a date, and if so, check a few more for consistency
+        is_date_col_by_value = False
+        if not is_date_col_by_name and isinstance(value, str) and is_date_like(value):
+            # Check a sample of rows to confirm date-like nature if name doesn't indicate it
+            date_like_count = 0
+            for i, row_check in enumerate(query_result):
+                if i >= 5: break # Check up to 5 rows
+                if is_date_like(str(row_check.get(header,""))): date_like_count +=1
+            if date_like_count >= min(3, len(query_result)): # If at least 3 or all (if less than 3) are date-like
+                 is_date_col_by_value = True
+        
+        is_year_col_by_name = "year" in header.lower() and is_strictly_numeric_col and \
+                              all(1900 < int(row.get(header) or 0) < 2100 for row in query_result if row.get(header) is not None and isinstance(row.get(header), (int, float)))
+
+
+        if is_year_col_by_name: col_types[header] = "categorical_year" # Treat year as categorical for grouping
+        elif is_strictly_numeric_col: col_types[header] = "numeric"
+        elif is_date_col_by_name or is_date_col_by_value : col_types[header] = "date_like"
+        else: col_types[header] = "categorical"
+    return col_types
+
+def legacy_analyzer_visualizer_node(state):
+    print("--- Running Analyzer/Visualizer Node ---")
+    query_result = state.get("sql_query_result")
+    original_query = state.get("original_query","").lower()
+    requested_chart_type = state.get("requested_chart_type") 
+    
+    analysis_summary = state.get("analysis_summary") 
+    chart_config = None
+    table_config = None
+    
+    default_chart_title = f"Data for: '{state.get('original_query')}'" 
+
+    if state.get("error_message") and not query_result:
+        analysis_summary = None 
+    elif not query_result: 
+        if not analysis_summary: analysis_summary = "No data found for your query."
+    else: 
+        if isinstance(query_result, list) and len(query_result) > 0:
+            headers = list(query_result[0].keys())
+            num_rows = len(query_result)
+            
+            rows_for_table = [[str(row.get(h, '')) for h in headers] for row in query_result]
+            table_config = {"headers": headers, "rows": rows_for_table}
+
+            col_types_map = get_column_types(query_result, headers)
+            numeric_cols = [h for h, t in col_types_map.items() if t == "numeric"]
+            categorical_cols = [h for h, t in col_types_map.items() if t == "categorical" or t == "categorical_year"] # Treat year as cat
+            date_like_cols = [h for h, t in col_types_map.items() if t == "date_like"] # True date/datetime
+            
+            final_chart_type_to_render = requested_chart_type 
+            
+            chart_options = {
+                "responsive": True, "maintainAspectRatio": False,
+                "plugins": { 
+                    "legend": {"display": True, "position": "top"}, 
+                    "title": {"display": True, "text": default_chart_title} 
+                }
+            }
+            
+            # 1. Single Value / KPI Display
+            if num_rows == 1 and len(headers) == 1 and numeric_cols:
+                kpi_value = query_result[0][numeric_cols[0]]
+                kpi_title_header = headers[0].replace("_", " ").title()
+                analysis_summary = f"The {kpi_title_header} is: {kpi_value if kpi_value is not None else 'N/A'}."
+                final_chart_type_to_render = None 
+            
+            # 2. Time Series (Line/Area chart)
+            #    Data: One 'date_like' or 'categorical_year' (+ 'Month' if present) column, one or more numeric columns.
+            elif ( (len(date_like_cols) == 1 and len(numeric_cols) >= 1) or \
+                   ('Year' in headers and 'Month' in headers and len(numeric_cols) >= 1) or \
+                   (len(categorical_cols) == 1 and "year" in categorical_cols[0].lower() and len(numeric_cols) >=1 ) ):
+                
+                labels = []
+                date_col_display_name = "Time"
+                sorted_query_result = query_result # Default
+
+                if 'Year' in headers and 'Month' in headers:
+                    temp_data_for_sort = [{'year': int(row.get('Year',0)), 'month': int(row.get('Month',0)), 'data': row} for row in query_result]
+                    sorted_query_result_by_time = sorted(temp_data_for_sort, key=lambda x: (x['year'], x['month']))
+                    sorted_query_result = [item['data'] for item in sorted_query_result_by_time]
+                    labels = [f"{row.get('Year', '')}-{str(row.get('Month', '')).zfill(2)}" for row in sorted_query_result]
+                    date_col_display_name = "Year-Month"
+                elif date_like_cols: # Single actual date column
+                    date_col_for_labels = date_like_cols[0]
+                    try: sorted_query_result = sorted(query_result, key=lambda x: str(x.get(date_col_for_labels, "")))
+                    except TypeError: pass # Already sorted or unsorTable
+                    labels = [str(row.get(date_col_for_labels)) for row in sorted_query_result]
+                    date_col_display_name = date_col_for_labels.replace('_',' ').title()
+                elif categorical_cols and "year" in categorical_cols[0].lower(): # Year as category
+                    date_col_for_labels = categorical_cols[0]
+                    try: sorted_query_result = sorted(query_result, key=lambda x: str(x.get(date_col_for_labels, "")))
+                    except TypeError: pass
+                    labels = [str(row.get(date_col_for_labels)) for row in sorted_query_result]
+                    date_col_display_name = date_col_for_labels.replace('_',' ').title()
+
+
+                datasets = []
+                line_chart_colors = ['rgb(75, 192, 192)', 'rgb(255, 99, 132)', 'rgb(54, 162, 235)', 'rgb(255, 206, 86)']
+                
+                for i, num_col in enumerate(numeric_cols[:len(line_chart_colors)]): # Consider all numeric cols found
+                    try:
+                        data_values = [float(row.get(num_col) or 0) for row in sorted_query_result]
+                        datasets.append({ "label": num_col.replace("_", " ").title(), "data": data_values, "fill": False, "borderColor": line_chart_colors[i % len(line_chart_colors)], "tension": 0.1 })
+                    except (ValueError, TypeError) as e: print(f"Warning: Skipping numeric column {num_col} for line chart: {e}"); continue
+                
+                if datasets:
+                    if not final_chart_type_to_render or final_chart_type_to_render not in ["line", "area"]:
+                        final_chart_type_to_render = "line"
+                    
+                    is_area_requested = "area" in original_query
+                    if (final_chart_type_to_render == "area" or is_area_requested) and len(datasets)==1: datasets[0]["fill"] = True; final_chart_type_to_render = "line"
+                    elif (final_chart_type_to_render == "area" or is_area_requested) and len(datasets)>1: final_chart_type_to_render = "line"
+
+                    chart_options["plugins"]["title"]["text"] = f"{datasets[0]['label']}{' & others' if len(datasets)>1 else ''} Trend over {date_col_display_name}"
+                    if len(datasets) == 1: chart_options["plugins"]["legend"]["display"] = False
+                    
+                    chart_config = {"type": "line", "data": {"labels": labels, "datasets": datasets}, "options": chart_options}
+                    analysis_summary = chart_options["plugins"]["title"]["text"] 
+
+            # 3. Categorical vs Numerical (Pie/Doughnut/Bar)
+            elif len(categorical_cols) == 1 and len(numeric_cols) == 1 and not chart_config:
+                cat_col = categorical_cols[0]; num_col = numeric_cols[0]
+                labels = [str(row.get(cat_col)) for row in query_result]
+                try:
+                    data_values = [float(row.get(num_col) or 0) for row in query_result]
+                    chart_options["plugins"]["title"]["text"] = f"{num_col.replace('_',' ').title()} by {cat_col.replace('_',' ').title()}"
+                    
+                    if final_chart_type_to_render in ["pie", "doughnut"] or \
+                       (not final_chart_type_to_render and num_rows <= 7 and num_rows > 1): # Heuristic for pie
+                        final_chart_type_to_render = final_chart_type_to_render if final_chart_type_to_render in ["pie", "doughnut"] else "pie"
+                        chart_config = {"type": final_chart_type_to_render, "data": {"labels": labels, "datasets": [{"label": num_col.replace("_", " ").title(), "data": data_values, "backgroundColor": ['rgba(255,99,132,0.7)','rgba(54,162,235,0.7)','rgba(255,206,86,0.7)','rgba(75,192,192,0.7)','rgba(153,102,255,0.7)','rgba(255,159,64,0.7)']}]}, "options": chart_options}
+                    elif num_rows > 0: 
+                        final_chart_type_to_render = "bar" 
+                        chart_options["plugins"]["legend"]["display"] = False
+                        if "horizontal bar" in original_query and requested_chart_type == "bar" : chart_options["indexAxis"] = 'y'
+                        chart_config = {"type": "bar", "data": {"labels": labels, "datasets": [{"label": num_col.replace("_", " ").title(), "data": data_values, "backgroundColor": 'rgba(75, 192, 192, 0.7)' if chart_options.get("indexAxis") != 'y' else 'rgba(54, 162, 235, 0.7)'}]}, "options": chart_options}
+                    
+                    if chart_config: analysis_summary = chart_options["plugins"]["title"]["text"] 
+                except (ValueError, TypeError) as e: print(f"Warning: Could not process cat/num chart: {e}")
+            
+            # 4. Two Categorical + One Numeric (e.g., Source, Dest, Count)
+            elif len(categorical_cols) >= 2 and len(numeric_cols) == 1 and not chart_config:
+                cat_col1 = categorical_cols[0]; cat_col2 = categorical_cols[1]; num_col = numeric_cols[0]
+                chart_title_text = f"{num_col.replace('_',' ').title()} by {cat_col1.replace('_',' ').title()} & {cat_col2.replace('_',' ').title()}"
+                chart_options["plugins"]["title"]["text"] = chart_title_text
+                analysis_summary = chart_title_text 
+
+                if requested_chart_type == "pie" and num_rows <= 10 and num_rows > 1:
+                    combined_labels_map = {}
+                    for row in query_result:
+                        label = f"{str(row.get(cat_col1, 'N/A'))[:15]} - {str(row.get(cat_col2, 'N/A'))[:15]}"
+                        combined_labels_map[label] = combined_labels_map.get(label, 0) + float(row.get(num_col) or 0)
+                    labels = list(combined_labels_map.keys()); data_values = list(combined_labels_map.values())
+                    if len(labels) <=10 : 
+                        chart_config = {"type": "pie", "data": {"labels": labels, "datasets": [{"data": data_values, "backgroundColor": ['rgba(255,99,132,0.7)','rgba(54,162,235,0.7)','rgba(255,206,86,0.7)','rgba(75,192,192,0.7)','rgba(153,102,255,0.7)']}]}, "options": chart_options}
+                        analysis_summary = f"Pie chart: {chart_options['plugins']['title']['text']}"
+                    else:
+                        analysis_summary = f"Data for '{chart_options['plugins']['title']['text']}' retrieved. A pie chart is not suitable for {len(labels)} categories. Showing table."
+                        chart_config = None
+                elif (requested_chart_type == "bar" or not requested_chart_type) and num_rows > 0 and num_rows <= 20 :
+                    labels = [f"{str(row.get(cat_col1, 'N/A'))[:15]} - {str(row.get(cat_col2, 'N/A'))[:15]}" for row in query_result]
+                    try:
+                        data_values = [float(row.get(num_col) or 0) for row in query_result]
+                        chart_options["plugins"]["legend"]["display"] = False
+                        chart_config = {"type":"bar", "data":{"labels":labels, "datasets":[{"label":num_col.replace('_',' ').title(), "data":data_values, "backgroundColor": 'rgba(54, 162, 235, 0.7)'}]}, "options":chart_options}
+                        analysis_summary = f"Bar chart: {chart_options['plugins']['title']['text']}"
+                    except (ValueError, TypeError) as e:
+                        analysis_summary = f"Data for '{chart_options['plugins']['title']['text']}' retrieved, bar chart error: {e}"; chart_config = None
+                else: 
+                    analysis_summary = f"Displaying top results for {chart_options['plugins']['title']['text'].lower()}."
+                    chart_config = None 
+
+            # 5. Two Numerics (Scatter)
+            elif len(numeric_cols) >= 2 and not chart_config:
+                num_col_x = numeric_cols[0]; num_col_y = numeric_cols[1]
+                try:
+                    scatter_data = [{"x": float(row.get(num_col_x) or 0), "y": float(row.get(num_col_y) or 0)} for row in query_result]
+                    if scatter_data:
+                        final_chart_type_to_render = requested_chart_type if requested_chart_type == "scatter" else "scatter"
+                        chart_options["plugins"]["title"]["text"] = f"Relationship: {num_col_x.replace('_',' ').title()} vs {num_col_y.replace('_',' ').title()}"
+                        chart_options["plugins"]["legend"]["display"] = False
+                        chart_options["scales"] = {"x": {"title": {"display": True, "text": num_col_x.replace('_',' ').title()}}, "y": {"title": {"display": True, "text": num_col_y.replace('_',' ').title()}}}
+                        chart_config = {"type": final_chart_type_to_render, "data": {"datasets": [{"label": chart_options["plugins"]["title"]["text"], "data": scatter_data, "backgroundColor": 'rgba(255, 99, 132, 0.7)'}]}, "options": chart_options}
+                        analysis_summary = chart_options["plugins"]["title"]["text"] 
+                except (ValueError, TypeError) as e: print(f"Warning: Could not process data for scatter plot: {e}")
+            
+            # Fallback summary if no chart created and summary is still generic
+            if not chart_config and (analysis_summary is None or "records for" in analysis_summary.lower() or "found" in analysis_summary.lower()):
+                analysis_summary = f"Here's the data for your query regarding '{state.get('original_query')}':"
+
+    state["analysis_summary"] = analysis_summary
+    state["chart_json"] = chart_config 
+    state["table_data"] = table_config
+    print(f"Final Analysis Summary for UI: {state['analysis_summary']}")
+    if chart_config: print(f"Chart JSON generated (type: {chart_config.get('type')}). Title: {chart_config.get('options',{}).get('plugins',{}).get('title',{}).get('text')}")
+    if table_config: print("Table data generated.")
+    return state
+
+
+def synthetic_results(shape, num_rows):
+    if shape == "year_trend":
+        return [{"ShipmentYear": 2000 + i % 25, "ShipmentCount": i % 97, "TotalCost": (i % 1000) * 1.25} for i in range(num_rows)]
+    if shape == "category_totals":
+        return [{"CarrierName": f"Carrier {i % 40}", "TotalActualCost": float(i % 5000) if i % 11 else None} for i in range(num_rows)]
+    return [{"TOTAL_WEIGHT": float(i % 700), "TOTAL_ACTUAL_COST": (i * 7) % 9000} for i in range(num_rows)]
+
+def run_node(node_fn, shape, records):
+    state = {"original_query": f"benchmark {shape}", "requested_chart_type": None, "sql_query_result": records, "analysis_summary": None, "error_message": None}
+    started = time.perf_counter(); node_fn(state)
+    return state, time.perf_counter() - started
+
+def quiet(fn, *args):
+    stdout = sys.stdout; sys.stdout = open(os.devnull, "w")
+    try: return fn(*args)
+    finally: sys.stdout.close(); sys.stdout = stdout
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000,1000000", help="Comma-separated result sizes (rows)")
+    args = parser.parse_args()
+    print(f"{'shape':<18}{'rows':>10}{'legacy':>11}{'columnar':>11}{'speedup':>9}")
+    for num_rows in [int(n) for n in args.sizes.split(",")]:
+        for shape in ("year_trend", "category_totals", "scatter"):
+            records = synthetic_results(shape, num_rows)
+            legacy_state, legacy_seconds = quiet(run_node, legacy_analyzer_visualizer_node, shape, records)
+            new_state, new_seconds = quiet(run_node, analyzer_visualizer_node, shape, records)
+            for key in ("analysis_summary", "chart_json", "table_data"):
+                assert legacy_state[key] == new_state[key], f"{shape}/{num_rows}: '{key}' differs between implementations"
+            print(f"{shape:<18}{num_rows:>10}{legacy_seconds:>10.3f}s{new_seconds:>10.3f}s{legacy_seconds / max(new_seconds, 1e-9):>8.1f}x")
@@ -0,0 +1,62 @@
+# benchmarks/bench_chart_payload.py
+"""
+Chart payload size and draw cost with and without server-side downsampling (app/chart_downsample.py).
+
+    python benchmarks/bench_chart_payload.py [--sizes 1000,20000,200000]
+
+Synthetic daily series, many-category totals and two-number scatter results are run through
+analyzer_visualizer_node. For each, the report shows the points Chart.js would have to draw,
+the JSON size of the chart config alone, and the time spent in the node plus json.dumps of the chart.
+Browser render time scales with the number of points drawn, which is why that column is reported as
+its proxy; for a real measurement, paste a chart config into /charts with the dev-tools profiler open.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from datetime import date, timedelta
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
+os.environ.setdefault("ASSISTANT_WARMUP", "false")
+from app import chart_downsample
+from app.assistant_engine import analyzer_visualizer_node
+
+
+def synthetic_results(shape, num_rows):
+    if shape == "daily_series":
+        start = date(2000, 1, 1)
+        return [{"ShipDate": (start + timedelta(days=i)).isoformat(), "ShipmentCount": (i * 37) % 101 + (i // 365), "TotalCost": ((i * 13) % 997) * 1.5} for i in range(num_rows)]
+    if shape == "category_totals":
+        return [{"CarrierName": f"Carrier {i}", "TotalActualCost": float((i * 7919) % 10007)} for i in range(num_rows)]
+    return [{"TOTAL_WEIGHT": float(i % 700), "TOTAL_ACTUAL_COST": (i * 7) % 9000} for i in range(num_rows)]
+
+def chart_points(chart):
+    if not chart: return 0
+    return sum(len(d.get("data") or []) for d in chart["data"]["datasets"])
+
+def measure(shape, records, enabled):
+    chart_downsample.CHART_DOWNSAMPLE_ENABLED = enabled # Read at call time by the helpers
+    state = {"original_query": f"benchmark {shape}", "requested_chart_type": "bar" if shape == "category_totals" else None, "sql_query_result": records, "analysis_summary": None, "error_message": None}
+    stdout = sys.stdout; sys.stdout = open(os.devnull, "w")
+    try:
+        started = time.perf_counter(); analyzer_visualizer_node(state)
+        body = json.dumps(state["chart_json"]).encode("utf-8")
+        seconds = time.perf_counter() - started
+    finally: sys.stdout.close(); sys.stdout = stdout
+    return chart_points(state["chart_json"]), len(body), seconds
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,20000,200000", help="Comma-separated result sizes (rows)")
+    args = parser.parse_args()
+    print(f"method={chart_downsample.CHART_DOWNSAMPLE_METHOD} max_points={chart_downsample.CHART_MAX_POINTS} max_categories={chart_downsample.CHART_MAX_CATEGORIES}\n")
+    print(f"{'shape':<18}{'rows':>9}{'points':>18}{'chart JSON':>24}{'node + dumps':>22}")
+    for num_rows in [int(n) for n in args.sizes.split(",")]:
+        for shape in ("daily_series", "category_totals", "scatter"):
+            records = synthetic_results(shape, num_rows)
+            full_points, full_bytes, full_seconds = measure(shape, records, False)
+            points, size, seconds = measure(shape, records, True)
+            print(f"{shape:<18}{num_rows:>9}{full_points:>9} ->{points:>6}{full_bytes / 1024:>11.0f} -> {size / 1024:>6.0f} KiB{full_seconds:>10.3f} -> {seconds:.3f}s")
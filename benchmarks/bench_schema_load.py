@@ -0,0 +1,83 @@
+# benchmarks/bench_schema_load.py
+"""
+Cold schema load time: legacy row-by-row CSV parsing vs. vectorized compile vs. loading the compiled artifact.
+
+    python benchmarks/bench_schema_load.py [--columns 50000]
+
+Runs against database_schema.csv and a synthetic schema with --columns columns (default 50k).
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
+from app.schema_compiler import compile_schema_csv, write_artifact, read_artifact
+from app.schema_index import create_schema_documents_from_structure
+
+
+def legacy_load_schema_from_csv(csv_path):
+    """The pre-artifact loader (df.iterrows + per-row dict building), kept here as the baseline."""
+    df = pd.read_csv(csv_path)
+    df['referenceTableName'] = df['referenceTableName'].replace(['NULL', 'Null', 'null', float('nan')], None)
+    df['refColumnName'] = df['refColumnName'].replace(['NULL', 'Null', 'null', float('nan')], None)
+    tables_data = {}
+    for _, row in df.iterrows():
+        table_name = row['mainTableName']
+        if table_name not in tables_data:
+            tables_data[table_name] = {"name": table_name, "description": row.get('TABLE_DESCRIPTION', f"Table containing {table_name.lower()} data."), "columns": []}
+        column_info = {"name": row['COLUMN_NAME'], "type": row['DATA_TYPE'], "description": row.get('COLUMN_DESCRIPTION', f"Column named {row['COLUMN_NAME']}."), "primary_key": False, "foreign_key": None}
+        if pd.notna(row['referenceTableName']) and pd.notna(row['refColumnName']):
+            column_info["foreign_key"] = {"references_table": row['referenceTableName'], "references_column": row['refColumnName']}
+        if row['COLUMN_NAME'].upper().endswith('ID') or row['COLUMN_NAME'].upper().endswith('SEQ_NO'):
+            if not column_info["foreign_key"] or column_info["foreign_key"]["references_table"] != table_name:
+                column_info["primary_key"] = True
+        tables_data[table_name]["columns"].append(column_info)
+    return {"tables": list(tables_data.values())}
+
+def write_synthetic_schema(path, num_columns, columns_per_table=40, seed=7):
+    rng = np.random.default_rng(seed)
+    table_idx = np.arange(num_columns) // columns_per_table
+    tables = np.array([f"OTM.SYNTH_TABLE_{i:05d}" for i in range(table_idx.max() + 1)], dtype=object)
+    col_names = [f"COL_{i % columns_per_table:03d}_{'GID' if i % 9 == 0 else 'VALUE'}" for i in range(num_columns)]
+    has_fk = rng.random(num_columns) < 0.1
+    fk_tables = np.where(has_fk, tables[rng.integers(0, len(tables), num_columns)], None)
+    pd.DataFrame({
+        "mainTableName": tables[table_idx], "COLUMN_NAME": col_names,
+        "referenceTableName": fk_tables, "refColumnName": np.where(has_fk, "COL_000_GID", None),
+        "DATA_TYPE": rng.choice(["nvarchar", "bigint", "datetime", "float"], num_columns),
+        "TABLE_DESCRIPTION": [f"Synthetic table {t} used for load benchmarks." for t in tables[table_idx]],
+        "COLUMN_DESCRIPTION": [f"Synthetic column {c}." for c in col_names],
+    }).to_csv(path, index=False)
+
+def timed(fn, *args):
+    started = time.perf_counter(); result = fn(*args)
+    return result, time.perf_counter() - started
+
+def bench(label, csv_path, artifact_path):
+    _, legacy_parse = timed(legacy_load_schema_from_csv, csv_path)
+    legacy_structure, _ = timed(legacy_load_schema_from_csv, csv_path)
+    _, legacy_docs = timed(create_schema_documents_from_structure, legacy_structure)
+    compiled, compile_seconds = timed(compile_schema_csv, csv_path)
+    write_artifact(compiled, artifact_path)
+    loaded, load_seconds = timed(read_artifact, artifact_path)
+    print(f"\n{label}: {compiled.num_tables} tables, {compiled.num_columns} columns, artifact {os.path.getsize(artifact_path) / 1024:.0f} KiB")
+    print(f"  legacy iterrows parse + documents : {legacy_parse + legacy_docs:8.3f}s")
+    print(f"  vectorized compile (incl. docs)   : {compile_seconds:8.3f}s")
+    print(f"  compiled artifact cold load       : {load_seconds:8.3f}s  ({(legacy_parse + legacy_docs) / max(load_seconds, 1e-9):.0f}x faster than legacy)")
+    assert loaded.col_documents == compiled.col_documents
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--columns", type=int, default=50000, help="Columns in the synthetic schema")
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench("database_schema.csv", os.path.join(PROJECT_ROOT, "database_schema.csv"), os.path.join(tmp_dir, "database_schema.csv.compiled"))
+        synthetic_csv = os.path.join(tmp_dir, "synthetic_schema.csv")
+        write_synthetic_schema(synthetic_csv, args.columns)
+        bench(f"synthetic ({args.columns} columns)", synthetic_csv, synthetic_csv + ".compiled")
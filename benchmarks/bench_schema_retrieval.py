@@ -0,0 +1,80 @@
+# benchmarks/bench_schema_retrieval.py
+"""
+Schema retrieval latency and recall on sampleQueries.txt: lexical index vs. Chroma vector search vs. hybrid.
+
+    python benchmarks/bench_schema_retrieval.py [--csv schema2.csv] [--n-results 12] [--repeat 5]
+
+Each quoted question in sampleQueries.txt is a query. Its expected schema names are the table/column
+identifiers mentioned anywhere on the line (including the "(Assumes a TOTAL_WEIGHT column)" notes) that
+exist in the schema; recall is the share of those names that appear in the retrieved documents.
+The vector and hybrid rows need an indexed Chroma collection (python app/schema_index.py).
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import statistics
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PROJECT_ROOT not in sys.path: sys.path.insert(0, PROJECT_ROOT)
+from app.schema_compiler import load_compiled_schema
+from app.lexical_index import get_lexical_index, extract_identifiers
+from app import schema_index
+
+
+def load_sample_queries(path, known_names):
+    """[(question, expected identifiers)] for every line of the file that starts with a quoted question."""
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            match = re.match(r'\s*"([^"]+)"', line)
+            if not match: continue
+            expected = {ident for ident in extract_identifiers(line) if ident in known_names}
+            samples.append((match.group(1), expected))
+    return samples
+
+def recall(documents, expected):
+    if not expected: return None
+    text = " ".join(documents).lower()
+    return sum(1 for ident in expected if re.search(rf"\b{re.escape(ident)}\b", text)) / len(expected)
+
+def run(label, retrieve_fn, samples, repeat):
+    latencies, recalls = [], []
+    for question, expected in samples:
+        for _ in range(repeat):
+            started = time.perf_counter(); documents = retrieve_fn(question)
+            latencies.append(time.perf_counter() - started)
+        score = recall(documents, expected)
+        if score is not None: recalls.append(score)
+    latencies.sort()
+    p95 = latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))]
+    mean_recall = f"{statistics.mean(recalls):.2f}" if recalls else "n/a"
+    print(f"  {label:<24} median {statistics.median(latencies) * 1000:8.2f} ms   p95 {p95 * 1000:8.2f} ms   recall {mean_recall}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--csv", default=os.path.join(PROJECT_ROOT, "schema2.csv"), help="Schema CSV (default: schema2.csv)")
+    parser.add_argument("--queries", default=os.path.join(PROJECT_ROOT, "sampleQueries.txt"))
+    parser.add_argument("--n-results", type=int, default=12)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per question")
+    args = parser.parse_args()
+
+    compiled = load_compiled_schema(args.csv)
+    known_names = {name.lower() for name in compiled.col_names} | {name.lower() for name in compiled.table_names}
+    samples = load_sample_queries(args.queries, known_names)
+    index = get_lexical_index(compiled)
+    confident = sum(1 for question, _ in samples if index.search(question, args.n_results)[1])
+    print(f"{len(samples)} questions, {sum(1 for _, e in samples if e)} with expected schema names; {len(index)} documents in the index")
+    print(f"Lexical fast path (no embedding call) taken for {confident}/{len(samples)} questions\n")
+
+    run("lexical index", lambda q: index.search(q, args.n_results)[0], samples, args.repeat)
+    if schema_index.query_schema(["shipment"], n_results=1) is None:
+        print("  vector / hybrid          skipped: Chroma collection not indexed (run python app/schema_index.py)")
+    else:
+        def vector(q):
+            results = schema_index.query_schema([q], n_results=args.n_results)
+            return results["documents"][0] if results and results.get("documents") else []
+        run("vector (Chroma)", vector, samples, args.repeat)
+        run("hybrid", lambda q: schema_index.retrieve_schema_parts(q, n_results=args.n_results, csv_path=args.csv), samples, args.repeat)